@@ -13,6 +13,7 @@ from factories.vgkr_v2.config_v2 import meta_form_file
 import mmcv
 import argparse
 import torch
+from mmdet.core import integral_image, box_mean
 from mmdet.models import build_saliency_detector
 from mmcv.runner import load_checkpoint
 from torchvision import transforms
@@ -141,6 +142,15 @@ def relation_saliency(model, thresh=0.5, saltype=1, npart=50, sample_num=50000):
             h, w = salmap.shape[:2]
 
         area = h * w
+        # summed-area table of the map, once per image: the saliency of a box is then O(1)
+        if saltype == 1:
+            # type 1: fraction of the salient points inside the boxes
+            sal_table = integral_image(salmap > thresh)
+        elif saltype == 2:
+            # type 2: mean saliency inside the boxes
+            sal_table = integral_image(salmap)
+        else:
+            raise NotImplementedError
         # now begin to compute the overlap between triplets and saliency
         for item in key_rel_idxes:
             rel_id, ref_num = item
@@ -169,23 +179,8 @@ def relation_saliency(model, thresh=0.5, saltype=1, npart=50, sample_num=50000):
             obj_box[1] = np.maximum(0, obj_box[1])
             obj_box[2] = np.minimum(w - 1, obj_box[2])
             obj_box[3] = np.minimum(h - 1, obj_box[3])
-            # compute the saliency points num inside boxes
-            sub_sal = salmap[sub_box[1]:(sub_box[3] + 1), sub_box[0]:(sub_box[2] + 1)]
-            obj_sal = salmap[obj_box[1]:(obj_box[3] + 1), obj_box[0]:(obj_box[2] + 1)]
-
-            # subsal_degree = np.sum(sub_sal) / ((sub_box[3] - sub_box[1] + 1) * (sub_box[2] - sub_box[0] + 1))
-            # objsal_degree = np.sum(obj_sal) / ((obj_box[3] - obj_box[1] + 1) * (obj_box[2] - obj_box[0] + 1))
-            if saltype == 1:
-                subsal = len(np.where(sub_sal > thresh)[0]) / (
-                        (sub_box[3] - sub_box[1] + 1) * (sub_box[2] - sub_box[0] + 1))
-                objsal = len(np.where(obj_sal > thresh)[0]) / (
-                        (obj_box[3] - obj_box[1] + 1) * (obj_box[2] - obj_box[0] + 1))
-            elif saltype == 2:
-                # type 2:
-                subsal = np.mean(sub_sal)
-                objsal = np.mean(obj_sal)
-            else:
-                raise NotImplementedError
+            # compute the saliency inside boxes
+            subsal, objsal = box_mean(sal_table, np.stack((sub_box, obj_box)))
 
             vis_saliency = subsal + objsal
             saliency = sub_area / area + obj_area / area
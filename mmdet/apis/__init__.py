@@ -1,5 +1,6 @@
 from .inference import (async_inference_detector, inference_detector,
                         init_detector, show_result, show_result_pyplot)
+from .inference_service import InferenceService
 from .test import multi_gpu_test, single_gpu_test
 from .test_caption import caption_single_gpu_test, caption_multi_gpu_test
 from .train import get_root_logger, set_random_seed, train_detector, train_captioner
@@ -8,5 +9,6 @@ __all__ = [
     'get_root_logger', 'set_random_seed', 'train_detector', 'init_detector',
     'async_inference_detector', 'inference_detector', 'show_result',
     'show_result_pyplot', 'multi_gpu_test', 'single_gpu_test',
-    'caption_single_gpu_test', 'caption_multi_gpu_test', 'train_captioner'
+    'caption_single_gpu_test', 'caption_multi_gpu_test', 'train_captioner',
+    'InferenceService'
 ]
@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from mmcv.parallel import collate, scatter
+
+from mmdet.datasets.pipelines import Compose
+from .inference import LoadImage
+
+
+class Histogram(object):
+    """Thread-safe histogram over fixed bucket upper bounds.
+
+    Args:
+        bounds (list[float]): Increasing upper bounds of the buckets, the
+            last bucket counts the values above the last bound.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.total += 1
+            self.sum += value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        with self._lock:
+            if self.total == 0:
+                return None
+            rank, seen = q / 100. * self.total, 0
+            for bound, count in zip(self.bounds + [float('inf')],
+                                    self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return float('inf')
+
+    def summary(self):
+        return dict(
+            bounds=self.bounds,
+            counts=list(self.counts),
+            total=self.total,
+            mean=self.sum / self.total if self.total else None,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99))
+
+
+class InferenceService(object):
+    """Serve a detector/SGG model to concurrent callers with dynamic batches.
+
+    The model and the test pipeline are built once. The requests of the
+    caller threads (or asyncio tasks) are preprocessed by the callers and
+    queued; a worker thread forms batches of up to `max_batch_size`
+    requests, waiting at most `max_latency` seconds after the oldest queued
+    request, runs the model on every batch and resolves the futures of its
+    requests.
+
+    Args:
+        model (nn.Module): The loaded model, e.g., from `init_detector`.
+        max_batch_size (int): Max number of requests per batch.
+        max_latency (float): Max seconds the oldest request waits for the
+            batch to be filled.
+        max_queue_size (int): Max number of pending requests, `submit`
+            blocks when the queue is full.
+        relation_mode (bool): Run the relation test (SGG models).
+        key_first (bool): Rank the key relations first (relation mode).
+
+    Example:
+        >>> with InferenceService(model, max_batch_size=8) as service:
+        >>>     result = service.infer('demo/demo.jpg')
+        >>>     # or, in a coroutine
+        >>>     result = await service.async_infer(img)
+        >>>     print(service.stats()['latency']['p90'])
+    """
+
+    # bucket bounds: seconds for the latencies, requests for the depths
+    LATENCY_BOUNDS = [0.005 * 2**i for i in range(12)]
+    DEPTH_BOUNDS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+    def __init__(self,
+                 model,
+                 max_batch_size=8,
+                 max_latency=0.01,
+                 max_queue_size=64,
+                 relation_mode=True,
+                 key_first=False):
+        self.model = model
+        self.device = next(model.parameters()).device
+        cfg = model.cfg
+        self.test_pipeline = Compose([LoadImage()] +
+                                     cfg.data.test.pipeline[1:])
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.relation_mode = relation_mode
+        self.key_first = key_first
+        self._queue = queue.Queue(max_queue_size)
+        self._worker = None
+        # guards _closed and the start of the worker: no request is queued
+        # after the stop sentinel of close
+        self._lock = threading.Lock()
+        self._closed = False
+        # set by the worker when it meets the sentinel while forming a batch
+        self._stopping = False
+        self.latency = Histogram(self.LATENCY_BOUNDS)
+        self.queue_depth = Histogram(self.DEPTH_BOUNDS)
+        self.batch_size = Histogram(list(range(1, max_batch_size + 1)))
+
+    def start(self):
+        with self._lock:
+            self._start()
+        return self
+
+    def _start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name='InferenceService', daemon=True)
+            self._worker.start()
+
+    def close(self):
+        """Stop the worker once the queued requests are served, the later
+        requests are rejected."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._worker is None:
+                return
+            self._queue.put(None)
+        self._worker.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def prepare(self, img):
+        """Run the test pipeline on an image file or array."""
+        return self.test_pipeline(dict(img=img))
+
+    def submit(self, img):
+        """Queue an image, return a `concurrent.futures.Future` of its
+        result."""
+        future = Future()
+        self._enqueue(self.prepare(img), future)
+        return future
+
+    def _enqueue(self, data, future):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('The inference service is closed')
+            self._start()
+            self._queue.put((data, future, time.perf_counter()))
+
+    def infer(self, img, timeout=None):
+        """Blocking inference of an image."""
+        return self.submit(img).result(timeout)
+
+    async def async_infer(self, img):
+        """Inference of an image in a coroutine, the preprocessing runs in
+        the default executor so the event loop is not blocked."""
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.prepare, img)
+        future = Future()
+        await loop.run_in_executor(None, self._enqueue, data, future)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return dict(
+            pending=self._queue.qsize(),
+            latency=self.latency.summary(),
+            queue_depth=self.queue_depth.summary(),
+            batch_size=self.batch_size.summary())
+
+    def _next_batch(self):
+        batch, deadline = [], None
+        while len(batch) < self.max_batch_size:
+            if deadline is None:
+                item = self._queue.get()
+            else:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=max(timeout, 0))
+                except queue.Empty:
+                    break
+            if item is None:
+                if not batch:
+                    return None
+                self._stopping = True  # stop after this batch
+                break
+            # the requests cancelled by their callers are dropped, the
+            # others cannot be cancelled anymore
+            if not item[1].set_running_or_notify_cancel():
+                continue
+            if deadline is None:
+                # the depth seen by the oldest request when its batch is
+                # formed
+                self.queue_depth.add(self._queue.qsize())
+                deadline = item[2] + self.max_latency
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopping:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                self._serve(batch)
+            except Exception as e:
+                # fail the batch, not the worker: the later requests would
+                # never be served
+                self._fail(batch, e)
+        # nothing is queued after the sentinel, fail what would be anyway
+        # rather than leaving its caller waiting
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(
+                    RuntimeError('The inference service is closed'))
+
+    @staticmethod
+    def _fail(batch, exception):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(exception)
+
+    def _serve(self, batch):
+        self.batch_size.add(len(batch))
+        try:
+            results = self._forward([data for data, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    'The model returned {} results for a batch of {} '
+                    'requests'.format(len(results), len(batch)))
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        now = time.perf_counter()
+        for (_, future, start), result in zip(batch, results):
+            if not future.done():
+                self.latency.add(now - start)
+                future.set_result(result)
+
+    def _forward(self, batch):
+        """Run the model on the preprocessed data of a batch, return the
+        results in the order of the batch."""
+        target = self.device.index if self.device.type == 'cuda' else -1
+        # the relation test runs the whole batch at once, the object
+        # detection test of the detectors takes 1 image per gpu
+        groups = [batch] if self.relation_mode else [[data] for data in batch]
+        results = []
+        with torch.no_grad():
+            for group in groups:
+                data = collate(group, samples_per_gpu=len(group))
+                data = scatter(data, [target])[0]
+                result = self.model(
+                    return_loss=False,
+                    rescale=True,
+                    relation_mode=self.relation_mode,
+                    key_first=self.key_first,
+                    **data)
+                if len(group) == 1:
+                    result = [result]
+                results.extend(result)
+        return results
@@ -47,7 +47,10 @@ def single_gpu_test(model, data_loader, relation_mode=False, relcaption_mode=Fal
                 results.append(result[:2])
             else:  # bbox
                 results.append(result)
-        # this line: are suitable for general OD and SGG (result is a Result Object)
+        # this line: are suitable for general OD and SGG (result is a Result Object, or the list of
+        # the Result Objects of the images of the batch)
+        elif isinstance(result, list):
+            results.extend(result)
         else:
             results.append(result)
 
@@ -108,6 +111,8 @@ def multi_gpu_test(model, data_loader, tmpdir=None, relation_mode=False, relcapt
                 results.append(result[:2])
             else:  # bbox
                 results.append(result)
+        elif isinstance(result, list):
+            results.extend(result)
         else:
             results.append(result)
 
@@ -9,8 +9,8 @@ from mmcv.runner import DistSamplerSeedHook, Runner
 
 from mmdet.core import (DistEvalHook, DistOptimizerHook, Fp16OptimizerHook, EvalHook,
                         build_optimizer, CaptionEvalHook, CaptionDistEvalHook)
-from mmdet.patches import PatchRunner, NoamLrUpdateHook, SamplingScheduleHook
-from mmdet.datasets import build_dataloader, build_dataset
+from mmdet.patches import PatchRunner, NoamLrUpdateHook, SamplingScheduleHook, ProfilerHook
+from mmdet.datasets import DataPrefetcher, build_dataloader, build_dataset
 from mmdet.utils import get_root_logger
 
 
@@ -84,6 +84,21 @@ def batch_processor(model, data, train_mode):
     return outputs
 
 
+def prefetch_data_loaders(data_loaders, cfg, distributed):
+    """Wrap the data loaders with DataPrefetcher if `cfg.data.prefetch` is
+    set, so that the next batch is copied to the GPUs during the iteration.
+    """
+    if not cfg.data.get('prefetch', False) or not torch.cuda.is_available():
+        return data_loaders
+    if distributed:
+        device_ids = [torch.cuda.current_device()]
+    else:
+        device_ids = cfg.gpu_ids
+    return [
+        DataPrefetcher(data_loader, device_ids) for data_loader in data_loaders
+    ]
+
+
 def train_detector(model,
                    dataset,
                    cfg,
@@ -104,7 +119,8 @@ def train_detector(model,
             # cfg.gpus will be ignored if distributed
             len(cfg.gpu_ids),
             dist=distributed,
-            seed=cfg.seed) for ds in dataset
+            seed=cfg.seed,
+            group_cfg=cfg.data.get('group_cfg', None)) for ds in dataset
     ]
 
     # Note: To freeze some parameters, they should be frozen before wrapped into DDP.
@@ -123,6 +139,7 @@ def train_detector(model,
             find_unused_parameters=find_unused_parameters)
     else:
         model = MMDataParallel(model.cuda(cfg.gpu_ids[0]), device_ids=cfg.gpu_ids)
+    data_loaders = prefetch_data_loaders(data_loaders, cfg, distributed)
 
     runner = PatchRunner(
         model,
@@ -157,6 +174,8 @@ def train_detector(model,
                                    cfg.get('lr_first', True))
     if distributed:
         runner.register_hook(DistSamplerSeedHook())
+    if cfg.get('profiler_config', None) is not None:
+        runner.register_hook(ProfilerHook(**cfg.profiler_config))
 
     # register eval hooks
     if validate:
@@ -234,7 +253,8 @@ def train_captioner(model,
             # cfg.gpus will be ignored if distributed
             len(cfg.gpu_ids),
             dist=distributed,
-            seed=cfg.seed) for ds in dataset
+            seed=cfg.seed,
+            group_cfg=cfg.data.get('group_cfg', None)) for ds in dataset
     ]
 
     # Note: To freeze some parameters, they should be frozen before wrapped into DDP.
@@ -253,6 +273,7 @@ def train_captioner(model,
             find_unused_parameters=find_unused_parameters)
     else:
         model = MMDataParallel(model.cuda(cfg.gpu_ids[0]), device_ids=cfg.gpu_ids)
+    data_loaders = prefetch_data_loaders(data_loaders, cfg, distributed)
 
     runner = PatchRunner(
         model,
@@ -290,6 +311,8 @@ def train_captioner(model,
 
     # register sampling schedule hook
     runner.register_hook(SamplingScheduleHook(**(cfg.sampling_schedule_config)))
+    if cfg.get('profiler_config', None) is not None:
+        runner.register_hook(ProfilerHook(**cfg.profiler_config))
 
     # register eval hooks
     if validate:
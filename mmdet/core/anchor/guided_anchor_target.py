@@ -1,7 +1,7 @@
 import torch
 
 from ..bbox import PseudoSampler, build_assigner, build_sampler
-from ..utils import multi_apply, unmap
+from ..utils import multi_apply, region_fill_index, unmap
 
 
 def calc_region(bbox, ratio, featmap_size=None):
@@ -57,73 +57,75 @@ def ga_loc_target(gt_bboxes_list,
     num_lvls = len(featmap_sizes)
     r1 = (1 - center_ratio) / 2
     r2 = (1 - ignore_ratio) / 2
-    all_loc_targets = []
-    all_loc_weights = []
-    all_ignore_map = []
-    for lvl_id in range(num_lvls):
-        h, w = featmap_sizes[lvl_id]
-        loc_targets = torch.zeros(
-            img_per_gpu,
-            1,
-            h,
-            w,
-            device=gt_bboxes_list[0].device,
-            dtype=torch.float32)
-        loc_weights = torch.full_like(loc_targets, -1)
-        ignore_map = torch.zeros_like(loc_targets)
-        all_loc_targets.append(loc_targets)
-        all_loc_weights.append(loc_weights)
-        all_ignore_map.append(ignore_map)
-    for img_id in range(img_per_gpu):
-        gt_bboxes = gt_bboxes_list[img_id]
-        scale = torch.sqrt((gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1) *
-                           (gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1))
+    device = gt_bboxes_list[0].device
+    # pad the gts of all images to (img_per_gpu, max_num_gts)
+    max_num_gts = max(
+        [gt_bboxes.size(0) for gt_bboxes in gt_bboxes_list] + [1])
+    gt_bboxes = gt_bboxes_list[0].new_zeros((img_per_gpu, max_num_gts, 4))
+    target_lvls = gt_bboxes.new_zeros((img_per_gpu, max_num_gts),
+                                      dtype=torch.long)
+    valid = gt_bboxes.new_zeros((img_per_gpu, max_num_gts), dtype=torch.bool)
+    for img_id, img_gt_bboxes in enumerate(gt_bboxes_list):
+        num_gts = img_gt_bboxes.size(0)
+        gt_bboxes[img_id, :num_gts] = img_gt_bboxes[:, :4]
+        valid[img_id, :num_gts] = True
+        scale = torch.sqrt((img_gt_bboxes[:, 2] - img_gt_bboxes[:, 0] + 1) *
+                           (img_gt_bboxes[:, 3] - img_gt_bboxes[:, 1] + 1))
         min_anchor_size = scale.new_full(
             (1, ), float(anchor_scale * anchor_strides[0]))
         # assign gt bboxes to different feature levels w.r.t. their scales
-        target_lvls = torch.floor(
+        img_target_lvls = torch.floor(
             torch.log2(scale) - torch.log2(min_anchor_size) + 0.5)
-        target_lvls = target_lvls.clamp(min=0, max=num_lvls - 1).long()
-        for gt_id in range(gt_bboxes.size(0)):
-            lvl = target_lvls[gt_id].item()
-            # rescaled to corresponding feature map
-            gt_ = gt_bboxes[gt_id, :4] / anchor_strides[lvl]
-            # calculate ignore regions
-            ignore_x1, ignore_y1, ignore_x2, ignore_y2 = calc_region(
-                gt_, r2, featmap_sizes[lvl])
-            # calculate positive (center) regions
-            ctr_x1, ctr_y1, ctr_x2, ctr_y2 = calc_region(
-                gt_, r1, featmap_sizes[lvl])
-            all_loc_targets[lvl][img_id, 0, ctr_y1:ctr_y2 + 1,
-                                 ctr_x1:ctr_x2 + 1] = 1
-            all_loc_weights[lvl][img_id, 0, ignore_y1:ignore_y2 + 1,
-                                 ignore_x1:ignore_x2 + 1] = 0
-            all_loc_weights[lvl][img_id, 0, ctr_y1:ctr_y2 + 1,
-                                 ctr_x1:ctr_x2 + 1] = 1
-            # calculate ignore map on nearby low level feature
-            if lvl > 0:
-                d_lvl = lvl - 1
-                # rescaled to corresponding feature map
-                gt_ = gt_bboxes[gt_id, :4] / anchor_strides[d_lvl]
-                ignore_x1, ignore_y1, ignore_x2, ignore_y2 = calc_region(
-                    gt_, r2, featmap_sizes[d_lvl])
-                all_ignore_map[d_lvl][img_id, 0, ignore_y1:ignore_y2 + 1,
-                                      ignore_x1:ignore_x2 + 1] = 1
-            # calculate ignore map on nearby high level feature
-            if lvl < num_lvls - 1:
-                u_lvl = lvl + 1
-                # rescaled to corresponding feature map
-                gt_ = gt_bboxes[gt_id, :4] / anchor_strides[u_lvl]
-                ignore_x1, ignore_y1, ignore_x2, ignore_y2 = calc_region(
-                    gt_, r2, featmap_sizes[u_lvl])
-                all_ignore_map[u_lvl][img_id, 0, ignore_y1:ignore_y2 + 1,
-                                      ignore_x1:ignore_x2 + 1] = 1
+        target_lvls[img_id, :num_gts] = img_target_lvls.clamp(
+            min=0, max=num_lvls - 1).long()
+
+    def level_regions(lvl_id, ratio, gt_mask):
+        # regions of the gts on the lvl_id feature map, empty out of gt_mask
+        x1, y1, x2, y2 = calc_region(
+            gt_bboxes.permute(2, 0, 1) / anchor_strides[lvl_id], ratio,
+            featmap_sizes[lvl_id])
+        x2 = torch.where(gt_mask, x2, x1 - 1)
+        return x1, y1, x2, y2
+
+    all_loc_targets = []
+    all_loc_weights = []
     for lvl_id in range(num_lvls):
+        h, w = featmap_sizes[lvl_id]
+        on_lvl = valid & (target_lvls == lvl_id)
+        ignore_x1, ignore_y1, ignore_x2, ignore_y2 = level_regions(
+            lvl_id, r2, on_lvl)
+        ctr_x1, ctr_y1, ctr_x2, ctr_y2 = level_regions(lvl_id, r1, on_lvl)
+        # positive (center) regions
+        loc_targets = region_fill_index(ctr_x1, ctr_y1, ctr_x2, ctr_y2,
+                                        (h, w)) >= 0
+        # each gt sets its ignore region to 0 and then its center region to
+        # 1, so the weight is decided by the last gt whose ignore region
+        # covers the location (the center region is inside the ignore one).
+        last_gt = region_fill_index(ignore_x1, ignore_y1, ignore_x2,
+                                    ignore_y2, (h, w))
+        last_gt_ = last_gt.clamp(min=0).view(img_per_gpu, -1)
+        ys = torch.arange(h, device=device).view(1, h, 1)
+        xs = torch.arange(w, device=device).view(1, 1, w)
+        in_ctr = ((ys >= ctr_y1.gather(1, last_gt_).view(-1, h, w)) &
+                  (ys <= ctr_y2.gather(1, last_gt_).view(-1, h, w)) &
+                  (xs >= ctr_x1.gather(1, last_gt_).view(-1, h, w)) &
+                  (xs <= ctr_x2.gather(1, last_gt_).view(-1, h, w)))
+        loc_weights = torch.full((img_per_gpu, h, w),
+                                 -1,
+                                 dtype=torch.float32,
+                                 device=device)
+        loc_weights[last_gt >= 0] = 0
+        loc_weights[(last_gt >= 0) & in_ctr] = 1
+        # ignore map of the gts on the nearby low and high level features
+        nearby = valid & ((target_lvls - lvl_id).abs() == 1)
+        ignore_map = region_fill_index(
+            *level_regions(lvl_id, r2, nearby), (h, w)) >= 0
         # ignore negative regions w.r.t. ignore map
-        all_loc_weights[lvl_id][(all_loc_weights[lvl_id] < 0)
-                                & (all_ignore_map[lvl_id] > 0)] = 0
+        loc_weights[(loc_weights < 0) & ignore_map] = 0
         # set negative regions with weight 0.1
-        all_loc_weights[lvl_id][all_loc_weights[lvl_id] < 0] = 0.1
+        loc_weights[loc_weights < 0] = 0.1
+        all_loc_targets.append(loc_targets.float().unsqueeze(1))
+        all_loc_weights.append(loc_weights.unsqueeze(1))
     # loc average factor to balance loss
     loc_avg_factor = sum(
         [t.size(0) * t.size(-1) * t.size(-2) for t in all_loc_targets]) / 200
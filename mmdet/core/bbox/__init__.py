@@ -1,6 +1,6 @@
 from .assigners import AssignResult, BaseAssigner, MaxIoUAssigner
 from .bbox_target import bbox_target
-from .geometry import bbox_overlaps, binary_mask_to_polygon, point_extractor_by_curvature
+from .geometry import bbox_overlaps, batched_bbox_overlaps, binary_mask_to_polygon, point_extractor_by_curvature
 from .geometry import get_point_from_mask
 from .samplers import (BaseSampler, CombinedSampler,
                        InstanceBalancedPosSampler, IoUBalancedNegSampler,
@@ -13,7 +13,7 @@ from .assign_sampling import (  # isort:skip, avoid recursive imports
     assign_and_sample, build_assigner, build_sampler)
 
 __all__ = [
-    'bbox_overlaps', 'BaseAssigner', 'MaxIoUAssigner', 'AssignResult',
+    'bbox_overlaps', 'batched_bbox_overlaps', 'BaseAssigner', 'MaxIoUAssigner', 'AssignResult',
     'BaseSampler', 'PseudoSampler', 'RandomSampler',
     'InstanceBalancedPosSampler', 'IoUBalancedNegSampler', 'CombinedSampler',
     'SamplingResult', 'build_assigner', 'build_sampler', 'assign_and_sample',
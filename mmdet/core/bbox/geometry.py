@@ -3,6 +3,7 @@ import numpy as np
 from skimage import measure
 import mmcv
 import cv2
+from torch.nn.utils.rnn import pad_sequence
 
 def bbox_overlaps(bboxes1, bboxes2, mode='iou', is_aligned=False):
     """Calculate overlap between two set of bboxes.
@@ -96,6 +97,50 @@ def bbox_overlaps(bboxes1, bboxes2, mode='iou', is_aligned=False):
     return ious
 
 
+def batched_bbox_overlaps(bboxes1_list, bboxes2_list, mode='iou'):
+    """Calculate the overlaps of the bbox sets of several images at once.
+
+    The bboxes of the images are zero-padded to the same number and the
+    overlaps are computed by one batched kernel, instead of calling
+    :func:`bbox_overlaps` image by image.
+
+    Args:
+        bboxes1_list (list[Tensor]): shape (m_i, 4+) of each image.
+        bboxes2_list (list[Tensor]): shape (n_i, 4+) of each image.
+        mode (str): "iou" (intersection over union) or iof (intersection over
+            foreground).
+
+    Returns:
+        list[Tensor]: shape (m_i, n_i) of each image, the same values as
+            ``bbox_overlaps(bboxes1_list[i][:, :4], bboxes2_list[i][:, :4])``.
+    """
+    assert mode in ['iou', 'iof']
+    assert len(bboxes1_list) == len(bboxes2_list)
+    if len(bboxes1_list) == 0:
+        return []
+    rows = [bboxes.size(0) for bboxes in bboxes1_list]
+    cols = [bboxes.size(0) for bboxes in bboxes2_list]
+    bboxes1 = pad_sequence([bboxes[:, :4] for bboxes in bboxes1_list],
+                           batch_first=True)  # [B, rows, 4]
+    bboxes2 = pad_sequence(
+        [bboxes[:, :4].to(bboxes1) for bboxes in bboxes2_list],
+        batch_first=True)  # [B, cols, 4]
+
+    lt = torch.max(bboxes1[:, :, None, :2], bboxes2[:, None, :, :2])
+    rb = torch.min(bboxes1[:, :, None, 2:], bboxes2[:, None, :, 2:])
+    wh = (rb - lt + 1).clamp(min=0)  # [B, rows, cols, 2]
+    overlap = wh[..., 0] * wh[..., 1]
+    area1 = (bboxes1[..., 2] - bboxes1[..., 0] + 1) * (
+        bboxes1[..., 3] - bboxes1[..., 1] + 1)
+    if mode == 'iou':
+        area2 = (bboxes2[..., 2] - bboxes2[..., 0] + 1) * (
+            bboxes2[..., 3] - bboxes2[..., 1] + 1)
+        ious = overlap / (area1[:, :, None] + area2[:, None, :] - overlap)
+    else:
+        ious = overlap / area1[:, :, None]
+    return [ious[i, :rows[i], :cols[i]] for i in range(len(rows))]
+
+
 def close_contour(contour):
     if not np.array_equal(contour[0], contour[-1]):
         contour = np.vstack((contour, contour[0]))
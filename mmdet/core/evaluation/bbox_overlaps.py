@@ -1,17 +1,25 @@
 import numpy as np
 
 
-def bbox_overlaps(bboxes1, bboxes2, mode='iou'):
+def bbox_overlaps(bboxes1, bboxes2, mode='iou', is_aligned=False,
+                  chunk_size=2**22):
     """Calculate the ious between each bbox of bboxes1 and bboxes2.
 
+    The overlaps are computed by broadcasting, over chunks of the rows of
+    bboxes1 so that the intermediate arrays hold at most about
+    ``chunk_size`` elements.
+
     Args:
         bboxes1(ndarray): shape (n, 4)
         bboxes2(ndarray): shape (k, 4)
         mode(str): iou (intersection over union) or iof (intersection
             over foreground)
+        is_aligned(bool): compute the ious between the aligned pairs of
+            bboxes1 and bboxes2 (n must be equal to k).
+        chunk_size(int): max number of elements of the intermediate arrays.
 
     Returns:
-        ious(ndarray): shape (n, k)
+        ious(ndarray): shape (n, k), or (n, ) if is_aligned
     """
 
     assert mode in ['iou', 'iof']
@@ -20,30 +28,45 @@ def bbox_overlaps(bboxes1, bboxes2, mode='iou'):
     bboxes2 = bboxes2.astype(np.float32)
     rows = bboxes1.shape[0]
     cols = bboxes2.shape[0]
+    if is_aligned:
+        assert rows == cols
+        return _aligned_overlaps(bboxes1, bboxes2, mode)
     ious = np.zeros((rows, cols), dtype=np.float32)
     if rows * cols == 0:
         return ious
-    exchange = False
-    if bboxes1.shape[0] > bboxes2.shape[0]:
-        bboxes1, bboxes2 = bboxes2, bboxes1
-        ious = np.zeros((cols, rows), dtype=np.float32)
-        exchange = True
-    area1 = (bboxes1[:, 2] - bboxes1[:, 0] + 1) * (
-        bboxes1[:, 3] - bboxes1[:, 1] + 1)
     area2 = (bboxes2[:, 2] - bboxes2[:, 0] + 1) * (
         bboxes2[:, 3] - bboxes2[:, 1] + 1)
-    for i in range(bboxes1.shape[0]):
-        x_start = np.maximum(bboxes1[i, 0], bboxes2[:, 0])
-        y_start = np.maximum(bboxes1[i, 1], bboxes2[:, 1])
-        x_end = np.minimum(bboxes1[i, 2], bboxes2[:, 2])
-        y_end = np.minimum(bboxes1[i, 3], bboxes2[:, 3])
+    step = max(chunk_size // cols, 1)
+    for start in range(0, rows, step):
+        b1 = bboxes1[start:start + step, None]  # [chunk, 1, 4]
+        x_start = np.maximum(b1[..., 0], bboxes2[:, 0])
+        y_start = np.maximum(b1[..., 1], bboxes2[:, 1])
+        x_end = np.minimum(b1[..., 2], bboxes2[:, 2])
+        y_end = np.minimum(b1[..., 3], bboxes2[:, 3])
         overlap = np.maximum(x_end - x_start + 1, 0) * np.maximum(
             y_end - y_start + 1, 0)
+        area1 = (b1[..., 2] - b1[..., 0] + 1) * (b1[..., 3] - b1[..., 1] + 1)
         if mode == 'iou':
-            union = area1[i] + area2 - overlap
+            union = area1 + area2 - overlap
         else:
-            union = area1[i] if not exchange else area2
-        ious[i, :] = overlap / union
-    if exchange:
-        ious = ious.T
+            union = area1
+        ious[start:start + step] = overlap / union
     return ious
+
+
+def _aligned_overlaps(bboxes1, bboxes2, mode):
+    x_start = np.maximum(bboxes1[:, 0], bboxes2[:, 0])
+    y_start = np.maximum(bboxes1[:, 1], bboxes2[:, 1])
+    x_end = np.minimum(bboxes1[:, 2], bboxes2[:, 2])
+    y_end = np.minimum(bboxes1[:, 3], bboxes2[:, 3])
+    overlap = np.maximum(x_end - x_start + 1, 0) * np.maximum(
+        y_end - y_start + 1, 0)
+    area1 = (bboxes1[:, 2] - bboxes1[:, 0] + 1) * (
+        bboxes1[:, 3] - bboxes1[:, 1] + 1)
+    if mode == 'iou':
+        area2 = (bboxes2[:, 2] - bboxes2[:, 0] + 1) * (
+            bboxes2[:, 3] - bboxes2[:, 1] + 1)
+        union = area1 + area2 - overlap
+    else:
+        union = area1
+    return overlap / union
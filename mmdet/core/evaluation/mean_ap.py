@@ -35,8 +35,8 @@ def average_precision(recalls, precisions, mode='area'):
         ones = np.ones((num_scales, 1), dtype=recalls.dtype)
         mrec = np.hstack((zeros, recalls, ones))
         mpre = np.hstack((zeros, precisions, zeros))
-        for i in range(mpre.shape[1] - 1, 0, -1):
-            mpre[:, i - 1] = np.maximum(mpre[:, i - 1], mpre[:, i])
+        # precision envelope: the max precision at any higher recall
+        mpre = np.maximum.accumulate(mpre[:, ::-1], axis=1)[:, ::-1]
         for i in range(num_scales):
             ind = np.where(mrec[i, 1:] != mrec[i, :-1])[0]
             ap[i] = np.sum(
@@ -60,7 +60,8 @@ def tpfp_imagenet(det_bboxes,
                   gt_bboxes,
                   gt_bboxes_ignore=None,
                   default_iou_thr=0.5,
-                  area_ranges=None):
+                  area_ranges=None,
+                  ious=None):
     """Check if detected bboxes are true positive or false positive.
 
     Args:
@@ -73,6 +74,8 @@ def tpfp_imagenet(det_bboxes,
             Default: 0.5.
         area_ranges (list[tuple] | None): Range of bbox areas to be evaluated,
             in the format [(min1, max1), (min2, max2), ...]. Default: None.
+        ious (ndarray | None): Precomputed overlaps of det_bboxes and
+            [gt_bboxes - 1; gt_bboxes_ignore - 1], of shape (m, n + k).
 
     Returns:
         tuple[np.ndarray]: (tp, fp) whose elements are 0 and 1. The shape of
@@ -103,7 +106,8 @@ def tpfp_imagenet(det_bboxes,
             for i, (min_area, max_area) in enumerate(area_ranges):
                 fp[i, (det_areas >= min_area) & (det_areas < max_area)] = 1
         return tp, fp
-    ious = bbox_overlaps(det_bboxes, gt_bboxes - 1)
+    if ious is None:
+        ious = bbox_overlaps(det_bboxes, gt_bboxes - 1)
     gt_w = gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1
     gt_h = gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1
     iou_thrs = np.minimum((gt_w * gt_h) / ((gt_w + 10.0) * (gt_h + 10.0)),
@@ -154,7 +158,8 @@ def tpfp_default(det_bboxes,
                  gt_bboxes,
                  gt_bboxes_ignore=None,
                  iou_thr=0.5,
-                 area_ranges=None):
+                 area_ranges=None,
+                 ious=None):
     """Check if detected bboxes are true positive or false positive.
 
     Args:
@@ -166,6 +171,8 @@ def tpfp_default(det_bboxes,
             Default: 0.5.
         area_ranges (list[tuple] | None): Range of bbox areas to be evaluated,
             in the format [(min1, max1), (min2, max2), ...]. Default: None.
+        ious (ndarray | None): Precomputed overlaps of det_bboxes and
+            [gt_bboxes; gt_bboxes_ignore], of shape (m, n + k).
 
     Returns:
         tuple[np.ndarray]: (tp, fp) whose elements are 0 and 1. The shape of
@@ -200,7 +207,8 @@ def tpfp_default(det_bboxes,
                 fp[i, (det_areas >= min_area) & (det_areas < max_area)] = 1
         return tp, fp
 
-    ious = bbox_overlaps(det_bboxes, gt_bboxes)
+    if ious is None:
+        ious = bbox_overlaps(det_bboxes, gt_bboxes)
     # for each det, the max iou with all gts
     ious_max = ious.max(axis=1)
     # for each det, which gt overlaps most with it
@@ -263,13 +271,82 @@ def get_cls_results(det_results, annotations, class_id):
     return cls_dets, cls_gts, cls_gts_ignore
 
 
+def count_gts(gt_bboxes, area_ranges=None):
+    """Number of gts of each scale, the gts beyond a scale are not counted."""
+    if area_ranges is None:
+        return np.array([gt_bboxes.shape[0]], dtype=int)
+    gt_areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0] + 1) * (
+        gt_bboxes[:, 3] - gt_bboxes[:, 1] + 1)
+    return np.array([
+        np.sum((gt_areas >= min_area) & (gt_areas < max_area))
+        for min_area, max_area in area_ranges
+    ], dtype=int)
+
+
+def tpfp_image(img_dets, ann, iou_thr=0.5, area_ranges=None, imagenet=False):
+    """Compute tp and fp of all the classes of an image.
+
+    The overlaps between all the detections and all the gts of the image are
+    computed once and sliced for each class.
+
+    Args:
+        img_dets (list[ndarray]): Detected bboxes of each class, (m_i, 5).
+        ann (dict): Annotation of the image, see `eval_map()`.
+        iou_thr (float): IoU threshold to be considered as matched.
+        area_ranges (list[tuple] | None): Range of bbox areas to be evaluated.
+        imagenet (bool): Use `tpfp_imagenet` instead of `tpfp_default`.
+
+    Returns:
+        tuple[np.ndarray]: (tp, fp, num_gts). tp and fp are of shape
+            (num_scales, sum(m_i)) with the detections in the class order,
+            num_gts is the gt number of each class and scale, of shape
+            (num_classes, num_scales).
+    """
+    num_classes = len(img_dets)
+    num_scales = len(area_ranges) if area_ranges is not None else 1
+    gt_bboxes = ann['bboxes']
+    gt_labels = ann['labels']
+    if ann.get('labels_ignore', None) is not None:
+        gt_bboxes_ignore = ann['bboxes_ignore']
+        gt_labels_ignore = ann['labels_ignore']
+    else:
+        gt_bboxes_ignore = np.empty((0, 4), dtype=np.float32)
+        gt_labels_ignore = np.empty((0, ), dtype=np.int64)
+    all_gts = np.vstack((gt_bboxes, gt_bboxes_ignore))
+    num_dets = [dets.shape[0] for dets in img_dets]
+    det_ends = np.cumsum(num_dets)
+    all_dets = np.vstack(img_dets)
+    all_ious = bbox_overlaps(all_dets, all_gts - 1 if imagenet else all_gts)
+    tpfp_func = tpfp_imagenet if imagenet else tpfp_default
+
+    tp = np.zeros((num_scales, all_dets.shape[0]), dtype=np.float32)
+    fp = np.zeros((num_scales, all_dets.shape[0]), dtype=np.float32)
+    num_gts = np.zeros((num_classes, num_scales), dtype=int)
+    for i in np.unique(gt_labels).astype(np.int64) - 1:
+        num_gts[i] = count_gts(gt_bboxes[gt_labels == i + 1, :], area_ranges)
+    for i in range(num_classes):
+        if num_dets[i] == 0:
+            continue
+        det_inds = slice(det_ends[i] - num_dets[i], det_ends[i])
+        # the gts of the class first, then the ignored ones as in tpfp_func
+        gt_inds = np.concatenate(
+            (np.where(gt_labels == i + 1)[0],
+             np.where(gt_labels_ignore == i + 1)[0] + gt_bboxes.shape[0]))
+        tp[:, det_inds], fp[:, det_inds] = tpfp_func(
+            img_dets[i], gt_bboxes[gt_labels == i + 1, :],
+            gt_bboxes_ignore[gt_labels_ignore == i + 1, :], iou_thr,
+            area_ranges, all_ious[det_inds][:, gt_inds])
+    return tp, fp, num_gts
+
+
 def eval_map(det_results,
              annotations,
              scale_ranges=None,
              iou_thr=0.5,
              dataset=None,
              logger=None,
-             nproc=4):
+             nproc=4,
+             by_image=True):
     """Evaluate mAP of a dataset.
 
     Args:
@@ -295,6 +372,11 @@ def eval_map(det_results,
             summary. See `mmdet.utils.print_log()` for details. Default: None.
         nproc (int): Processes used for computing TP and FP.
             Default: 4.
+        by_image (bool): Compute TP and FP image by image (see
+            `tpfp_image()`), so that the IoUs of an image are computed once
+            for all the classes and the images are split among the processes.
+            Otherwise the classes are evaluated one by one. Both give the
+            same results. Default: True.
 
     Returns:
         tuple: (mAP, [dict, dict, ...])
@@ -308,41 +390,61 @@ def eval_map(det_results,
                    if scale_ranges is not None else None)
 
     pool = Pool(nproc)
+    imagenet = dataset in ['det', 'vid']
+    if by_image:
+        img_results = pool.starmap(
+            tpfp_image,
+            zip(det_results, annotations, [iou_thr for _ in range(num_imgs)],
+                [area_ranges for _ in range(num_imgs)],
+                [imagenet for _ in range(num_imgs)]),
+            chunksize=max(1, num_imgs // (nproc * 4)))
+        all_tp = np.hstack([img_result[0] for img_result in img_results])
+        all_fp = np.hstack([img_result[1] for img_result in img_results])
+        all_num_gts = np.sum([img_result[2] for img_result in img_results],
+                             axis=0)
+        all_dets = np.vstack([np.vstack(img_res) for img_res in det_results])
+        det_labels = np.concatenate([
+            np.repeat(np.arange(num_classes),
+                      [dets.shape[0] for dets in img_res])
+            for img_res in det_results
+        ])
+        # group the dets by class, keeping the image order in each class
+        cls_order = np.argsort(det_labels, kind='mergesort')
+        cls_ends = np.searchsorted(det_labels[cls_order],
+                                   np.arange(num_classes), side='right')
     eval_results = []
     for i in range(num_classes):
-        # get gt and det bboxes of this class
-        cls_dets, cls_gts, cls_gts_ignore = get_cls_results(
-            det_results, annotations, i)
-        # choose proper function according to datasets to compute tp and fp
-        if dataset in ['det', 'vid']:
-            tpfp_func = tpfp_imagenet
+        if by_image:
+            cls_inds = cls_order[cls_ends[i - 1] if i > 0 else 0:cls_ends[i]]
+            cls_dets = all_dets[cls_inds]
+            tp, fp = all_tp[:, cls_inds], all_fp[:, cls_inds]
+            num_gts = all_num_gts[i]
         else:
-            tpfp_func = tpfp_default
-        # compute tp and fp for each image with multiple processes
-        tpfp = pool.starmap(
-            tpfp_func,
-            zip(cls_dets, cls_gts, cls_gts_ignore,
-                [iou_thr for _ in range(num_imgs)],
-                [area_ranges for _ in range(num_imgs)]))
-        tp, fp = tuple(zip(*tpfp))
-        # calculate gt number of each scale
-        # ignored gts or gts beyond the specific scale are not counted
-        num_gts = np.zeros(num_scales, dtype=int)
-        for j, bbox in enumerate(cls_gts):
-            if area_ranges is None:
-                num_gts[0] += bbox.shape[0]
-            else:
-                gt_areas = (bbox[:, 2] - bbox[:, 0] + 1) * (
-                    bbox[:, 3] - bbox[:, 1] + 1)
-                for k, (min_area, max_area) in enumerate(area_ranges):
-                    num_gts[k] += np.sum((gt_areas >= min_area)
-                                         & (gt_areas < max_area))
+            # get gt and det bboxes of this class
+            cls_dets, cls_gts, cls_gts_ignore = get_cls_results(
+                det_results, annotations, i)
+            # choose proper function according to datasets to compute tp
+            # and fp
+            tpfp_func = tpfp_imagenet if imagenet else tpfp_default
+            # compute tp and fp for each image with multiple processes
+            tpfp = pool.starmap(
+                tpfp_func,
+                zip(cls_dets, cls_gts, cls_gts_ignore,
+                    [iou_thr for _ in range(num_imgs)],
+                    [area_ranges for _ in range(num_imgs)]))
+            tp, fp = tuple(zip(*tpfp))
+            tp, fp = np.hstack(tp), np.hstack(fp)
+            cls_dets = np.vstack(cls_dets)
+            # calculate gt number of each scale
+            # ignored gts or gts beyond the specific scale are not counted
+            num_gts = np.zeros(num_scales, dtype=int)
+            for bbox in cls_gts:
+                num_gts += count_gts(bbox, area_ranges)
         # sort all det bboxes by score, also sort tp and fp
-        cls_dets = np.vstack(cls_dets)
         num_dets = cls_dets.shape[0]
         sort_inds = np.argsort(-cls_dets[:, -1])
-        tp = np.hstack(tp)[:, sort_inds]
-        fp = np.hstack(fp)[:, sort_inds]
+        tp = tp[:, sort_inds]
+        fp = fp[:, sort_inds]
         # calculate recall and precision with tp and fp
         tp = np.cumsum(tp, axis=1)
         fp = np.cumsum(fp, axis=1)
@@ -363,6 +465,7 @@ def eval_map(det_results,
             'precision': precisions,
             'ap': ap
         })
+    pool.close()
     if scale_ranges is not None:
         # shape (num_classes, num_scales)
         all_ap = np.vstack([cls_result['ap'] for cls_result in eval_results])
@@ -24,9 +24,17 @@ def relcaption_evaluation(
         min_overlaps=[0.2, 0.3, 0.4, 0.5, 0.6],
         min_scores=[-1, 0, 0.05, 0.1, 0.15, 0.2, 0.25],
         topN=[-1, 2, 5],
-        topNrec=[-1, 20, 50, 100]):
+        topNrec=[-1, 20, 50, 100],
+        sort_by_conf=False):
     m = Meteor_()
     result_container = dict()
+    # the effect of the candidate pair selection (e.g., the pair ranker of the relcaption head)
+    result_container.update(relcaption_pair_statistics(groundtruths, predictions))
+    msg = 'Decoded pairs per image: {:.1f} / {:.1f} candidates, gt pair recall@0.5: {:.4f}'.format(
+        result_container['pairs_per_img'], result_container['candidate_pairs_per_img'],
+        result_container['pair_recall'])
+    print_log(msg, logger=logger)
+
     msg = 'Evaluating {}...'.format('mAP')
     if logger is None:
         msg = '\n' + msg
@@ -38,7 +46,8 @@ def relcaption_evaluation(
         logger,
         vocab,
         min_overlaps,
-        min_scores))
+        min_scores,
+        sort_by_conf=sort_by_conf))
 
     msg = 'Evaluating {}...'.format('imgRecall')
     if logger is None:
@@ -68,10 +77,34 @@ def relcaption_evaluation(
     return result_container
 
 
-def relcaption_evaluation_mAP(groundtruths, predictions, scorer, logger, vocab, min_overlaps, min_scores):
+def relcaption_pair_statistics(groundtruths, predictions, min_overlap=0.5):
+    """The number of the decoded pairs and the fraction of the gt pairs that are
+    covered by them: a gt pair is covered if some decoded pair overlaps its subject
+    and object both with IoU >= min_overlap."""
+    num_pairs, num_candidates, num_covered, npos = 0, 0, 0, 0
+    for prediction, groundtruth in zip(predictions, groundtruths):
+        pred_boxes = prediction.bboxes[:, :4]
+        pred_rels = prediction.rel_pair_idxes
+        gt_rels = groundtruth.rel_pair_idxes
+        num_pairs += pred_rels.shape[0]
+        num_candidates += len(pred_boxes) * (len(pred_boxes) - 1)
+        npos += gt_rels.shape[0]
+        if gt_rels.shape[0] == 0 or pred_rels.shape[0] == 0:
+            continue
+        ov_mask = bbox_overlaps(pred_boxes, groundtruth.bboxes[:, :4]) >= min_overlap
+        covered = ov_mask[pred_rels[:, 0]][:, gt_rels[:, 0]] & ov_mask[pred_rels[:, 1]][:, gt_rels[:, 1]]
+        num_covered += covered.any(0).sum()
+    num_imgs = max(len(predictions), 1)
+    return dict(pairs_per_img=num_pairs / num_imgs,
+                candidate_pairs_per_img=num_candidates / num_imgs,
+                pair_recall=float(num_covered) / max(npos, 1))
+
+
+def relcaption_evaluation_mAP(groundtruths, predictions, scorer, logger, vocab, min_overlaps, min_scores,
+                              sort_by_conf=False):
     # process every single images
     npos = 0
-    candidates, references = [], []
+    candidates, references, cand_confs = [], [], []
     pair_max_ovs, pair_max_ov_gts = [], []
     for prediction, groundtruth in zip(predictions, groundtruths):
         gt_boxes = groundtruth.bboxes
@@ -94,6 +127,10 @@ def relcaption_evaluation_mAP(groundtruths, predictions, scorer, logger, vocab,
         pair_max_ovs.append(pred_pair_max_ovs)
         pair_max_ov_gts.append(pred_pair_max_ov_gt_pair)
         candidates += pred_rel_cap_sents
+        if sort_by_conf:
+            # the confidence of a caption: the product of its word probabilities, ranked by its log (the sum of
+            # the word log probabilities) since the product underflows to 0 for long captions
+            cand_confs.append(prediction.rel_cap_scores.sum(1))
         for i in pred_pair_max_ov_gt_pair:
             if pred_pair_max_ovs[i] == 0:
                 references.append(None)
@@ -107,89 +144,75 @@ def relcaption_evaluation_mAP(groundtruths, predictions, scorer, logger, vocab,
     meteor_scores_dict = scorer.compute(candidates, references)
     print('\ncomputing meteor score finished.\n')
     scores = meteor_scores_dict['scores']
-    n = len(scores)
+    confs = np.hstack(cand_confs) if sort_by_conf else None
+    aps = _interp_precision(scores, references, npos, min_overlaps, min_scores, ovs=pair_max_ovs, confs=confs)
     ap_results = {}
     det_results = {}
-    for min_overlap in min_overlaps:
-        for min_score in min_scores:
-            tp = np.zeros(n)
-            fp = np.zeros(n)
-
-            for i in range(n):
-                if references[i] is None:
-                    fp[i] = 1
-                else:
-                    if pair_max_ovs[i] >= min_overlap and scores[i] > min_score:
-                        tp[i] = 1
-                    else:
-                        fp[i] = 1
-            fp = np.cumsum(fp)
-            tp = np.cumsum(tp)
-            rec = tp / npos
-            prec = tp / (tp + fp)
-
-            ap = 0
-            apn = 0
-            for t in np.arange(0, 1, 0.01):
-                mask = (rec >= t).astype(np.int)
-                prec_masked = prec * mask
-                p = np.max(prec_masked)
-                ap = ap + p
-                apn = apn + 1
-            ap = ap / apn
+    for i, min_overlap in enumerate(min_overlaps):
+        for j, min_score in enumerate(min_scores):
             if min_score == -1:
-                det_results['ov_{}'.format(min_overlap)] = ap
+                det_results['ov_{}'.format(min_overlap)] = aps[i, j]
             else:
-                ap_results['ov_{}_score_{}'.format(min_overlap, min_score)] = ap
+                ap_results['ov_{}_score_{}'.format(min_overlap, min_score)] = aps[i, j]
     return dict(map=sum(ap_results.values()) / len(ap_results),
                 detmap=sum(det_results.values()) / len(det_results))
 
 
-def _recall(scores, references, npos, min_overlaps, min_scores, ovs=None):
+def _tp_masks(scores, references, min_overlaps, min_scores, ovs=None):
+    """Compute the true-positive masks of all the thresholds at once.
+
+    Returns:
+        np.ndarray: bool array of shape (len(min_overlaps), len(min_scores), n).
+            The false positives are simply the complement.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    valid = np.array([ref is not None for ref in references], dtype=bool)
+    score_mask = scores[None, :] > np.asarray(min_scores, dtype=np.float64)[:, None]
+    tp = (valid[None, :] & score_mask)[None, :, :]
+    if ovs is None:
+        return np.repeat(tp, len(min_overlaps), axis=0)
+    ovs = np.asarray(ovs, dtype=np.float64)
+    ov_mask = ovs[None, :] >= np.asarray(min_overlaps, dtype=np.float64)[:, None]
+    return tp & ov_mask[:, None, :]
+
+
+def _interp_precision(scores, references, npos, min_overlaps, min_scores, ovs=None, confs=None,
+                      rec_thrs=np.arange(0, 1, 0.01)):
+    """The 100-point interpolated precision for every (min_overlap, min_score).
+
+    The candidates are accumulated in the given order, or in descending order
+    of `confs` when it is provided.
+
+    Returns:
+        np.ndarray: shape (len(min_overlaps), len(min_scores)).
+    """
     n = len(scores)
-    recall_results = {}
-    det_results = {}
-    for min_overlap in min_overlaps:
-        for min_score in min_scores:
-            tp = np.zeros(n)
-            tn = np.zeros(n)
-
-            for i in range(n):
-                if references[i] is None:
-                    tn[i] = 1
-                else:
-                    if scores[i] > min_score:
-                        if ovs is not None:
-                            if ovs[i] >= min_overlap:
-                                tp[i] = 1
-                            else:
-                                tn[i] = 1
-                        else:
-                            tp[i] = 1
-                    else:
-                        tn[i] = 1
-            tn = np.cumsum(tn)
-            tp = np.cumsum(tp)
-            rec = tp / npos
-            prec = tp / (tp + tn)
-
-            recall = 0
-            recallN = 0
-            for t in np.arange(0, 1, 0.01):
-                mask = (rec >= t).astype(np.int)
-                prec_masked = prec * mask
-                p = np.max(prec_masked)
-                recall = recall + p
-                recallN = recallN + 1
-            recall = recall / recallN
-            if min_score == -1:
-                det_results['ov_{}'.format(min_overlap)] = recall
-            else:
-                recall_results['ov_{}_score_{}'.format(min_overlap, min_score)] = recall
+    num_ovs, num_scores = len(min_overlaps), len(min_scores)
+    if n == 0:
+        return np.zeros((num_ovs, num_scores))
+    tp = _tp_masks(scores, references, min_overlaps, min_scores, ovs).reshape(num_ovs * num_scores, n)
+    if confs is not None:
+        tp = tp[:, np.argsort(-np.asarray(confs), kind='stable')]
+    tp = np.cumsum(tp, axis=1)
+    # every candidate is either tp or fp, so tp + fp is simply its rank
+    rec = tp / npos
+    prec = tp / np.arange(1, n + 1)
+    # the max precision of all the positions whose recall >= t: since the recall
+    # is non-decreasing, it is the envelope taken from the first such position.
+    prec_env = np.maximum.accumulate(prec[:, ::-1], axis=1)[:, ::-1]
+    prec_env = np.hstack((prec_env, np.zeros((prec_env.shape[0], 1))))
+    first_inds = np.stack([np.searchsorted(r, rec_thrs, side='left') for r in rec])
+    ap = np.take_along_axis(prec_env, first_inds, axis=1).mean(1)
+    return ap.reshape(num_ovs, num_scores)
+
+
+def _recall(scores, references, npos, min_overlaps, min_scores, ovs=None, confs=None):
+    recalls = _interp_precision(scores, references, npos, min_overlaps, min_scores, ovs=ovs, confs=confs)
+    min_scores = np.asarray(min_scores)
     if len(min_scores) == 1 and min_scores[0] == -1:
-        return sum(det_results.values()) / len(det_results)
+        return recalls[:, min_scores == -1].mean()
     else:
-        return sum(recall_results.values()) / len(recall_results)
+        return recalls[:, min_scores != -1].mean()
 
 
 def relcaption_evaluation_recall(groundtruths, predictions, scorer, logger, vocab, min_overlaps, min_scores,
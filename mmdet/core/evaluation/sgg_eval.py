@@ -11,7 +11,7 @@ import itertools
 from terminaltables import AsciiTable
 import numpy as np
 from functools import reduce
-from mmdet.core import bbox_overlaps
+from .bbox_overlaps import bbox_overlaps
 from .sgg_eval_util import intersect_2d, argsort_desc
 
 from abc import ABC, abstractmethod
@@ -661,29 +661,36 @@ def _compute_pred_matches(gt_triplets, pred_triplets,
     # Instead of summing, we want the equality, so we reduce in that way
     # The rows correspond to GT triplets, columns to pred triplets
     keeps = intersect_2d(gt_triplets, pred_triplets)
-    gt_has_match = keeps.any(1)
-    pred_to_gt = [[] for x in range(pred_boxes.shape[0])]
-    for gt_ind, gt_box, keep_inds in zip(np.where(gt_has_match)[0],
-                                         gt_boxes[gt_has_match],
-                                         keeps[gt_has_match],
-                                         ):
-        boxes = pred_boxes[keep_inds]
-        if phrdet:
-            # Evaluate where the union box > 0.5
-            gt_box_union = gt_box.reshape((2, 4))
-            gt_box_union = np.concatenate((gt_box_union.min(0)[:2], gt_box_union.max(0)[2:]), 0)
-
-            box_union = boxes.reshape((-1, 2, 4))
-            box_union = np.concatenate((box_union.min(1)[:, :2], box_union.max(1)[:, 2:]), 1)
+    return _match_triplet_boxes(keeps, gt_boxes, pred_boxes, iou_thrs, phrdet)
 
-            inds = bbox_overlaps(gt_box_union[None], box_union).numpy()[0] >= iou_thrs
 
-        else:
-            sub_iou = bbox_overlaps(gt_box[None, :4], boxes[:, :4]).numpy()[0]
-            obj_iou = bbox_overlaps(gt_box[None, 4:], boxes[:, 4:]).numpy()[0]
+def _union_boxes(boxes):
+    """(n, 8) subject-object boxes -> (n, 4) union boxes."""
+    boxes = boxes.reshape((-1, 2, 4))
+    return np.concatenate((boxes.min(1)[:, :2], boxes.max(1)[:, 2:]), 1)
 
-            inds = (sub_iou >= iou_thrs) & (obj_iou >= iou_thrs)
 
-        for i in np.where(keep_inds)[0][inds]:
-            pred_to_gt[i].append(int(gt_ind))
+def _match_triplet_boxes(keeps, gt_boxes, pred_boxes, iou_thrs, phrdet=False):
+    """
+    Match the gt triplets with the predicted triplets of the same labels (keeps: [num_gt, num_pred]) by their
+    boxes. The IoUs of all the gt triplets with a label match are computed at once.
+    Return:
+        pred_to_gt [List of List]
+    """
+    gt_inds = np.where(keeps.any(1))[0]
+    pred_to_gt = [[] for x in range(pred_boxes.shape[0])]
+    if len(gt_inds) == 0:
+        return pred_to_gt
+    gt_boxes = gt_boxes[gt_inds]
+    if phrdet:
+        # Evaluate where the union box > 0.5
+        is_match = bbox_overlaps(_union_boxes(gt_boxes), _union_boxes(pred_boxes)) >= iou_thrs
+    else:
+        sub_iou = bbox_overlaps(gt_boxes[:, :4], pred_boxes[:, :4])
+        obj_iou = bbox_overlaps(gt_boxes[:, 4:], pred_boxes[:, 4:])
+        is_match = (sub_iou >= iou_thrs) & (obj_iou >= iou_thrs)
+    is_match &= keeps[gt_inds]
+    # row-major order: the gts are appended in increasing order for each prediction
+    for gt_row, pred_ind in zip(*np.nonzero(is_match)):
+        pred_to_gt[pred_ind].append(int(gt_inds[gt_row]))
     return pred_to_gt
@@ -11,8 +11,8 @@ import itertools
 from terminaltables import AsciiTable
 import numpy as np
 from functools import reduce
-from mmdet.core import bbox_overlaps
 from .sgg_eval_util import intersect_2d, argsort_desc
+from .sgg_eval import _match_triplet_boxes
 
 from abc import ABC, abstractmethod
 
@@ -353,32 +353,7 @@ def _compute_pred_matches(gt_triplets, pred_triplets,
     # Instead of summing, we want the equality, so we reduce in that way
     # The rows correspond to GT triplets, columns to pred triplets
     keeps = intersect_2d(gt_triplets, pred_triplets)
-    gt_has_match = keeps.any(1)
-    pred_to_gt = [[] for x in range(pred_boxes.shape[0])]
-    for gt_ind, gt_box, keep_inds in zip(np.where(gt_has_match)[0],
-                                         gt_boxes[gt_has_match],
-                                         keeps[gt_has_match],
-                                         ):
-        boxes = pred_boxes[keep_inds]
-        if phrdet:
-            # Evaluate where the union box > 0.5
-            gt_box_union = gt_box.reshape((2, 4))
-            gt_box_union = np.concatenate((gt_box_union.min(0)[:2], gt_box_union.max(0)[2:]), 0)
-
-            box_union = boxes.reshape((-1, 2, 4))
-            box_union = np.concatenate((box_union.min(1)[:, :2], box_union.max(1)[:, 2:]), 1)
-
-            inds = bbox_overlaps(gt_box_union[None], box_union).numpy()[0] >= iou_thrs
-
-        else:
-            sub_iou = bbox_overlaps(gt_box[None, :4], boxes[:, :4]).numpy()[0]
-            obj_iou = bbox_overlaps(gt_box[None, 4:], boxes[:, 4:]).numpy()[0]
-
-            inds = (sub_iou >= iou_thrs) & (obj_iou >= iou_thrs)
-
-        for i in np.where(keep_inds)[0][inds]:
-            pred_to_gt[i].append(int(gt_ind))
-    return pred_to_gt
+    return _match_triplet_boxes(keeps, gt_boxes, pred_boxes, iou_thrs, phrdet)
 
 
 def _compute_pair_matches(gt_triplets, pred_triplets,
@@ -394,29 +369,4 @@ def _compute_pair_matches(gt_triplets, pred_triplets,
     # The rows correspond to GT triplets, columns to pred triplets
     keeps = intersect_2d(np.column_stack((gt_triplets[:, 0:1], gt_triplets[:, 2:3])),
                          np.column_stack((pred_triplets[:, 0:1], pred_triplets[:, 2:3])))
-    gt_has_match = keeps.any(1)
-    pred_to_gt = [[] for x in range(pred_boxes.shape[0])]
-    for gt_ind, gt_box, keep_inds in zip(np.where(gt_has_match)[0],
-                                         gt_boxes[gt_has_match],
-                                         keeps[gt_has_match],
-                                         ):
-        boxes = pred_boxes[keep_inds]
-        if phrdet:
-            # Evaluate where the union box > 0.5
-            gt_box_union = gt_box.reshape((2, 4))
-            gt_box_union = np.concatenate((gt_box_union.min(0)[:2], gt_box_union.max(0)[2:]), 0)
-
-            box_union = boxes.reshape((-1, 2, 4))
-            box_union = np.concatenate((box_union.min(1)[:, :2], box_union.max(1)[:, 2:]), 1)
-
-            inds = bbox_overlaps(gt_box_union[None], box_union).numpy()[0] >= iou_thrs
-
-        else:
-            sub_iou = bbox_overlaps(gt_box[None, :4], boxes[:, :4]).numpy()[0]
-            obj_iou = bbox_overlaps(gt_box[None, 4:], boxes[:, 4:]).numpy()[0]
-
-            inds = (sub_iou >= iou_thrs) & (obj_iou >= iou_thrs)
-
-        for i in np.where(keep_inds)[0][inds]:
-            pred_to_gt[i].append(int(gt_ind))
-    return pred_to_gt
\ No newline at end of file
+    return _match_triplet_boxes(keeps, gt_boxes, pred_boxes, iou_thrs, phrdet)
@@ -1,7 +1,15 @@
 from .dist_utils import DistOptimizerHook, allreduce_grads
-from .misc import multi_apply, tensor2imgs, unmap, enumerate_by_image
+from .misc import (multi_apply, tensor2imgs, unmap, enumerate_by_image, region_fill_index,
+                   relmap_triplets, densify_relmap)
+from .feature_cache import (FeatureCache, FeatureCacheWriter, cache_key,
+                            cache_image_values, check_cache_entry)
+from .integral_image import (integral_image, box_sum, box_mean, box_max,
+                             pair_union_boxes)
 
 __all__ = [
     'allreduce_grads', 'DistOptimizerHook', 'tensor2imgs', 'unmap',
-    'multi_apply', 'enumerate_by_image'
+    'multi_apply', 'enumerate_by_image', 'region_fill_index', 'FeatureCache',
+    'FeatureCacheWriter', 'cache_key', 'cache_image_values', 'check_cache_entry',
+    'relmap_triplets', 'densify_relmap',
+    'integral_image', 'box_sum', 'box_mean', 'box_max', 'pair_union_boxes'
 ]
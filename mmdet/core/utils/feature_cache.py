@@ -0,0 +1,152 @@
+import os
+import os.path as osp
+import pickle
+
+import mmcv
+import numpy as np
+
+
+def cache_key(img_meta):
+    """The image id (file name without extension), with the flip state since the
+    cached features depend on the augmentation."""
+    key = osp.splitext(osp.basename(img_meta['filename']))[0]
+    if img_meta.get('flip', False):
+        key += '_flip'
+    return key
+
+
+def cache_image_values(img_meta):
+    """The preprocessing of the image that the cached features depend on. They are
+    stored with the features and compared with the image metas when reading, since the
+    key does not tell a different scale or config."""
+    return dict(img_shape=np.array(img_meta['img_shape'][:2], dtype=np.int64),
+                scale_factor=np.array(img_meta['scale_factor'], dtype=np.float32).reshape(-1))
+
+
+def check_cache_entry(entry, img_meta, key):
+    """Raise ValueError if a cached entry was written for another preprocessing of the image."""
+    for name, value in cache_image_values(img_meta).items():
+        if name not in entry:
+            raise ValueError('The cached entry {} has no {}, rewrite the cache with '
+                             'tools/cache_detector_results.py'.format(key, name))
+        cached = np.asarray(entry[name])
+        if cached.shape != value.shape or not np.allclose(cached, value):
+            raise ValueError('The cached entry {} has {}={}, but the image has {}: the cache is '
+                             'written with another scale or config'.format(key, name, cached.tolist(),
+                                                                           value.tolist()))
+
+
+class FeatureCacheWriter(object):
+    """Append-only writer of a sharded, memory-mappable store.
+
+    Every entry is a dict of named values. The numpy arrays are written as raw
+    bytes so that they can be memory-mapped when reading, other values (e.g., the
+    ragged mask results) are pickled. A shard is closed when it grows over
+    `shard_size` bytes; writers with different `prefix` (e.g., one per process)
+    can fill the same root concurrently.
+
+    Layout: root/{prefix}_{shard:04d}.bin holds the bytes and
+    root/{prefix}_{shard:04d}.idx.pkl maps key -> {name: (offset, dtype, shape)}.
+    """
+
+    def __init__(self, root, prefix='shard', shard_size=4 * 1024 ** 3, meta=None):
+        mmcv.mkdir_or_exist(root)
+        self.root = root
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard_id = -1
+        self.data_file = None
+        self.index = None
+        if meta is not None:
+            mmcv.dump(meta, osp.join(root, 'meta.pkl'))
+        self._next_shard()
+
+    def _shard_name(self, shard_id):
+        return osp.join(self.root, '{}_{:04d}'.format(self.prefix, shard_id))
+
+    def _flush_index(self):
+        with open(self._shard_name(self.shard_id) + '.idx.pkl', 'wb') as f:
+            pickle.dump(self.index, f)
+
+    def _next_shard(self):
+        if self.data_file is not None:
+            self.data_file.close()
+            self._flush_index()
+        self.shard_id += 1
+        self.data_file = open(self._shard_name(self.shard_id) + '.bin', 'wb')
+        self.offset = 0
+        self.index = dict()
+
+    def put(self, key, values):
+        if self.offset >= self.shard_size:
+            self._next_shard()
+        entry = dict()
+        for name, value in values.items():
+            if value is None:
+                continue
+            if isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value)
+                entry[name] = (self.offset, value.dtype.str, value.shape)
+                buf = value.tobytes()
+            else:
+                buf = pickle.dumps(value)
+                entry[name] = (self.offset, 'pickle', (len(buf),))
+            self.data_file.write(buf)
+            self.offset += len(buf)
+        self.index[key] = entry
+
+    def close(self):
+        self.data_file.close()
+        self._flush_index()
+        self.data_file = None
+
+
+class FeatureCache(object):
+    """Read-only view of a store written by :class:`FeatureCacheWriter`.
+
+    The shards are memory-mapped lazily, so only the pages of the requested
+    entries are read from the disk.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        meta_file = osp.join(root, 'meta.pkl')
+        self.meta = mmcv.load(meta_file) if osp.exists(meta_file) else dict()
+        self.index = dict()
+        self.shards = []
+        for idx_file in sorted(f for f in os.listdir(root) if f.endswith('.idx.pkl')):
+            with open(osp.join(root, idx_file), 'rb') as f:
+                shard_index = pickle.load(f)
+            shard_id = len(self.shards)
+            self.shards.append(osp.join(root, idx_file[:-len('.idx.pkl')] + '.bin'))
+            self.index.update({key: (shard_id, entry) for key, entry in shard_index.items()})
+        self._maps = dict()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def _map(self, shard_id):
+        if shard_id not in self._maps:
+            # an empty shard can not be memory-mapped
+            if osp.getsize(self.shards[shard_id]) == 0:
+                self._maps[shard_id] = np.zeros(0, dtype=np.uint8)
+            else:
+                self._maps[shard_id] = np.memmap(self.shards[shard_id], dtype=np.uint8, mode='r')
+        return self._maps[shard_id]
+
+    def get(self, key):
+        """Return the dict of the entry: the arrays are read-only memory-mapped views."""
+        shard_id, entry = self.index[key]
+        data = self._map(shard_id)
+        values = dict()
+        for name, (offset, dtype, shape) in entry.items():
+            if dtype == 'pickle':
+                values[name] = pickle.loads(data[offset:offset + shape[0]].tobytes())
+            else:
+                dtype = np.dtype(dtype)
+                nbytes = int(np.prod(shape)) * dtype.itemsize
+                values[name] = data[offset:offset + nbytes].view(dtype).reshape(shape)
+        return values
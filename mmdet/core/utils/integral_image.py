@@ -0,0 +1,159 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def _to_tensor(x):
+    if isinstance(x, torch.Tensor):
+        return x, False
+    elif isinstance(x, np.ndarray):
+        return torch.from_numpy(x), True
+    raise TypeError(
+        'expected a Tensor or numpy array, but got {}'.format(type(x)))
+
+
+def integral_image(maps):
+    """Summed-area table of maps (e.g., saliency maps).
+
+    Args:
+        maps (Tensor | ndarray): (h, w) or (n, h, w) maps, any dtype.
+
+    Returns:
+        Tensor | ndarray: (..., h + 1, w + 1) float64 table, where
+            table[..., y, x] is the sum of maps[..., :y, :x].
+    """
+    maps_th, is_numpy = _to_tensor(maps)
+    table = F.pad(maps_th.double().cumsum(-1).cumsum(-2), (1, 0, 1, 0))
+    return table.numpy() if is_numpy else table
+
+
+def _box_corners(boxes, size):
+    """Map index (or None) and the inclusive integer corners of the boxes,
+    clipped inside a map of the given (h, w)."""
+    h, w = size
+    boxes = boxes.long()
+    inds = None
+    if boxes.size(-1) == 5:
+        inds, boxes = boxes[..., 0], boxes[..., 1:]
+    x1 = boxes[..., 0].clamp(min=0, max=w - 1)
+    y1 = boxes[..., 1].clamp(min=0, max=h - 1)
+    x2 = boxes[..., 2].clamp(min=0, max=w - 1)
+    y2 = boxes[..., 3].clamp(min=0, max=h - 1)
+    return inds, x1, y1, x2, y2
+
+
+def _box_sum_area(table, boxes):
+    table, is_numpy = _to_tensor(table)
+    boxes, _ = _to_tensor(boxes)
+    inds, x1, y1, x2, y2 = _box_corners(
+        boxes.to(table.device), (table.size(-2) - 1, table.size(-1) - 1))
+    if inds is None and table.dim() != 2:
+        raise ValueError('boxes of a batch of maps need the map index in '
+                         'the first of 5 columns')
+
+    def corner(y, x):
+        return table[y, x] if inds is None else table[inds, y, x]
+
+    sums = (corner(y2 + 1, x2 + 1) - corner(y1, x2 + 1) -
+            corner(y2 + 1, x1) + corner(y1, x1))
+    areas = ((x2 - x1 + 1).clamp(min=0) *
+             (y2 - y1 + 1).clamp(min=0)).double()
+    # the corners of an empty box (x1 > x2 or y1 > y2) do not cancel out
+    sums = torch.where(areas > 0, sums, sums.new_zeros(()))
+    return sums, areas, is_numpy
+
+
+def box_sum(table, boxes):
+    """Sum of the maps inside the boxes, O(1) per box.
+
+    Args:
+        table (Tensor | ndarray): (h + 1, w + 1) or (n, h + 1, w + 1) table
+            given by :func:`integral_image`.
+        boxes (Tensor | ndarray): (..., 4) boxes (x1, y1, x2, y2) with
+            inclusive integer pixel bounds (truncated if not integers), or
+            (..., 5) with the index of the map in the first column, as rois.
+            The boxes are clipped inside the maps.
+
+    Returns:
+        Tensor | ndarray: (...) float64 sums, 0 for the empty boxes.
+    """
+    sums, _, is_numpy = _box_sum_area(table, boxes)
+    return sums.numpy() if is_numpy else sums
+
+
+def box_mean(table, boxes):
+    """Mean of the maps inside the boxes, O(1) per box.
+
+    It equals ``maps[y1:y2 + 1, x1:x2 + 1].mean()`` of the clipped boxes (nan
+    for the empty boxes), the arguments are as :func:`box_sum`.
+    """
+    sums, areas, is_numpy = _box_sum_area(table, boxes)
+    means = sums / areas
+    return means.numpy() if is_numpy else means
+
+
+def box_max(maps, boxes, chunk_size=16):
+    """Max of the maps inside the boxes.
+
+    The max has no summed-area table: the boxes are masked on the maps,
+    `chunk_size` boxes at once, which bounds the memory to
+    chunk_size * h * w values.
+
+    Args:
+        maps (Tensor | ndarray): (h, w) or (n, h, w) maps (not the tables).
+        boxes (Tensor | ndarray): as :func:`box_sum`.
+
+    Returns:
+        Tensor | ndarray: (...) maxima, -inf for the empty boxes.
+    """
+    maps, is_numpy = _to_tensor(maps)
+    boxes, _ = _to_tensor(boxes)
+    if not maps.is_floating_point():
+        maps = maps.float()
+    inds, x1, y1, x2, y2 = _box_corners(boxes.to(maps.device),
+                                        maps.shape[-2:])
+    if inds is None and maps.dim() != 2:
+        raise ValueError('boxes of a batch of maps need the map index in '
+                         'the first of 5 columns')
+    shape = boxes.shape[:-1]
+    x1, y1, x2, y2 = [v.reshape(-1) for v in (x1, y1, x2, y2)]
+    inds = inds.reshape(-1) if inds is not None else None
+    ys = torch.arange(maps.size(-2), device=maps.device)
+    xs = torch.arange(maps.size(-1), device=maps.device)
+    maxima = []
+    for start in range(0, x1.numel(), chunk_size):
+        end = min(start + chunk_size, x1.numel())
+        in_y = (ys >= y1[start:end, None]) & (ys <= y2[start:end, None])
+        in_x = (xs >= x1[start:end, None]) & (xs <= x2[start:end, None])
+        inside = in_y[:, :, None] & in_x[:, None, :]
+        chunk_maps = maps[inds[start:end]] if inds is not None else maps
+        masked = torch.where(inside, chunk_maps,
+                             chunk_maps.new_tensor(float('-inf')))
+        maxima.append(masked.view(end - start, -1).max(1)[0])
+    maxima = torch.cat(maxima) if maxima else maps.new_zeros((0, ))
+    maxima = maxima.view(shape)
+    return maxima.numpy() if is_numpy else maxima
+
+
+def pair_union_boxes(boxes, pair_idx):
+    """Union boxes of the (subject, object) pairs.
+
+    Args:
+        boxes (Tensor | ndarray): (n, 4) boxes, or (n, 5) with the map index
+            in the first column.
+        pair_idx (Tensor | ndarray): (m, 2) indices in boxes.
+
+    Returns:
+        Tensor | ndarray: (m, 4) or (m, 5) union boxes.
+    """
+    boxes, is_numpy = _to_tensor(boxes)
+    pair_idx, _ = _to_tensor(pair_idx)
+    pair_idx = pair_idx.long().to(boxes.device)
+    start = boxes.size(1) - 4
+    sub_boxes, obj_boxes = boxes[pair_idx[:, 0]], boxes[pair_idx[:, 1]]
+    unions = torch.cat(
+        (sub_boxes[:, :start],
+         torch.min(sub_boxes[:, start:start + 2],
+                   obj_boxes[:, start:start + 2]),
+         torch.max(sub_boxes[:, start + 2:], obj_boxes[:, start + 2:])), 1)
+    return unions.numpy() if is_numpy else unions
@@ -1,7 +1,9 @@
+import random
 from functools import partial
 
 import mmcv
 import numpy as np
+import torch
 from six.moves import map, zip
 
 
@@ -37,6 +39,97 @@ def unmap(data, count, inds, fill=0):
     return ret
 
 
+def region_fill_index(x1, y1, x2, y2, featmap_size, chunk_size=64):
+    """Index of the last region that covers each location of a feature map.
+
+    It is the vectorized form of painting the regions one by one with
+    ``target[y1:y2 + 1, x1:x2 + 1] = i``, where the later regions overwrite
+    the earlier ones. A region with x1 > x2 or y1 > y2 is empty.
+
+    Args:
+        x1, y1, x2, y2 (Tensor): Inclusive integer bounds of shape (..., n).
+        featmap_size (tuple): (h, w) of the feature map.
+        chunk_size (int): Number of regions processed at once, bounding the
+            memory to chunk_size * h * w. The regions that are empty in all
+            the leading dims are skipped.
+
+    Returns:
+        Tensor: shape (..., h, w), the region index or -1 if not covered.
+    """
+    h, w = featmap_size
+    device = x1.device
+    ys = torch.arange(h, device=device)
+    xs = torch.arange(w, device=device)
+    last = torch.full(
+        x1.shape[:-1] + (h, w), -1, dtype=torch.long, device=device)
+    if x1.size(-1) == 0:  # no region, e.g., an image without boxes
+        return last
+    non_empty = ((x1 <= x2) & (y1 <= y2)).reshape(-1, x1.size(-1)).any(0)
+    keep = non_empty.nonzero().view(-1)
+    x1, y1, x2, y2 = [v.index_select(-1, keep) for v in (x1, y1, x2, y2)]
+    for start in range(0, keep.numel(), chunk_size):
+        end = min(start + chunk_size, keep.numel())
+        in_y = ((ys >= y1[..., start:end, None]) &
+                (ys <= y2[..., start:end, None]))
+        in_x = ((xs >= x1[..., start:end, None]) &
+                (xs <= x2[..., start:end, None]))
+        # index + 1 inside the row / column span of the region and 0 outside,
+        # so the min of the two is index + 1 where the region covers
+        order = keep[start:end, None] + 1
+        row_idx = in_y.long() * order
+        col_idx = in_x.long() * order
+        cover_idx = torch.min(row_idx[..., :, :, None],
+                              col_idx[..., :, None, :])
+        # the later region has the larger index: take the max of the covering
+        last = torch.max(last, cover_idx.max(-3)[0] - 1)
+    return last
+
+
+def relmap_triplets(rels, binary=False):
+    """Sparse form of the relation map of an image.
+
+    Instead of a dense num_box x num_box map, the related pairs are kept as
+    (subject, object, label) triplets sorted by pair. A pair with several
+    relations gets its label as when filling the dense map relation by
+    relation: a later relation replaces the label with probability 0.5.
+
+    The VG datasets give these triplets as the gt_relmaps of the images.
+    The relmaps returned by the relation heads are not triplets but dense
+    (num_obj, num_obj) maps, symmetric and 0/1, of the det pairs related by
+    the sampler (training).
+
+    Args:
+        rels (ndarray): (num_rels, >=3) relations, (subject, object, label)
+            in the first 3 columns.
+        binary (bool): Use 1 as the label of all related pairs.
+
+    Returns:
+        ndarray: (num_pairs, 3) int64 triplets.
+    """
+    pair_labels = dict()
+    for rel in rels:
+        pair = (int(rel[0]), int(rel[1]))
+        if binary:
+            pair_labels[pair] = 1
+        elif pair not in pair_labels or random.random() > 0.5:
+            pair_labels[pair] = int(rel[2])
+    triplets = [pair + (label, ) for pair, label in sorted(pair_labels.items())]
+    return np.array(triplets, dtype=np.int64).reshape(-1, 3)
+
+
+def densify_relmap(relmap, num_obj):
+    """Dense (num_obj, num_obj) relation map of the triplets given by
+    :func:`relmap_triplets`, built on the device of the triplets.
+
+    It is the map formerly given as gt_relmaps by the VG datasets, with the
+    label of each related pair and 0 elsewhere.
+    """
+    dense = relmap.new_zeros((num_obj, num_obj))
+    if relmap.numel() > 0:
+        dense[relmap[:, 0], relmap[:, 1]] = relmap[:, 2]
+    return dense
+
+
 def enumerate_by_image(im_inds):
     im_inds_np = im_inds.cpu().numpy()
     initial_ind = int(im_inds_np[0])
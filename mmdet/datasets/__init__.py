@@ -3,7 +3,8 @@ from .cityscapes import CityscapesDataset
 from .coco import CocoDataset
 from .custom import CustomDataset
 from .dataset_wrappers import ConcatDataset, RepeatDataset
-from .loader import DistributedGroupSampler, GroupSampler, build_dataloader
+from .loader import (DataPrefetcher, DistributedGroupSampler, GroupSampler,
+                     build_dataloader)
 from .registry import DATASETS
 from .voc import VOCDataset
 from .wider_face import WIDERFaceDataset
@@ -25,7 +26,7 @@ from .saliency import SaliencyDataset
 __all__ = [
     'CustomDataset', 'XMLDataset', 'CocoDataset', 'VOCDataset',
     'CityscapesDataset', 'GroupSampler', 'DistributedGroupSampler',
-    'build_dataloader', 'ConcatDataset', 'RepeatDataset', 'WIDERFaceDataset',
+    'build_dataloader', 'DataPrefetcher', 'ConcatDataset', 'RepeatDataset', 'WIDERFaceDataset',
     'DATASETS', 'build_dataset',
 
     # newly added
@@ -111,14 +111,8 @@ class DemoDataset(Dataset):
 
         if self.depth_prefix is not None:
             depth_img = Image.open(osp.join(self.depth_prefix, filename[:-4] + '.png'))
-            # Preprocess loaded camera parameter and depth info
-            depth_pix = depth_img.load()
-            pix_depth = []
-            for ii in range(depth_img.size[1]):
-                pix_row = []
-                for jj in range(depth_img.size[0]):
-                    pix_row.append(depth_pix[jj, ii])
-                pix_depth.append(pix_row)
+            # Preprocess loaded camera parameter and depth info: (H, W) array, pix_depth[y][x]
+            pix_depth = np.asarray(depth_img)
         else:
             depth_img, pix_depth = None, None
 
@@ -30,7 +30,7 @@ from .coco import CocoDataset
 from .registry import DATASETS
 from .pipelines import Compose
 from mmdet.core.bbox.geometry import bbox_overlaps
-from mmdet.core import vg_evaluation
+from mmdet.core import vg_evaluation, relmap_triplets
 from mmdet.core.evaluation.relcaption_eval import relcaption_evaluation
 from mmdet.models.relation_heads.approaches import Result
 import torch
@@ -244,10 +244,8 @@ class GeneralizedVisualGenomeDataset(CocoDataset):
             gt_rel_ipt_scores = gt_rel_ipt_scores[keep_ids]
 
         # add relation to target
-        num_box = len(gt_bboxes)
-        relation_map = np.zeros((num_box, num_box), dtype=np.int64)
-        for i in range(gt_rels.shape[0]):
-            relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] = 1
+        # sparse (subject, object, 1) triplets, see relmap_triplets
+        relation_map = relmap_triplets(gt_rels, binary=True)
 
         ann = dict(
             bboxes=gt_bboxes,
@@ -1,4 +1,8 @@
 from .build_loader import build_dataloader
-from .sampler import DistributedGroupSampler, GroupSampler
+from .prefetcher import DataPrefetcher
+from .sampler import DistributedGroupSampler, GroupSampler, get_group_flag
 
-__all__ = ['GroupSampler', 'DistributedGroupSampler', 'build_dataloader']
+__all__ = [
+    'GroupSampler', 'DistributedGroupSampler', 'get_group_flag',
+    'build_dataloader', 'DataPrefetcher'
+]
@@ -7,7 +7,8 @@ from mmcv.parallel import collate
 from mmcv.runner import get_dist_info
 from torch.utils.data import DataLoader
 
-from .sampler import DistributedGroupSampler, DistributedSampler, GroupSampler
+from .sampler import (DistributedGroupSampler, DistributedSampler,
+                      GroupSampler, get_group_flag)
 
 if platform.system() != 'Windows':
     # https://github.com/pytorch/pytorch/issues/973
@@ -26,6 +27,7 @@ def build_dataloader(dataset,
                      dist=True,
                      shuffle=True,
                      seed=None,
+                     group_cfg=None,
                      **kwargs):
     """Build PyTorch DataLoader.
 
@@ -42,25 +44,32 @@ def build_dataloader(dataset,
         dist (bool): Distributed training/test or not. Default: True.
         shuffle (bool): Whether to shuffle the data at every epoch.
             Default: True.
+        group_cfg (dict, optional): Arguments of :func:`get_group_flag` to
+            group the batches by the aspect ratio and the number of objects
+            (or pairs) when shuffling, instead of the aspect ratio only.
         kwargs: any keyword argument to be used to initialize DataLoader
 
     Returns:
         DataLoader: A PyTorch dataloader.
     """
     rank, world_size = get_dist_info()
+    flag = None
+    if shuffle and group_cfg is not None:
+        flag = get_group_flag(dataset, **group_cfg)
     if dist:
         # DistributedGroupSampler will definitely shuffle the data to satisfy
         # that images on each GPU are in the same group
         if shuffle:
-            sampler = DistributedGroupSampler(dataset, imgs_per_gpu,
-                                              world_size, rank)
+            sampler = DistributedGroupSampler(
+                dataset, imgs_per_gpu, world_size, rank, flag=flag, seed=seed)
         else:
             sampler = DistributedSampler(
                 dataset, world_size, rank, shuffle=False)
         batch_size = imgs_per_gpu
         num_workers = workers_per_gpu
     else:
-        sampler = GroupSampler(dataset, imgs_per_gpu) if shuffle else None
+        sampler = GroupSampler(
+            dataset, imgs_per_gpu, flag=flag) if shuffle else None
         batch_size = num_gpus * imgs_per_gpu
         num_workers = num_gpus * workers_per_gpu
 
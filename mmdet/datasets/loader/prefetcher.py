@@ -0,0 +1,103 @@
+import copy
+
+import torch
+from mmcv.parallel import DataContainer
+
+
+class DataPrefetcher(object):
+    """Copy the next batch to the GPUs while the current one is computed.
+
+    The tensors of the DataContainers that are not cpu_only are pinned and
+    copied, on a side stream per device, to the GPU that MMDataParallel /
+    MMDistributedDataParallel would scatter them to. The structure of the
+    batch is kept, so the scatter of the model wrapper finds the tensors
+    already on their device and does not copy them again.
+
+    The other attributes (sampler, dataset, ...) are the ones of the wrapped
+    data loader, e.g., for DistSamplerSeedHook.
+
+    Args:
+        data_loader (DataLoader): The data loader to wrap.
+        device_ids (list[int]): The GPUs of the model wrapper.
+    """
+
+    def __init__(self, data_loader, device_ids):
+        self.data_loader = data_loader
+        self.device_ids = list(device_ids)
+        self.streams = [torch.cuda.Stream(device=d) for d in self.device_ids]
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __getattr__(self, name):
+        if name == 'data_loader':
+            raise AttributeError(name)
+        return getattr(self.data_loader, name)
+
+    def __iter__(self):
+        loader_iter = iter(self.data_loader)
+        next_batch = self._preload(loader_iter)
+        while next_batch is not None:
+            for device_id, stream in zip(self.device_ids, self.streams):
+                torch.cuda.current_stream(device_id).wait_stream(stream)
+            batch = next_batch
+            self._record_stream(batch)
+            next_batch = self._preload(loader_iter)
+            yield batch
+
+    def _preload(self, loader_iter):
+        try:
+            batch = next(loader_iter)
+        except StopIteration:
+            return None
+        return self._stage(batch)
+
+    def _stage(self, batch):
+        staged = dict()
+        for key, value in batch.items():
+            if isinstance(value, DataContainer) and not value.cpu_only:
+                # same split as the scatter of mmcv: one chunk per device
+                chunk_size = (len(value.data) - 1) // len(self.device_ids) + 1
+                data = []
+                for i, chunk in enumerate(value.data):
+                    idx = i // chunk_size
+                    with torch.cuda.device(self.device_ids[idx]), \
+                            torch.cuda.stream(self.streams[idx]):
+                        data.append(_to_device(chunk, self.device_ids[idx]))
+                value = copy.copy(value)
+                value._data = data
+            staged[key] = value
+        return staged
+
+    def _record_stream(self, batch):
+        for value in batch.values():
+            if isinstance(value, DataContainer) and not value.cpu_only:
+                _record_stream(value.data)
+
+
+def _to_device(obj, device_id):
+    if isinstance(obj, torch.Tensor):
+        if obj.is_cuda:
+            return obj
+        if not obj.is_pinned():
+            obj = obj.pin_memory()
+        return obj.cuda(device_id, non_blocking=True)
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_to_device(o, device_id) for o in obj)
+    elif isinstance(obj, dict):
+        return {k: _to_device(v, device_id) for k, v in obj.items()}
+    return obj
+
+
+def _record_stream(obj):
+    # the tensors are allocated on the side stream but used on the
+    # default one, the allocator must not reuse them too early.
+    if isinstance(obj, torch.Tensor):
+        if obj.is_cuda:
+            obj.record_stream(torch.cuda.current_stream(obj.device))
+    elif isinstance(obj, (list, tuple)):
+        for o in obj:
+            _record_stream(o)
+    elif isinstance(obj, dict):
+        for o in obj.values():
+            _record_stream(o)
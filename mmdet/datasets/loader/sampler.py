@@ -34,13 +34,57 @@ class DistributedSampler(_DistributedSampler):
         return iter(indices)
 
 
+def get_num_objects(dataset):
+    """Number of gt boxes of each image of the dataset."""
+    if hasattr(dataset, 'datasets'):  # ConcatDataset
+        return np.concatenate([get_num_objects(ds) for ds in dataset.datasets])
+    if hasattr(dataset, 'times'):  # RepeatDataset
+        return np.tile(get_num_objects(dataset.dataset), dataset.times)
+    if hasattr(dataset, 'gt_boxes'):  # the VG-style datasets keep all the boxes
+        return np.array([len(boxes) for boxes in dataset.gt_boxes],
+                        dtype=np.int64)
+    return np.array(
+        [len(dataset.get_ann_info(i)['bboxes']) for i in range(len(dataset))],
+        dtype=np.int64)
+
+
+def get_group_flag(dataset, count_bounds=(10, 20, 40), count_type='objects'):
+    """Group flag of the images by the aspect ratio and the cost of an image.
+
+    The cost of relation heads grows with the number of objects and candidate
+    pairs, so the images are further bucketed by them: the flag is
+    ``aspect_flag * (len(count_bounds) + 1) + count_bucket``, where
+    count_bucket is the index of the interval of count_bounds holding the
+    count. The group samplers draw every batch from one group.
+
+    Args:
+        dataset (Dataset): dataset with the aspect ratio `flag`.
+        count_bounds (Sequence[int]): increasing bucket boundaries.
+        count_type (str): 'objects' (number of gt boxes) or 'pairs' (number
+            of candidate pairs n * (n - 1)).
+
+    Returns:
+        ndarray: int64 flag of each image.
+    """
+    assert hasattr(dataset, 'flag')
+    assert count_type in ['objects', 'pairs']
+    counts = get_num_objects(dataset)
+    if count_type == 'pairs':
+        counts = counts * np.maximum(counts - 1, 0)
+    count_buckets = np.digitize(counts, np.asarray(count_bounds))
+    return (dataset.flag.astype(np.int64) * (len(count_bounds) + 1) +
+            count_buckets)
+
+
 class GroupSampler(Sampler):
 
-    def __init__(self, dataset, samples_per_gpu=1):
-        assert hasattr(dataset, 'flag')
+    def __init__(self, dataset, samples_per_gpu=1, flag=None):
+        if flag is None:
+            assert hasattr(dataset, 'flag')
+            flag = dataset.flag
         self.dataset = dataset
         self.samples_per_gpu = samples_per_gpu
-        self.flag = dataset.flag.astype(np.int64)
+        self.flag = flag.astype(np.int64)
         self.group_sizes = np.bincount(self.flag)
         self.num_samples = 0
         for i, size in enumerate(self.group_sizes):
@@ -88,13 +132,18 @@ class DistributedGroupSampler(Sampler):
         num_replicas (optional): Number of processes participating in
             distributed training.
         rank (optional): Rank of the current process within num_replicas.
+        flag (optional): Group of each image, default: the flag of dataset.
+        seed (optional): Added to the epoch to seed the shuffling, it must be
+            the same on all the processes.
     """
 
     def __init__(self,
                  dataset,
                  samples_per_gpu=1,
                  num_replicas=None,
-                 rank=None):
+                 rank=None,
+                 flag=None,
+                 seed=0):
         _rank, _num_replicas = get_dist_info()
         if num_replicas is None:
             num_replicas = _num_replicas
@@ -105,9 +154,12 @@ class DistributedGroupSampler(Sampler):
         self.num_replicas = num_replicas
         self.rank = rank
         self.epoch = 0
+        self.seed = seed if seed is not None else 0
 
-        assert hasattr(self.dataset, 'flag')
-        self.flag = self.dataset.flag
+        if flag is None:
+            assert hasattr(self.dataset, 'flag')
+            flag = self.dataset.flag
+        self.flag = flag.astype(np.int64)
         self.group_sizes = np.bincount(self.flag)
 
         self.num_samples = 0
@@ -120,7 +172,7 @@ class DistributedGroupSampler(Sampler):
     def __iter__(self):
         # deterministically shuffle based on epoch
         g = torch.Generator()
-        g.manual_seed(self.epoch)
+        g.manual_seed(self.epoch + self.seed)
 
         indices = []
         for i, size in enumerate(self.group_sizes):
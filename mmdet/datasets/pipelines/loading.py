@@ -162,6 +162,7 @@ class LoadAnnotations(object):
     def _load_rels(self, results):
         ann_info = results['ann_info']
         results['gt_rels'] = ann_info['rels']
+        # (num_pairs, 3) triplets, densify_relmap gives the num_box x num_box map
         results['gt_relmaps'] = ann_info['rel_maps']
 
         assert 'rel_fields' in results
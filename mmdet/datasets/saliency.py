@@ -9,16 +9,21 @@
 
 import logging
 import os
+import queue
+import threading
 import os.path as osp
 import tempfile
 import mmcv
 import numpy as np
 from collections import defaultdict, Counter
 import random
+import h5py
+from PIL import Image
 from torch.utils.data import Dataset
 from mmdet.utils import print_log
 from .registry import DATASETS
 from .pipelines import Compose
+from .visualgenome import BOX_SCALE
 
 import torch
 
@@ -85,3 +90,86 @@ class SaliencyDataset(Dataset):
         results = dict(img_info=img_info)
         self.pre_pipeline(results)
         return self.pipeline(results)
+
+
+class SaliencyMapWriter(object):
+    """Write the maps from a pool of threads: the PNG encodings run in parallel, the HDF5 rows
+    are written under a lock since h5py serializes the calls anyway.
+
+    Args:
+        out (str): the HDF5 file, created (or opened with resume) for num_imgs rows.
+        png_dir (str): directory of the PNG files, named as the images.
+    """
+
+    def __init__(self, num_imgs, out=None, png_dir=None, map_size=BOX_SCALE, compression='lzf', resume=False,
+                 num_threads=4, queue_size=64):
+        self.png_dir = png_dir
+        self.map_size = map_size
+        self.h5 = None
+        if out is not None:
+            self.h5 = h5py.File(out, 'a' if resume else 'w')
+            if 'images' not in self.h5:
+                compression = None if compression == 'none' else compression
+                self.h5.create_dataset('images', (num_imgs, map_size, map_size), dtype=np.uint8,
+                                       chunks=(1, map_size, map_size), compression=compression)
+                for name in ['image_heights', 'image_widths', 'original_heights', 'original_widths']:
+                    self.h5.create_dataset(name, (num_imgs, ), dtype=np.int32)
+                self.h5.create_dataset('valid', (num_imgs, ), dtype=np.uint8)
+            elif self.h5['images'].shape != (num_imgs, map_size, map_size):
+                raise ValueError('{} has {} maps, expected {}'.format(out, self.h5['images'].shape,
+                                                                   (num_imgs, map_size, map_size)))
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(queue_size)
+        self._errors = []
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def done_indices(self):
+        if self.h5 is None:
+            return set()
+        return set(np.nonzero(self.h5['valid'][:])[0].tolist())
+
+    def put(self, idx, filename, sal_map):
+        if self._errors:
+            raise RuntimeError('Writing the saliency maps failed:\n{}'.format(self._errors[0]))
+        self._queue.put((idx, filename, sal_map))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._errors:
+                continue  # drain the queue
+            try:
+                self.write(*item)
+            except Exception as e:
+                self._errors.append(repr(e))
+
+    def write(self, idx, filename, sal_map):
+        if self.png_dir is not None:
+            png_file = osp.join(self.png_dir, osp.splitext(filename)[0] + '.png')
+            mmcv.mkdir_or_exist(osp.dirname(png_file))
+            Image.fromarray(sal_map).save(png_file)
+        if self.h5 is not None:
+            h, w = sal_map.shape
+            scale = self.map_size / max(h, w)
+            map_h, map_w = min(int(round(h * scale)), self.map_size), min(int(round(w * scale)), self.map_size)
+            row = np.zeros((self.map_size, self.map_size), dtype=np.uint8)
+            row[:map_h, :map_w] = mmcv.imresize(sal_map, (map_w, map_h))
+            with self._lock:
+                self.h5['images'][idx] = row
+                self.h5['image_heights'][idx], self.h5['image_widths'][idx] = map_h, map_w
+                self.h5['original_heights'][idx], self.h5['original_widths'][idx] = h, w
+                self.h5['valid'][idx] = 1
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.h5 is not None:
+            self.h5.close()
+        if self._errors:
+            raise RuntimeError('Writing the saliency maps failed:\n{}'.format(self._errors[0]))
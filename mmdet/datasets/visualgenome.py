@@ -19,7 +19,6 @@ import json
 import pickle
 import h5py
 from collections import defaultdict, Counter
-import random
 
 from mmdet.core import eval_recalls
 from mmdet.utils import print_log
@@ -28,7 +27,7 @@ from .coco import CocoDataset
 from .registry import DATASETS
 from .pipelines import Compose
 from mmdet.core.bbox.geometry import bbox_overlaps
-from mmdet.core import vg_evaluation
+from mmdet.core import vg_evaluation, relmap_triplets
 from mmdet.models.relation_heads.approaches import Result
 import torch
 
@@ -231,15 +230,8 @@ class VisualGenomeDataset(CocoDataset):
                 gt_rels = np.array(all_rel_sets, dtype=np.int32)
 
         # add relation to target
-        num_box = len(gt_bboxes)
-        relation_map = np.zeros((num_box, num_box), dtype=np.int64)
-        for i in range(gt_rels.shape[0]):
-            # If already exists a relation?
-            if relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] > 0:
-                if random.random() > 0.5:
-                    relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] = int(gt_rels[i, 2])
-            else:
-                relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] = int(gt_rels[i, 2])
+        # sparse (subject, object, label) triplets, see relmap_triplets
+        relation_map = relmap_triplets(gt_rels)
 
         # NOTE: Data format here
         ann = dict(
@@ -19,7 +19,6 @@ import json
 import pickle
 import h5py
 from collections import defaultdict
-import random
 
 from mmdet.core import eval_recalls
 from mmdet.utils import print_log
@@ -27,7 +26,7 @@ from .visualgenome import VisualGenomeDataset, load_info, load_image_infos, get_
 from .registry import DATASETS
 from .pipelines import Compose
 from mmdet.core.bbox.geometry import bbox_overlaps
-from mmdet.core import vg_evaluation, vgkr_evaluation
+from mmdet.core import vg_evaluation, vgkr_evaluation, relmap_triplets
 from mmdet.models.relation_heads.approaches import Result
 import torch
 
@@ -231,14 +230,8 @@ class VisualGenomeKRDataset(VisualGenomeDataset):
                 gt_keyrels = np.array(new_keyrels, dtype=np.int32)
 
         # add relation to target
-        num_box = len(gt_bboxes)
-        relation_map = np.zeros((num_box, num_box), dtype=np.int64)
-        for i in range(gt_rels.shape[0]):
-            if relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] > 0:
-                if random.random() > 0.5:
-                    relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] = int(gt_rels[i, 2])
-            else:
-                relation_map[int(gt_rels[i, 0]), int(gt_rels[i, 1])] = int(gt_rels[i, 2])
+        # sparse (subject, object, label) triplets, see relmap_triplets
+        relation_map = relmap_triplets(gt_rels)
 
         ann = dict(
             bboxes=gt_bboxes,
@@ -9,6 +9,8 @@
 
 from .keyframe_extraction import KeyFrameChecker
 from .sg_handler import SceneGraphHandler
+from .stream_runner import StreamingSceneGraphRunner, SyntheticRGBDSequence
 from .visualization_tools import Visualization
 
-__all__ = ['KeyFrameChecker', 'SceneGraphHandler', 'Visualization']
\ No newline at end of file
+__all__ = ['KeyFrameChecker', 'SceneGraphHandler', 'StreamingSceneGraphRunner', 'SyntheticRGBDSequence',
+           'Visualization']
\ No newline at end of file
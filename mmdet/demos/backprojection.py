@@ -0,0 +1,89 @@
+# ---------------------------------------------------------------
+# backprojection.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+from functools import lru_cache
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+@lru_cache(maxsize=8)
+def pixel_grid(height, width):
+    """The homogeneous pixel coordinates [x, y, 1] of an image, (height, width, 3).
+
+    Built once per image size, the returned array is read-only.
+    """
+    xs, ys = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    grid = np.stack((xs, ys, np.ones_like(xs)), axis=-1)
+    grid.setflags(write=False)
+    return grid
+
+
+def backproject_depth(depth, inv_p_matrix, camera_pose):
+    """Back-project the whole depth map to the world coordinates as array ops.
+
+    Same as the per pixel computation of the demo:
+        X_cam = depth[y, x] * (inv_p_matrix * [x, y, 1]^T)[:3]
+        X_world = (camera_pose * [X_cam, 1]^T)[:3]
+
+    Args:
+        depth (ndarray | list): (H, W) depth map.
+        inv_p_matrix (ndarray): (4, 3) or (3, 3) pseudo-inverse of the color intrinsics.
+        camera_pose (ndarray): (4, 4) camera to world transform.
+
+    Returns:
+        ndarray: (H, W, 3) world points of the pixels.
+    """
+    depth = np.asarray(depth, dtype=np.float64)
+    height, width = depth.shape
+    inv_p_matrix = np.asarray(inv_p_matrix, dtype=np.float64)[:3]
+    camera_pose = np.asarray(camera_pose, dtype=np.float64)
+    cam_pts = np.matmul(pixel_grid(height, width), inv_p_matrix.T) * depth[..., None]
+    return np.matmul(cam_pts, camera_pose[:3, :3].T) + camera_pose[:3, 3]
+
+
+def window_points(world_pts, window, noise_range=10.0):
+    """The world points of a pixel window, without the noisy ones.
+
+    The points are ordered column by column (x major), as the loops of the demo
+    appended them. A point is noisy when all its coordinates are within
+    (-noise_range, noise_range), i.e., it comes from a missing (zero) depth.
+
+    Args:
+        world_pts (ndarray): (H, W, 3) output of :func:`backproject_depth`.
+        window (tuple): (x_min, x_max, y_min, y_max), max excluded.
+
+    Returns:
+        ndarray: (N, 3) points.
+    """
+    x_min, x_max, y_min, y_max = window
+    pts = world_pts[max(y_min, 0):max(y_max, 0), max(x_min, 0):max(x_max, 0)]
+    pts = pts.transpose(1, 0, 2).reshape(-1, 3)
+    noisy = np.all(np.abs(pts) < noise_range, axis=1)
+    return pts[~noisy]
+
+
+def statistical_outlier_filter(points, mean_k=10, std_mul=1.0):
+    """Vectorized statistical outlier removal, as the filter of pcl.
+
+    A point is removed when its mean distance to its `mean_k` nearest neighbors is
+    larger than the mean of these distances over the cloud plus `std_mul` times
+    their standard deviation.
+
+    Args:
+        points (ndarray): (N, 3) points.
+
+    Returns:
+        ndarray: (M, 3) the kept points, in their input order.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    k = min(mean_k, len(points) - 1)
+    if k < 1:
+        return points
+    # the nearest neighbor of every point is itself
+    dists, _ = cKDTree(points).query(points, k=k + 1)
+    mean_dists = dists[:, 1:].mean(axis=1)
+    threshold = mean_dists.mean() + std_mul * mean_dists.std(ddof=1)
+    return points[mean_dists <= threshold]
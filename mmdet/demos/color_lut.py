@@ -0,0 +1,94 @@
+# ---------------------------------------------------------------
+# color_lut.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+import os
+import os.path as osp
+
+import numpy as np
+import webcolors
+
+
+class ColorNameLUT(object):
+    """Lookup table from quantized RGB colors to the closest CSS3 color names.
+
+    The name of a color is the one of FindObjectClassColor.get_colour_name: the
+    exact CSS3 name, or the closest one (squared RGB distance, the last one of
+    the CSS3 table on ties). With `bits=8` the table is exact, fewer bits use the
+    color at the center of each bin.
+
+    The table is built on the first use and cached to `cache_dir`, the cache is
+    rebuilt when the CSS3 table of webcolors changes.
+
+    Args:
+        bits (int): bits per channel of the quantized colors.
+        cache_dir (str): directory of the cached table, not cached if None.
+    """
+
+    def __init__(self, bits=8, cache_dir=osp.join(osp.expanduser('~'), '.cache', 'mmdet')):
+        self.bits = bits
+        self.cache_file = None if cache_dir is None else osp.join(cache_dir, 'css3_lut_{}bits.npz'.format(bits))
+        items = list(webcolors.CSS3_HEX_TO_NAMES.items())
+        self.names = np.array([name for _, name in items])
+        self.rgbs = np.array([webcolors.hex_to_rgb(key) for key, _ in items], dtype=np.int64)
+        self._lut = None
+
+    @property
+    def lut(self):
+        if self._lut is None:
+            self._lut = self._load()
+            if self._lut is None:
+                self._lut = self._build()
+                self._save(self._lut)
+        return self._lut
+
+    def _load(self):
+        if self.cache_file is None or not osp.exists(self.cache_file):
+            return None
+        try:
+            cache = np.load(self.cache_file)
+            if np.array_equal(cache['names'], self.names) and np.array_equal(cache['rgbs'], self.rgbs):
+                return cache['lut']
+        except (IOError, ValueError, KeyError):
+            pass
+        return None
+
+    def _save(self, lut):
+        if self.cache_file is None:
+            return
+        try:
+            os.makedirs(osp.dirname(self.cache_file), exist_ok=True)
+            # write then rename, concurrent readers never see a partial file
+            tmp_file = '{}.{}.tmp.npz'.format(self.cache_file[:-4], os.getpid())
+            np.savez(tmp_file, lut=lut, names=self.names, rgbs=self.rgbs)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+    def _build(self):
+        levels = np.arange(2 ** self.bits, dtype=np.int64) << (8 - self.bits)
+        levels += (1 << (8 - self.bits)) >> 1  # center of the bins
+        gb = np.stack(np.meshgrid(levels, levels, indexing='ij'), axis=-1).reshape(-1, 2)
+        # argmin returns the first minimum: search the reversed table for the last one
+        rgbs = self.rgbs[::-1]
+        # |c - t|^2 = |c|^2 - 2 c.t + |t|^2, |c|^2 does not change the argmin
+        gb_cross = np.dot(gb, rgbs[:, 1:].T) * -2 + (rgbs ** 2).sum(axis=1)
+        lut = np.empty((len(levels), len(gb)), dtype=np.uint8)
+        for i, r in enumerate(levels):
+            lut[i] = np.argmin(gb_cross - 2 * r * rgbs[:, 0], axis=1)
+        return (len(rgbs) - 1 - lut).reshape(-1)
+
+    def indices(self, rgb):
+        """The indices in `names` of the (..., 3) uint8 RGB colors."""
+        rgb = np.asarray(rgb, dtype=np.uint8).astype(np.int64) >> (8 - self.bits)
+        return self.lut[(rgb[..., 0] << (2 * self.bits)) | (rgb[..., 1] << self.bits) | rgb[..., 2]]
+
+    def histogram(self, rgb):
+        """Color name histogram of the RGB pixels, as CompareObjects.get_color_hist.
+
+        Returns:
+            list: [[num_pixels1, color1], ...], sorted by decreasing counts (and names).
+        """
+        counts = np.bincount(self.indices(rgb).reshape(-1), minlength=len(self.names))
+        return sorted([[int(counts[i]), str(self.names[i])] for i in np.flatnonzero(counts)], reverse=True)
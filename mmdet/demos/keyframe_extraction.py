@@ -12,53 +12,75 @@ import os.path as osp
 import cv2
 import math
 import time
+from .backprojection import pixel_grid
 
 
 def blurryness(image):
     return cv2.Laplacian(image, cv2.CV_64F).var()
 
 
-def calculate_overlap(depth_org, rel_pose, intrinsic_org, pixel_coordinates, num_coordinate_samples=1000):
+def downsample_depth(depth_org, intrinsic_org, scale=0.1):
+    """
+        Description
+            - Resize the depth map and scale the intrinsic accordingly, once per frame
+
+        Return
+            - depth, intrinsic: the resized depth map and its 3 x 3 intrinsic
+    """
+    intrinsic = np.array(intrinsic_org, dtype=float)[:3, :3]
+    if scale == 1:
+        return depth_org, intrinsic
+    intrinsic[0] *= scale
+    intrinsic[1] *= scale
+    depth = cv2.resize(depth_org, None, fx=scale, fy=scale)
+    return depth, intrinsic
+
+
+def calculate_overlap(depth_org, rel_pose, intrinsic_org, pixel_coordinates=None, num_coordinate_samples=None,
+                      scale=0.1):
     """
         Description
             - Calculate overlap between two images based on projection
             - Projection of img2 to img1
                 - p' = K * T_21 * depth * K^(-1) * p
+            - All the pixels are projected at once with matrix products
 
         Parameter
             - depth: information on depth image
             - pose: relative pose to the reference image
             - intrinsic: camera intrinsic
+            - pixel_coordinates: 3 x N homogeneous pixel grid (x, y, 1) of the resized depth, built if None
+            - num_coordinate_samples: project only an evenly strided subset of the pixels, all if None
+            - scale: resize ratio of the depth map, 1 if it is already resized by downsample_depth
 
         Return
             - amount_overlap: estimated amount of overlap in percentage
 
     """
 
-    ## Pixel coordinates (p in the above eq.)
-    intrinsic = np.copy(intrinsic_org)
-    x_ratio = 0.1
-    y_ratio = 0.1
-    intrinsic[0] *= x_ratio
-    intrinsic[1] *= y_ratio
-    depth = cv2.resize(depth_org, None, fx=x_ratio, fy=y_ratio)
+    depth, intrinsic = downsample_depth(depth_org, intrinsic_org, scale)
     height, width = depth.shape
 
+    ## Pixel coordinates (p in the above eq.)
+    if pixel_coordinates is None or pixel_coordinates.shape[1] != height * width:
+        pixel_coordinates = pixel_grid(height, width).reshape(-1, 3).T
+    depth = depth.reshape(-1).astype(float)
+    if num_coordinate_samples is not None and num_coordinate_samples < len(depth):
+        samples = np.linspace(0, len(depth) - 1, num_coordinate_samples).astype(np.int64)
+        pixel_coordinates, depth = pixel_coordinates[:, samples], depth[samples]
+
     ## Calculate the amount of the overlapping area
-    num_total = height * width
-    num_overlap = 0
-
-    for i in range(height):  # y-direction
-        for j in range(width):  # x-direction
-            temp = np.dot(np.linalg.inv(intrinsic), np.array([j, i, 1], dtype=float).reshape(3, 1))  # temp = (X, Y, 1)
-            temp = (depth[i, j]) * temp  # temp = (X', Y', Z')
-            temp = np.dot(rel_pose, np.append(temp, [1]).reshape(4, 1))
-            temp = temp / float(temp[3] + 1e-10)
-            temp = np.dot(intrinsic, temp[:3])
-            temp = temp / float(temp[2] + 1e-10)
-            x, y = int(temp[0]), int(temp[1])
-            if x >= 0 and x < width and y >= 0 and y < height:
-                num_overlap += 1
+    num_total = len(depth)
+
+    points = np.dot(np.linalg.inv(intrinsic), pixel_coordinates) * depth  # (X', Y', Z')
+    points = np.dot(rel_pose, np.vstack((points, np.ones((1, num_total)))))
+    points = points / (points[3] + 1e-10)
+    points = np.dot(intrinsic, points[:3])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        points = points[:2] / (points[2] + 1e-10)
+    # int() truncates towards zero
+    x, y = np.trunc(points)
+    num_overlap = np.count_nonzero((x >= 0) & (x < width) & (y >= 0) & (y < height))
 
     overlapping_area = num_overlap / num_total
 
@@ -88,7 +110,8 @@ class KeyFrameChecker(object):
     def __init__(self, args,
                  intrinsic_depth=None,
                  depth_shape=(480, 640),
-                 num_coordinate_samples=1000,
+                 num_coordinate_samples=None,
+                 overlap_scale=0.1,
                  BLURRY_REJECTION_ONLY=False):
         self.args = args
         self.frame_num = 0
@@ -107,20 +130,22 @@ class KeyFrameChecker(object):
             self.thresh_anchor = args.thresh_anchor  # 0.68
             self.max_group_len = args.max_group_len  # 10
             self.depth_shape = depth_shape  # (480, 640)
-            pixel_coordinates = np.array(
-                [[x, y, 1] for x in np.arange(depth_shape[0]) for y in np.arange(depth_shape[1])])
-            self.pixel_coordinates = np.swapaxes(pixel_coordinates, 0, 1)
+            self.overlap_scale = overlap_scale
+            # the homogeneous grid of the resized depth maps, (3, h * w)
+            small_shape = cv2.resize(np.zeros(depth_shape, dtype='uint16'), None,
+                                     fx=overlap_scale, fy=overlap_scale).shape
+            self.pixel_coordinates = pixel_grid(*small_shape).reshape(-1, 3).T
             self.key_frame_groups, self.curr_key_frame_group = [], [0]
             self.num_cooridnate_samples = num_coordinate_samples
 
     def check_frame(self, img, depth, pose):
         if self.args.disable_keyframe: return True, 0.0, 0.0
+        curr_blurry = blurryness(img)
         if self.frame_num == 0:
-            self.average_of_blurryness = blurryness(img)
+            self.average_of_blurryness = curr_blurry
             self.key_pose, self.anchor_pose, = [pose] * 2
 
         # 1. reject blurry images
-        curr_blurry = blurryness(img)
         self.average_of_blurryness = self.alpha * self.average_of_blurryness + (1 - self.alpha) * curr_blurry
         threshold = self.blurry_gain * math.log(self.average_of_blurryness) + self.blurry_offset
         # threshold = self.blurry_gain * self.average_of_blurryness + self.blurry_offset
@@ -133,11 +158,13 @@ class KeyFrameChecker(object):
 
         # 3. calculate the ratio of the overlapping area
         depth = np.asarray(depth, dtype='uint16')
+        # resized once for both overlaps
+        depth, intrinsic = downsample_depth(depth, self.intrinsic_depth, self.overlap_scale)
 
-        overlap_with_key = calculate_overlap(depth, rel_pose_to_key, self.intrinsic_depth,
-                                             self.pixel_coordinates, self.num_cooridnate_samples)
-        overlap_with_anchor = calculate_overlap(depth, rel_pose_to_anchor, self.intrinsic_depth,
-                                                self.pixel_coordinates, self.num_cooridnate_samples)
+        overlap_with_key = calculate_overlap(depth, rel_pose_to_key, intrinsic,
+                                             self.pixel_coordinates, self.num_cooridnate_samples, scale=1)
+        overlap_with_anchor = calculate_overlap(depth, rel_pose_to_anchor, intrinsic,
+                                                self.pixel_coordinates, self.num_cooridnate_samples, scale=1)
 
         # 4. update anchor and key frames
         if overlap_with_anchor < self.thresh_anchor:
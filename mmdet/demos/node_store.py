@@ -0,0 +1,114 @@
+# ---------------------------------------------------------------
+# node_store.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+from collections import defaultdict
+
+import numpy as np
+
+# name: (dtype, shape of a row)
+_COLUMNS = [('class', np.int64, ()),
+            ('idx', np.int64, ()),
+            ('score', np.float64, ()),
+            ('bounding_box', np.float64, (4,)),
+            ('3d_pose', np.float64, (3,)),
+            ('mean', np.float64, (3,)),
+            ('var', np.float64, (3,)),
+            ('pt_num', np.int64, ()),
+            ('color_hist', object, ()),
+            ('detection_cnt', np.int64, ())]
+
+
+class NodeStore(object):
+    """Columnar store of the global 3D scene graph nodes.
+
+    Every field is a preallocated numpy array that doubles its capacity when it is
+    full, so appending a node is amortized O(1) and the matching of the new
+    detections is computed over whole columns: `store['mean']` is the (N, 3) view
+    of the centroids of the N nodes, `store[i]` the dict of the fields of node i.
+
+    With `voxel_size`, the centroids are also hashed to a voxel grid, and
+    :meth:`neighbors` only visits the voxels around the query point.
+    """
+
+    def __init__(self, capacity=256, voxel_size=None):
+        self.num = 0
+        self.columns = {name: np.zeros((capacity, ) + shape, dtype=dtype) for name, dtype, shape in _COLUMNS}
+        self.voxel_size = voxel_size
+        self.voxels = defaultdict(set)
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key][:self.num]
+        if not 0 <= key < self.num:
+            raise IndexError(key)
+        node = dict()
+        for name, value in self.columns.items():
+            value = value[key]
+            node[name] = value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+        return node
+
+    def _grow(self):
+        for name, value in self.columns.items():
+            grown = np.zeros((2 * len(value), ) + value.shape[1:], dtype=value.dtype)
+            grown[:self.num] = value[:self.num]
+            self.columns[name] = grown
+
+    def _voxel(self, idx):
+        return tuple(np.floor(self.columns['mean'][idx] / self.voxel_size).astype(np.int64).tolist())
+
+    def append(self, **fields):
+        """Add a node with the given fields, the missing ones are zeros, returns its index."""
+        if self.num == len(self.columns['class']):
+            self._grow()
+        idx = self.num
+        self.num += 1
+        self._set(idx, fields)
+        if self.voxel_size is not None:
+            self.voxels[self._voxel(idx)].add(idx)
+        return idx
+
+    def update(self, idx, **fields):
+        if not 0 <= idx < self.num:
+            raise IndexError(idx)
+        moved = self.voxel_size is not None and 'mean' in fields
+        if moved:
+            self.voxels[self._voxel(idx)].discard(idx)
+        self._set(idx, fields)
+        if moved:
+            self.voxels[self._voxel(idx)].add(idx)
+
+    def _set(self, idx, fields):
+        for name, value in fields.items():
+            self.columns[name][idx] = value
+
+    def neighbors(self, point, radius, limit=None):
+        """Indices of the nodes whose centroid is within `radius` of `point` on every axis.
+
+        Args:
+            point (list | ndarray): (3, ) query point.
+            radius (float): half size of the query cube.
+            limit (int, optional): only the nodes with a smaller index are returned.
+
+        Returns:
+            ndarray: the sorted indices.
+        """
+        limit = self.num if limit is None else min(limit, self.num)
+        point = np.asarray(point, dtype=np.float64)
+        if self.voxel_size is None or not np.isfinite(radius):
+            inds = np.arange(limit)
+        else:
+            low = np.floor((point - radius) / self.voxel_size).astype(np.int64)
+            high = np.floor((point + radius) / self.voxel_size).astype(np.int64)
+            inds = []
+            for x in range(low[0], high[0] + 1):
+                for y in range(low[1], high[1] + 1):
+                    for z in range(low[2], high[2] + 1):
+                        inds.extend(self.voxels.get((x, y, z), ()))
+            inds = np.array(sorted(i for i in inds if i < limit), dtype=np.int64)
+        dists = np.abs(self.columns['mean'][inds] - point).max(axis=1)
+        return inds[dists <= radius]
@@ -9,16 +9,16 @@
 import cv2
 import random
 import numpy as np
-from pandas import DataFrame, Series
+from pandas import DataFrame
 from graphviz import Digraph
-import torchtext  # 0. install torchtext==0.2.3 (pip install torchtext==0.2.3)
 import os.path as osp
 import os
 import mmcv
 from .visualization_tools import SameNodeDetection, FindObjectClassColor, \
     CompareObjects, BboxSizeResample, Visualization
+from .backprojection import backproject_depth, window_points, statistical_outlier_filter
+from .node_store import NodeStore
 
-fasttext = torchtext.vocab.FastText()
 _GRAY = (218, 227, 218)
 _GREEN = (18, 127, 15)
 _WHITE = (255, 255, 255)
@@ -39,14 +39,9 @@ class SceneGraphHandler(object):
         self.vocab_predicates = predicate_classes
         self.num_objects = len(self.vocab_objects) - 1
         self.num_predicates = len(self.vocab_predicates) - 1
-        self.data = DataFrame({"class": Series([], dtype='int'),
-                               "idx": Series([], dtype='int'),
-                               "score": [],  # check
-                               "bounding_box": [], "3d_pose": [], "mean": [],
-                               "var": [], "pt_num": [], "color_hist": [],
-                               "detection_cnt:": []},
-                              columns=['class', 'idx', 'score', 'bounding_box', '3d_pose', 'mean',
-                                       'var', 'pt_num', 'color_hist', 'detection_cnt'])
+        # the nodes are matched only with the nodes within match_radius on every axis, if given
+        self.match_radius = getattr(args, 'match_radius', None)
+        self.data = NodeStore(voxel_size=self.match_radius)
         self.rel_data = DataFrame({"relation": []}, index=[])
         self.covered_objects = []  # the global object id, maintain the least set of rels that cover objects
         self.nodeid2drawid = {}  # global draw id assignemt
@@ -86,6 +81,10 @@ class SceneGraphHandler(object):
         newly_inserted_nodes = []
         newly_inserted_rels = []
         global_num = len(self.data)
+        # the world points of all the pixels, computed once per frame (none without a depth map)
+        world_pts = None
+        if pix_depth is not None:
+            world_pts = backproject_depth(pix_depth, inv_p_matrix, camera_pose)
         for i, (obj_box, obj_label, obj_score) in enumerate(
                 zip(obj_boxes, obj_labels, obj_scores)):  # loop for bounding boxes on each images
             '''1. Get Color Histogram'''
@@ -102,23 +101,14 @@ class SceneGraphHandler(object):
             range_x_min, range_x_max, range_y_min, range_y_max = RBS.make_window_size(width, height, obj_box)
 
             '''3. Get 3D positions of the Centor Patch'''
-            window_3d_pts = []
-            for pt_x in range(range_x_min, range_x_max):
-                for pt_y in range(range_y_min, range_y_max):
-                    pose_2d_window = np.array([pt_x, pt_y, 1])[None]
-                    pose_3d_window = (pix_depth[pt_y][pt_x]) * np.matmul(inv_p_matrix, pose_2d_window.transpose())
-                    pose_3d = np.array([pose_3d_window.item(0), pose_3d_window.item(1), pose_3d_window.item(2), 1],
-                                       dtype='float')[None]
-                    pose_3d_world_coord_window = np.matmul(camera_pose, pose_3d.transpose())
-                    # pose_3d_world_coord_window = np.matmul(inv_R, pose_3d_window[0:3] - Trans.transpose())
-
-                    if not RBS.isNoisyPoint(pose_3d_world_coord_window):
-                        # save several points in window_box to calculate mean and variance
-                        window_3d_pts.append(
-                            [pose_3d_world_coord_window.item(0), pose_3d_world_coord_window.item(1),
-                             pose_3d_world_coord_window.item(2)])
-
-            window_3d_pts = RBS.outlier_filter(window_3d_pts)
+            # save the not noisy points in window_box to calculate mean and variance
+            if world_pts is not None:
+                window_3d_pts = window_points(world_pts, (range_x_min, range_x_max, range_y_min, range_y_max),
+                                              noise_range=RBS.range)
+                window_3d_pts = statistical_outlier_filter(window_3d_pts, RBS.mean_k, RBS.thres)
+            else:
+                # no 3D position: the object is filtered out below
+                window_3d_pts = np.zeros((0, 3), dtype=np.float32)
 
             '''4. Get a 3D position of the Center Patch's Center point'''
             # find 3D point of the bounding box(the center patch)'s center
@@ -132,7 +122,7 @@ class SceneGraphHandler(object):
             # get object class names as strings
             obj_name = self.vocab_objects[obj_label]
 
-            '''5. Save Object Recognition Results in DataFrame Format'''
+            '''5. Save Object Recognition Results in the Node Store'''
             if (self.img_count == 0):
                 # first image -> make new node
                 self.pt_num, self.mean, self.var, flag = TFCO.Measure_new_Gaussian_distribution(window_3d_pts)
@@ -141,38 +131,34 @@ class SceneGraphHandler(object):
                     continue
                 box_id = len(self.data)
                 # check
-                start_data = {"class": int(obj_label), "idx": int(box_id), "score": obj_score,
-                              "bounding_box": obj_box.tolist()[:-1],
-                              "3d_pose": [int(self.mean[0]), int(self.mean[1]), int(self.mean[2])],
-                              "mean": self.mean, "var": self.var, "pt_num": self.pt_num,
-                              "color_hist": color_hist, "detection_cnt": 1}
                 obj_box[4] = box_id
                 newly_inserted_nodes.append(len(self.data))
-                self.data.loc[len(self.data)] = start_data
+                self.data.append(**{"class": int(obj_label), "idx": int(box_id), "score": obj_score,
+                                    "bounding_box": obj_box.tolist()[:-1],
+                                    "3d_pose": [int(self.mean[0]), int(self.mean[1]), int(self.mean[2])],
+                                    "mean": self.mean, "var": self.var, "pt_num": self.pt_num,
+                                    "color_hist": color_hist, "detection_cnt": 1})
             else:
                 # get node similarity score: Only compare with the current nodes, not with the nodes detected on this frame
-                node_score, max_score_index = SND.node_update(window_3d_pts, self.data[:global_num], curr_mean, curr_var,
-                                                              obj_name, obj_scores[i], self.vocab_objects)
+                node_score, max_score_index = SND.node_update(window_3d_pts, self.data, curr_mean, curr_var,
+                                                              obj_name, obj_scores[i], self.vocab_objects,
+                                                              num_nodes=global_num, radius=self.match_radius)
 
                 # double check: the object class must be the same, it can be updated
                 if not self.disable_samenode and node_score > threshold \
-                        and self.data.at[max_score_index, "class"] == obj_label and max_score_index not in updated_nodes:
+                        and self.data['class'][max_score_index] == obj_label and max_score_index not in updated_nodes:
                     # change value of global_node
                     # change global_node[max_score_index]
                     print("node updated!!!")
                     updated_nodes.append(max_score_index)
-                    self.data.at[max_score_index, "score"] = obj_score
+                    node = self.data[max_score_index]
                     self.pt_num, self.mean, self.var = \
-                        TFCO.Measure_added_Gaussian_distribution(window_3d_pts, self.data.iloc[max_score_index]["mean"],
-                                                                 self.data.iloc[max_score_index]["var"],
-                                                                 self.data.iloc[max_score_index]["pt_num"],
-                                                                 len(window_3d_pts))
-                    self.data.at[max_score_index, "mean"] = self.mean
-                    self.data.at[max_score_index, "var"] = self.var
-                    self.data.at[max_score_index, "pt_num"] = self.pt_num
-                    self.data.at[max_score_index, "color_hist"] = color_hist
-                    self.data.at[max_score_index, "detection_cnt"] = self.data.iloc[max_score_index]["detection_cnt"] + 1
-                    box_id = self.data.iloc[max_score_index]["idx"]
+                        TFCO.Measure_added_Gaussian_distribution(window_3d_pts, node["mean"], node["var"],
+                                                                 node["pt_num"], len(window_3d_pts))
+                    self.data.update(max_score_index, score=obj_score, mean=self.mean, var=self.var,
+                                     pt_num=self.pt_num, color_hist=color_hist,
+                                     detection_cnt=node["detection_cnt"] + 1)
+                    box_id = node["idx"]
                     obj_box[4] = box_id
                 else:
                     # make new_node in global_node
@@ -183,11 +169,12 @@ class SceneGraphHandler(object):
                         continue
                     box_id = len(self.data)
                     obj_box[4] = box_id
-                    add_node_list = [int(obj_label), int(box_id), obj_score, obj_box.tolist()[:-1],
-                                     [self.mean[0], self.mean[1], self.mean[2]],
-                                     self.mean, self.var, self.pt_num, color_hist, 1]
                     newly_inserted_nodes.append(len(self.data))
-                    self.data.loc[len(self.data)] = add_node_list
+                    self.data.append(**{"class": int(obj_label), "idx": int(box_id), "score": obj_score,
+                                        "bounding_box": obj_box.tolist()[:-1],
+                                        "3d_pose": [self.mean[0], self.mean[1], self.mean[2]],
+                                        "mean": self.mean, "var": self.var, "pt_num": self.pt_num,
+                                        "color_hist": color_hist, "detection_cnt": 1})
 
             # if object index was changed, update relation's object index also
 
@@ -309,7 +296,7 @@ class SceneGraphHandler(object):
                 sg_json['id'] = self.img_count - 1
                 #nodeid2drawid = {}
                 for i in newly_inserted_nodes:
-                    node = self.data.iloc[i]
+                    node = self.data[i]
                     # only write the newly added
                     assign_id = self.newest_drawid
                     self.nodeid2drawid[node["idx"]] = assign_id
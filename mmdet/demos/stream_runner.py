@@ -0,0 +1,363 @@
+# ---------------------------------------------------------------
+# stream_runner.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+import os.path as osp
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from mmcv.parallel import collate, scatter
+
+from mmdet.apis.inference import LoadImage
+from mmdet.datasets.pipelines import Compose
+
+_DONE = 'done'
+_ERROR = 'error'
+_FRAME = 'frame'
+_SKIP = 'skip'
+
+
+class StageMeter(object):
+    """Count the items of a stage and the time spent on them."""
+
+    def __init__(self):
+        self.count = 0
+        self.busy = 0.
+
+    def update(self, seconds, n=1):
+        self.count += n
+        self.busy += seconds
+
+    def summary(self, wall_time):
+        return dict(count=self.count, busy=self.busy,
+                    rate=self.count / self.busy if self.busy > 0 else None,  # items/s of one worker
+                    throughput=self.count / wall_time if wall_time > 0 else None)
+
+
+def _decode_worker(load_frame, index_queue, frame_queue):
+    while True:
+        item = index_queue.get()
+        if item is None:
+            frame_queue.put((_DONE, None, None, None))
+            return
+        seq, frame_id = item
+        try:
+            start = time.perf_counter()
+            frame = load_frame(frame_id)
+            frame_queue.put((_FRAME, seq, frame, dict(decode=time.perf_counter() - start)))
+        except Exception:
+            frame_queue.put((_ERROR, seq, traceback.format_exc(), None))
+            return
+
+
+def _keyframe_worker(check_frame, frame_queue, accepted_queue, num_decoders):
+    # the keyframe checker is stateful: the frames are checked in the order of the sequence
+    pending, next_seq, num_done = dict(), 0, 0
+    while num_done < num_decoders:
+        kind, seq, frame, stats = frame_queue.get()
+        if kind == _DONE:
+            num_done += 1
+            continue
+        if kind == _ERROR:
+            accepted_queue.put((kind, seq, frame, stats))
+            return
+        pending[seq] = (frame, stats)
+        while next_seq in pending:
+            frame, stats = pending.pop(next_seq)
+            try:
+                start = time.perf_counter()
+                keep = check_frame(frame)
+                stats['keyframe'] = time.perf_counter() - start
+            except Exception:
+                accepted_queue.put((_ERROR, next_seq, traceback.format_exc(), None))
+                return
+            accepted_queue.put((_FRAME if keep else _SKIP, next_seq, frame if keep else None, stats))
+            next_seq += 1
+    accepted_queue.put((_DONE, None, None, None))
+
+
+class StreamingSceneGraphRunner(object):
+    """Run the incremental 3D scene graph demo as a pipeline of concurrent stages.
+
+    frame ids -> [decode, `num_workers` processes] -> [keyframe check, 1 process]
+    -> [batched inference, main process] -> [fusion and rendering, 1 thread]
+
+    The stages are connected by bounded queues of `queue_size` items, so a slow
+    stage (e.g., a graphviz rendering or a disk read) only stalls the others when
+    its queue is full. The keyframe stage restores the order of the decoded frames.
+
+    Args:
+        load_frame (callable): frame id -> frame, e.g., :class:`DemoFrameLoader`.
+            It must be picklable if the processes are not forked.
+        check_frame (callable): frame -> whether the frame is kept, e.g.,
+            :class:`KeyFrameFilter`.
+        infer (callable): list of frames -> list of results, e.g.,
+            :class:`SceneGraphInference`.
+        fuse (callable): (frame, result) -> None, e.g., :class:`SceneGraphFusion`.
+        batch_size (int): max number of keyframes per inference batch.
+        batch_timeout (float): max seconds to wait for the keyframes of a batch
+            once its first keyframe is available.
+    """
+
+    def __init__(self, load_frame, check_frame, infer, fuse, num_workers=2, queue_size=8, batch_size=4,
+                 batch_timeout=0.05, mp_context=None):
+        self.load_frame = load_frame
+        self.check_frame = check_frame
+        self.infer = infer
+        self.fuse = fuse
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.ctx = mp.get_context(mp_context)
+        self.meters = None
+
+    def _next_batch(self, accepted_queue, workers):
+        """Block for the first keyframe, then gather more until the batch is full or the timeout."""
+        frames, done = [], False
+        deadline = None
+        while len(frames) < self.batch_size:
+            try:
+                # wake up regularly to notice the workers killed without a message
+                timeout = 1. if deadline is None else max(deadline - time.perf_counter(), 0)
+                kind, seq, frame, stats = accepted_queue.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is not None:
+                    break
+                if any(worker.exitcode not in (None, 0) for worker in workers):
+                    raise RuntimeError('A worker of the pipeline exited unexpectedly')
+                continue
+            if kind == _ERROR:
+                raise RuntimeError('A worker of the pipeline failed at frame {}:\n{}'.format(seq, frame))
+            if kind == _DONE:
+                done = True
+                break
+            for name, seconds in stats.items():
+                self.meters[name].update(seconds)
+            if kind == _FRAME:
+                frames.append(frame)
+                if deadline is None:
+                    deadline = time.perf_counter() + self.batch_timeout
+        return frames, done
+
+    def _fusion_worker(self, fuse_queue, errors):
+        while True:
+            item = fuse_queue.get()
+            if item is None:
+                return
+            if errors:
+                continue  # drain the queue
+            frame, result = item
+            try:
+                start = time.perf_counter()
+                self.fuse(frame, result)
+                self.meters['fusion'].update(time.perf_counter() - start)
+            except Exception:
+                errors.append(traceback.format_exc())
+
+    def run(self, frame_ids):
+        """Process the frames, return the summary of the stages.
+
+        Returns:
+            dict: {stage: dict(count, busy, rate, throughput)}, the rates in items
+                per second, with the wall time and the number of keyframes.
+        """
+        frame_ids = list(frame_ids)
+        self.meters = OrderedDict((name, StageMeter()) for name in ['decode', 'keyframe', 'inference', 'fusion'])
+        index_queue = self.ctx.Queue(self.queue_size)
+        frame_queue = self.ctx.Queue(self.queue_size)
+        accepted_queue = self.ctx.Queue(self.queue_size)
+        fuse_queue = queue.Queue(self.queue_size)
+        workers = [self.ctx.Process(target=_decode_worker, args=(self.load_frame, index_queue, frame_queue),
+                                    daemon=True) for _ in range(self.num_workers)]
+        workers.append(self.ctx.Process(target=_keyframe_worker,
+                                        args=(self.check_frame, frame_queue, accepted_queue, self.num_workers),
+                                        daemon=True))
+
+        stopping = threading.Event()
+
+        def feed():
+            items = list(enumerate(frame_ids)) + [None] * self.num_workers
+            for item in items:
+                # give up when the pipeline is stopped, the decoders may be gone
+                while not stopping.is_set():
+                    try:
+                        index_queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    return
+
+        fusion_errors = []
+        feeder = threading.Thread(target=feed, daemon=True)
+        fusion = threading.Thread(target=self._fusion_worker, args=(fuse_queue, fusion_errors), daemon=True)
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        feeder.start()
+        fusion.start()
+        try:
+            done = False
+            while not done:
+                frames, done = self._next_batch(accepted_queue, workers)
+                if frames:
+                    infer_start = time.perf_counter()
+                    results = self.infer(frames)
+                    self.meters['inference'].update(time.perf_counter() - infer_start, n=len(frames))
+                    for frame, result in zip(frames, results):
+                        fuse_queue.put((frame, result))
+                if fusion_errors:
+                    raise RuntimeError('The fusion of the pipeline failed:\n{}'.format(fusion_errors[0]))
+            fuse_queue.put(None)
+            fusion.join()
+            if fusion_errors:
+                raise RuntimeError('The fusion of the pipeline failed:\n{}'.format(fusion_errors[0]))
+            for worker in workers:
+                worker.join()
+        finally:
+            stopping.set()
+            if fusion.is_alive():
+                # the fusion consumes the queued results (or drains them after an error) until None
+                fuse_queue.put(None)
+                fusion.join()
+            feeder.join()
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            for mp_queue in (index_queue, frame_queue, accepted_queue):
+                # do not block the exit on the items nobody reads anymore
+                mp_queue.cancel_join_thread()
+        wall_time = time.perf_counter() - start
+
+        summary = OrderedDict((name, meter.summary(wall_time)) for name, meter in self.meters.items())
+        summary['wall_time'] = wall_time
+        summary['num_frames'] = len(frame_ids)
+        summary['num_keyframes'] = self.meters['inference'].count
+        return summary
+
+
+class SyntheticRGBDSequence(object):
+    """A synthetic RGB-D sequence: a textured plane seen by a camera moving along it.
+
+    Calling it with a frame id returns the frame as :class:`DemoFrameLoader` does,
+    so the pipeline can run without a dataset (and on CPU).
+    """
+
+    def __init__(self, num_frames=100, height=480, width=640, step=20., seed=0):
+        self.num_frames = num_frames
+        self.height = height
+        self.width = width
+        self.step = step  # camera translation per frame, in mm
+        self.intrinsic = np.array([[577.6, 0, width / 2 - 0.5, 0], [0, 578.7, height / 2 - 0.5, 0],
+                                   [0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float32)
+        rng = np.random.RandomState(seed)
+        # a texture twice as large as the frames, the frames are windows sliding over it
+        self.texture = rng.randint(0, 256, (height, 2 * width, 3)).astype(np.uint8)
+
+    def __len__(self):
+        return self.num_frames
+
+    def pose(self, idx):
+        pose = np.eye(4, dtype=np.float32)
+        pose[0, 3] = idx * self.step
+        return pose
+
+    def __call__(self, idx):
+        shift = int(idx * self.step * self.intrinsic[0, 0] / 2000.) % self.width
+        img = np.ascontiguousarray(self.texture[:, shift:shift + self.width])
+        # a plane at 2 m, slanted along y
+        depth = 2000 + 500 * np.linspace(-1, 1, self.height, dtype=np.float32)[:, None]
+        depth = np.repeat(depth, self.width, axis=1).astype(np.uint16)
+        inv_p_matrix = np.linalg.pinv(self.intrinsic[:3])
+        return dict(idx=idx, filename='{}.jpg'.format(idx), img=img, depth=depth, pose=self.pose(idx),
+                    inv_p_matrix=inv_p_matrix)
+
+
+class DemoFrameLoader(object):
+    """Load a frame of a :class:`DemoDataset`: the image, depth, pose and the model inputs.
+
+    The image is decoded once, by `load_image`: the model inputs are given by the
+    pipeline of the dataset without its first step (the image loading), as in
+    :class:`SceneGraphInference`.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.to_float32 = getattr(dataset.pipeline.transforms[0], 'to_float32', False)
+        self.pipeline = Compose(dataset.pipeline.transforms[1:])
+
+    def __call__(self, idx):
+        img_info = self.dataset.img_infos[idx]
+        filename = img_info['filename']
+        img, _, depth, inv_p_matrix, _, _, pose = self.dataset.load_image(filename)
+        results = dict(img_info=img_info)
+        self.dataset.pre_pipeline(results)
+        results.update(filename=osp.join(self.dataset.img_prefix, filename),
+                       img=img.astype(np.float32) if self.to_float32 else img,
+                       img_shape=img.shape, ori_shape=img.shape)
+        return dict(idx=idx, filename=filename, img=img, depth=depth, pose=pose, inv_p_matrix=inv_p_matrix,
+                    data=self.pipeline(results))
+
+
+class KeyFrameFilter(object):
+    """Keep the frames accepted by a :class:`KeyFrameChecker`."""
+
+    def __init__(self, checker):
+        self.checker = checker
+
+    def __call__(self, frame):
+        return self.checker.check_frame(frame['img'], frame['depth'], frame['pose'])[0]
+
+
+class SceneGraphInference(object):
+    """Run the relation test of the SGG model on the keyframes.
+
+    The frames without the model inputs (`data`, e.g., the synthetic ones) are
+    processed by the test pipeline of the config, built once.
+    """
+
+    def __init__(self, model, key_first=False):
+        self.model = model
+        self.device = next(model.parameters()).device
+        self.test_pipeline = Compose([LoadImage()] + model.cfg.data.test.pipeline[1:])
+        self.key_first = key_first
+
+    def __call__(self, frames):
+        batch = []
+        for frame in frames:
+            data = frame.get('data', None)
+            if data is None:
+                data = self.test_pipeline(dict(img=frame['img']))
+            batch.append(data)
+        # one forward for the batch: the relation test takes several images per gpu, and the frames
+        # of a sequence have the same size, so their inputs are stacked by the collate
+        data = collate(batch, samples_per_gpu=len(batch))
+        data = scatter(data, [self.device.index if self.device.type == 'cuda' else -1])[0]
+        with torch.no_grad():
+            results = self.model(return_loss=False, rescale=True, relation_mode=True, key_first=self.key_first,
+                                 **data)
+        return results if len(batch) > 1 else [results]
+
+
+class SceneGraphFusion(object):
+    """Fuse the results into the global 3D scene graph of a :class:`SceneGraphHandler`."""
+
+    def __init__(self, handler, mode='remote_demo', return_mode='json'):
+        self.handler = handler
+        self.mode = mode
+        self.return_mode = return_mode
+
+    def __call__(self, frame, result):
+        self.handler.vis_scene_graph(frame['img'], result, frame['idx'], frame['pose'],
+                                     pix_depth=frame['depth'], inv_p_matrix=frame['inv_p_matrix'],
+                                     mode=self.mode, return_mode=self.return_mode, h_ratio=1., w_ratio=1.,
+                                     image_scene_original=frame['img'])
@@ -25,12 +25,24 @@ from collections import Counter
 import pcl  # cd python-pcl -> python setup.py build-ext -i -> python setup.py install
 import os.path as osp
 import os
+from .color_lut import ColorNameLUT
+
+_fasttext = None
+
+
+def get_fasttext():
+    # loaded on the first use, not when the demos are imported
+    global _fasttext
+    if _fasttext is None:
+        _fasttext = torchtext.vocab.FastText()
+    return _fasttext
+
 
-fasttext = torchtext.vocab.FastText()
 _GRAY = (218, 227, 218)
 _GREEN = (18, 127, 15)
 _WHITE = (255, 255, 255)
 colorlist = [(random.randint(0, 230), random.randint(0, 230), random.randint(0, 230)) for i in range(10000)]
+CSS3_LUT = ColorNameLUT()  # built on the first color histogram, then loaded from the disk
 
 
 class SameNodeDetection(object):
@@ -39,13 +51,16 @@ class SameNodeDetection(object):
         self.class_weight = 10.0 / 20.0
         self.pose_weight = 8.0 / 20.0
         self.color_weight = 2.0 / 20.0
+        self.class_scores = {}  # (curr_cls, prev_cls) -> score, the word vectors are fixed
 
     def compare_class(self, curr_cls, prev_cls, cls_score):
-        score = 0.
-        score = cosine_similarity(fasttext.vectors[fasttext.stoi[curr_cls]].cuda(),
-                                  fasttext.vectors[fasttext.stoi[prev_cls]].cuda(), dim=0).cpu().item()
-        score = (score + 1) / 2.
-        return score
+        key = (curr_cls, prev_cls)
+        if key not in self.class_scores:
+            fasttext = get_fasttext()
+            score = cosine_similarity(fasttext.vectors[fasttext.stoi[curr_cls]],
+                                      fasttext.vectors[fasttext.stoi[prev_cls]], dim=0).item()
+            self.class_scores[key] = (score + 1) / 2.
+        return self.class_scores[key]
 
     def compare_position(self, curr_mean, curr_var, prev_mean, prev_var, prev_pt_num, new_pt_num):
         I_x, I_y, I_z = TFCO.check_distance(curr_mean, curr_var, prev_mean, prev_var)
@@ -62,39 +77,27 @@ class SameNodeDetection(object):
         return score
 
     def node_update(self, window_3d_pts, global_node, curr_mean, curr_var, curr_cls, cls_score,
-                    object_classes):
-        # temporary do not use the curr_color_hist
+                    object_classes, num_nodes=None, radius=None):
+        """Score the detection against the nodes of the NodeStore `global_node`.
+
+        Only the first `num_nodes` nodes are compared, and with `radius`, only the
+        ones whose centroid is within `radius` on every axis (from the voxel hash of
+        the store). The scores are computed over the columns of the candidates.
+        The color is not scored yet: its weight is added as a constant.
+        """
         try:
-            new_pt_num = len(window_3d_pts)
-            global_node_num = len(global_node)
-            #print(global_node_num)
-            score = []
-            score_pose = []
+            cands = global_node.neighbors(curr_mean, np.inf if radius is None else radius, limit=num_nodes)
             w1, w2, w3 = self.class_weight, self.pose_weight, self.color_weight
-            # print("current object : {cls:3}".format(cls=curr_cls[0]))
-            for i in range(global_node_num):
-                #import pdb
-                #pdb.set_trace()
-                prev_cls = object_classes[global_node.iloc[i]["class"]]
-                prev_mean, prev_var, prev_pt_num = global_node.iloc[i]["mean"], global_node.iloc[i]["var"], \
-                                                   global_node.iloc[i]["pt_num"]
-                prev_color_hist = global_node.iloc[i]["color_hist"]
-                cls_sc = self.compare_class(curr_cls, prev_cls, cls_score)
-                pos_sc = self.compare_position(curr_mean, curr_var, prev_mean, prev_var, prev_pt_num, new_pt_num)
-                # col_sc = self.compare_color(curr_color_hist, prev_color_hist)
-                # print("class_score {cls_score:3.2f}".format(cls_score=cls_sc))
-                # print("pose_score {pos_score:3.2f}".format(pos_score=pos_sc))
-                # print("color_score {col_score:3.2f}".format(col_score=col_sc))
-                tot_sc = (w1 * cls_sc) + (w2 * pos_sc) + w3  # (w3 * col_sc)
-                # print("total_score {tot_score:3.2f}".format(tot_score=tot_sc))
-                score.append(tot_sc)
-                # score_pose.append(pos_sc)
-            node_score = max(score)
+            # the class scores of the few distinct classes only
+            classes, inverse = np.unique(global_node['class'][cands], return_inverse=True)
+            cls_sc = np.array([self.compare_class(curr_cls, object_classes[c], cls_score) for c in classes])
+            cls_sc = cls_sc[inverse]
+            pos_sc = TFCO.check_distances(curr_mean, global_node['mean'][cands]).mean(axis=1)
+            score = (w1 * cls_sc) + (w2 * pos_sc) + w3  # (w3 * col_sc)
+            best = int(np.argmax(score))
+            node_score = float(score[best])
             print("node_score {score:3.4f}".format(score=node_score))
-            max_score_index = score.index(max(score))
-            # node_score_pose = score_pose[max_score_index]
-            # print("node_score_pose {score_pose:3.2f}".format(score_pose=node_score_pose))
-            return node_score, max_score_index
+            return node_score, int(cands[best])
         except:
             return 0, 0
 
@@ -195,6 +198,13 @@ class CompareObjects(object):
         # print("pose_score_z {pos_score_z:3.2f}".format(pos_score_z=I_z))
         return I_x, I_y, I_z
 
+    def check_distances(self, x, means):
+        # vectorized check_distance against (N, 3) means, returns the (N, 3) I_x, I_y, I_z
+        Z = np.abs(np.subtract(x, means) / self.meter)
+        th = np.array([self.th_x, self.th_y, self.th_z])
+        with np.errstate(divide='ignore'):
+            return np.where(Z < th, 1.0, th / Z)
+
     def Measure_new_Gaussian_distribution(self, new_pts):
         try:
             pt_num = len(new_pts)
@@ -225,36 +235,8 @@ class CompareObjects(object):
         # ex:     [[362        ,'red' ],[2          ,'blue'],...,[3          ,'gray']]
         '''
 
-        img = img[..., ::-1]  # BGR to RGB
-        img = img.flatten().reshape(-1, 3).tolist()  # shape: ((640x480)*3)
-
-        color_hist = []
-        start = 0
-        new_color = False
-        actual_name, closest_name = FOCC.get_colour_name(img[0])
-        if (actual_name == None):
-            color_hist.append([0, closest_name])
-        else:
-            color_hist.append([0, actual_name])
-
-        for i in range(len(img)):
-            actual_name, closest_name = FOCC.get_colour_name(img[i])
-            for k in range(len(color_hist)):
-                if (color_hist[k][1] == actual_name or color_hist[k][1] == closest_name):
-                    color_hist[k][0] += 1
-                    new_color = False
-                    break
-                else:
-                    new_color = True
-            if (new_color == True):
-                if (actual_name == None):
-                    color_hist.append([1, closest_name])
-                    new_color = False
-                else:
-                    color_hist.append([1, actual_name])
-                    new_color = False
-        color_hist = sorted(color_hist, reverse=True)
-        return color_hist
+        # the names of all the pixels are looked up at once, same names as FOCC.get_colour_name
+        return CSS3_LUT.histogram(img[..., ::-1])  # BGR to RGB
 
     def get_color_hist2(self, img):
         '''
@@ -358,12 +340,9 @@ class Visualization(object):
         blue_rgb = [81, 167, 250]
         tomato_hex = webcolors.rgb_to_hex(tomato_rgb)
         blue_hex = webcolors.rgb_to_hex(blue_rgb)
-        for node_num in range(len(node_feature)):
-            if node_feature.iloc[node_num]['detection_cnt'] < cnt_thres:
-                continue
-
-            obj_cls = object_classes[int(node_feature.iloc[node_num]["class"])]
-            node = node_feature.iloc[node_num]
+        for node_num in np.flatnonzero(node_feature['detection_cnt'] >= cnt_thres):
+            node = node_feature[node_num]
+            obj_cls = object_classes[int(node["class"])]
             if (obj_cls == "tile"):
                 tile_idx.append(str(node["idx"]))
             elif (obj_cls == "handle"):
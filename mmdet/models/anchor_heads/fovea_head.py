@@ -2,7 +2,7 @@ import torch
 import torch.nn as nn
 from mmcv.cnn import normal_init
 
-from mmdet.core import multi_apply, multiclass_nms
+from mmdet.core import multi_apply, multiclass_nms, region_fill_index
 from mmdet.ops import ConvModule, DeformConv
 from ..builder import build_loss
 from ..registry import HEADS
@@ -294,18 +294,20 @@ class FoveaHead(nn.Module):
             pos_down = torch.floor(
                 gt_bboxes[:, 1] + (1 + self.sigma) * half_h - 0.5).long().\
                 clamp(0, featmap_size[0] - 1)
-            for px1, py1, px2, py2, label, (gt_x1, gt_y1, gt_x2, gt_y2) in \
-                    zip(pos_left, pos_top, pos_right, pos_down, gt_labels,
-                        gt_bboxes_raw[hit_indices, :]):
-                labels[py1:py2 + 1, px1:px2 + 1] = label
-                bbox_targets[py1:py2 + 1, px1:px2 + 1, 0] = \
-                    (stride * x[py1:py2 + 1, px1:px2 + 1] - gt_x1) / base_len
-                bbox_targets[py1:py2 + 1, px1:px2 + 1, 1] = \
-                    (stride * y[py1:py2 + 1, px1:px2 + 1] - gt_y1) / base_len
-                bbox_targets[py1:py2 + 1, px1:px2 + 1, 2] = \
-                    (gt_x2 - stride * x[py1:py2 + 1, px1:px2 + 1]) / base_len
-                bbox_targets[py1:py2 + 1, px1:px2 + 1, 3] = \
-                    (gt_y2 - stride * y[py1:py2 + 1, px1:px2 + 1]) / base_len
+            # the smaller gts are filled later and overwrite the larger ones
+            last_gt = region_fill_index(pos_left, pos_top, pos_right, pos_down,
+                                        featmap_size)
+            pos_mask = last_gt >= 0
+            pos_gts = last_gt[pos_mask]
+            labels[pos_mask] = gt_labels[pos_gts]
+            gt_x1, gt_y1, gt_x2, gt_y2 = gt_bboxes_raw[hit_indices[pos_gts],
+                                                       :4].t()
+            pos_x = stride * x[pos_mask]
+            pos_y = stride * y[pos_mask]
+            bbox_targets[pos_mask] = torch.stack(
+                [(pos_x - gt_x1) / base_len, (pos_y - gt_y1) / base_len,
+                 (gt_x2 - pos_x) / base_len, (gt_y2 - pos_y) / base_len],
+                dim=-1)
             bbox_targets = bbox_targets.clamp(min=1. / 16, max=16.)
             label_list.append(labels)
             bbox_target_list.append(torch.log(bbox_targets))
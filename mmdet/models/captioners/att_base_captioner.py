@@ -260,10 +260,8 @@ class AttBaseCaptioner(BaseCaptioner):
             wt = selected_words.squeeze(-1)
 
             if t == 0:
-                att_feats = expand_tensor(att_feats, beam_size)
+                # att_feats, att_mask and p_att_feats are shared by the beams of each image
                 gv_feat = expand_tensor(gv_feat, beam_size)
-                att_mask = expand_tensor(att_mask, beam_size)
-                p_att_feats = expand_tensor(p_att_feats, beam_size)
 
         seq_logprob, sort_idxs = torch.sort(seq_logprob, 1, descending=True)
         outputs = torch.cat(outputs, -1)
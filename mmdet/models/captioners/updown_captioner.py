@@ -11,7 +11,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from .att_base_captioner import AttBaseCaptioner
-from mmdet.models.captioners.utils import Attention
+from mmdet.models.captioners.utils import Attention, expand_to_batch
 
 @CAPTIONERS.register_module
 class UpDownCaptioner(AttBaseCaptioner):
@@ -39,7 +39,7 @@ class UpDownCaptioner(AttBaseCaptioner):
     # state[0] -- h, state[1] -- c
     def Forward(self, gv_feat, att_feats, att_mask, p_att_feats, state, wt):
         if gv_feat.shape[-1] == 1:  # empty gv_feat
-            gv_feat = torch.mean(att_feats, 1)
+            gv_feat = expand_to_batch(torch.mean(att_feats, 1), wt.size(0))
         xt = self.word_embed(wt)
 
         # lstm1
@@ -7,14 +7,14 @@
 # Contact: wenbin.wang@vipl.ict.ac.cn [OR] nkwangwenbin@gmail.com
 # ---------------------------------------------------------------
 
-from .misc import activation, expand_numpy, expand_tensor, load_ids, load_lines, load_vocab, \
+from .misc import activation, expand_numpy, expand_tensor, expand_to_batch, load_ids, load_lines, load_vocab, \
     decode_sequence, clip_gradient, fill_with_neg_inf, AverageMeter, narrow_tensor
 
 from .blocks import FeedForwardBlock, LowRankBilinearEncBlock, LowRankBilinearDecBlock
 
 from .layers import Attention, BasicAtt, SCAtt, PositionalEncoding, LowRank
 
-__all__ = ['activation', 'expand_tensor', 'expand_numpy', 'load_ids', 'load_lines', 'load_vocab', 'decode_sequence',
+__all__ = ['activation', 'expand_tensor', 'expand_to_batch', 'expand_numpy', 'load_ids', 'load_lines', 'load_vocab', 'decode_sequence',
            'clip_gradient', 'fill_with_neg_inf', 'AverageMeter', 'narrow_tensor',
 
            'FeedForwardBlock', 'LowRankBilinearDecBlock', 'LowRankBilinearEncBlock',
@@ -26,20 +26,24 @@ class Attention(nn.Module):
 
         self.need_attn = self.attention_config.need_attn
 
-    # h -- batch_size * cfg.MODEL.RNN_SIZE
+    # h -- (batch_size * beam_size) * cfg.MODEL.RNN_SIZE
     # att_feats -- batch_size * att_num * att_feats_dim
     # p_att_feats -- batch_size * att_num * cfg.ATT_HIDDEN_SIZE
     # att_mask -- batch_size * att_num
+    # the att feats are shared by the beam_size queries of each sample, no need to expand them.
     def forward(self, h, att_feats, att_mask, p_att_feats):
-        Wah = self.Wah(h).unsqueeze(1)
-        alpha = self.act(Wah + p_att_feats)
+        batch_size = att_feats.size(0)
+        Wah = self.Wah(h).view(batch_size, -1, 1, p_att_feats.size(-1))
+        alpha = self.act(Wah + p_att_feats.unsqueeze(1))
         if self.dropout is not None:
             alpha = self.dropout(alpha)
-        alpha = self.alpha(alpha).squeeze(-1)  # batch_size * att_num
+        alpha = self.alpha(alpha).squeeze(-1)  # batch_size * beam_size * att_num
         if att_mask is not None:
-            alpha = alpha.masked_fill(att_mask == 0, -1e9)  # put a large negative value, so that the exp() is almost 0
+            # put a large negative value, so that the exp() is almost 0
+            alpha = alpha.masked_fill(att_mask.unsqueeze(1) == 0, -1e9)
         alpha = F.softmax(alpha, dim=-1)
-        att = torch.bmm(alpha.unsqueeze(1), att_feats).squeeze(1)
+        att = torch.bmm(alpha, att_feats).view(h.size(0), -1)
+        alpha = alpha.view(h.size(0), -1)
         if self.need_attn:
             return att, alpha
         else:
@@ -68,7 +72,10 @@ class BasicAtt(nn.Module):
             attn_weights = attn_weights.masked_fill(att_mask.unsqueeze(1) == 0, -1e9)
         attn_weights = F.softmax(attn_weights, dim=-1)
 
-        attn = torch.matmul(attn_weights.unsqueeze(-2), value2).squeeze(-2)
+        if len(attn_weights.shape) == 4:  # batch_size * head_num * seq_num * seq_num
+            attn = torch.matmul(attn_weights, value2)
+        else:
+            attn = torch.matmul(attn_weights.unsqueeze(-2), value2).squeeze(-2)
         return attn
 
 
@@ -156,8 +163,9 @@ class LowRank(nn.Module):
         self.buffer_value2 = fn(self.buffer_value2)
 
     def init_buffer(self, batch_size):
-        self.buffer_keys = torch.zeros((batch_size, self.num_heads, 0, self.head_dim)).cuda()
-        self.buffer_value2 = torch.zeros((batch_size, self.num_heads, 0, self.head_dim)).cuda()
+        device = next(self.parameters()).device
+        self.buffer_keys = torch.zeros((batch_size, self.num_heads, 0, self.head_dim), device=device)
+        self.buffer_value2 = torch.zeros((batch_size, self.num_heads, 0, self.head_dim), device=device)
 
     def clear_buffer(self):
         self.buffer_keys = None
@@ -167,6 +175,14 @@ class LowRank(nn.Module):
     # value -- batch_size * att_num * vdim
     def forward(self, query, key, mask, value1, value2, precompute=False):
         batch_size = query.size()[0]
+        if key.size(0) != batch_size:
+            # the queries of the beams share the key/value2 of their sample: treat them as a sequence
+            mem_batch_size = key.size(0)
+            attn = self.forward2(query.view(mem_batch_size, -1, query.size(-1)), key,
+                                 mask.unsqueeze(1) if mask is not None else None,
+                                 value1.view(mem_batch_size, -1, value1.size(-1)), value2, precompute)
+            return attn.view(batch_size, -1)
+
         q = self.in_proj_q(query)
         v1 = self.in_proj_v1(value1)
 
@@ -193,6 +209,13 @@ class LowRank(nn.Module):
     # value -- batch_size * att_num * vdim
     def forward2(self, query, key, mask, value1, value2, precompute=False):
         batch_size = query.size()[0]
+        if key.size(0) != batch_size:
+            # the queries of the beams share the key/value2 of their sample: fold the beams into the sequence
+            mem_batch_size = key.size(0)
+            attn = self.forward2(query.view(mem_batch_size, -1, query.size(-1)), key, mask,
+                                 value1.view(mem_batch_size, -1, value1.size(-1)), value2, precompute)
+            return attn.view(batch_size, -1, attn.size(-1))
+
         query = query.view(-1, query.size()[-1])
         value1 = value1.view(-1, value1.size()[-1])
 
@@ -37,6 +37,14 @@ def expand_tensor(tensor, size, dim=1):
     return tensor
 
 
+def expand_to_batch(tensor, batch_size):
+    # expand a tensor shared by the beams (batch_size / beam_size rows) to one row per beam
+    if tensor is None or tensor.size(0) == batch_size:
+        return tensor
+    assert batch_size % tensor.size(0) == 0
+    return expand_tensor(tensor, batch_size // tensor.size(0))
+
+
 def narrow_tensor(tensor, size, dim=1, narrow_method='avg'):
     if tensor is None:
         return tensor
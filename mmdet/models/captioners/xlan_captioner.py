@@ -12,7 +12,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from mmdet.models.captioners.utils import LowRankBilinearEncBlock, LowRankBilinearDecBlock, FeedForwardBlock
-from mmdet.models.captioners.utils import activation, expand_tensor
+from mmdet.models.captioners.utils import activation, expand_tensor, expand_to_batch
 
 from .att_base_captioner import AttBaseCaptioner
 
@@ -46,6 +46,7 @@ class XlanCaptioner(AttBaseCaptioner):
                 gv_feat = torch.sum(att_feats * att_mask.unsqueeze(-1), 1) / torch.sum(att_mask.unsqueeze(-1), 1)
             else:
                 gv_feat = torch.mean(att_feats, 1)
+            gv_feat = expand_to_batch(gv_feat, wt.size(0))
         xt = self.word_embed(wt)
 
         h_att, c_att = self.att_lstm(torch.cat([xt, gv_feat + self.ctx_drop(state[0][1])], 1),
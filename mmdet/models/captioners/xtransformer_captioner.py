@@ -26,8 +26,8 @@ def subsequent_mask(size):
 
 @CAPTIONERS.register_module
 class XTransformerCaptioner(BaseCaptioner):
-    def __init__(self):
-        super(XTransformerCaptioner, self).__init__()
+    def __init__(self, **kwargs):
+        super(XTransformerCaptioner, self).__init__(**kwargs)
         self.vocab_size = self.vocab_size + 1
 
         # att_feats encoder
@@ -195,26 +195,13 @@ class XTransformerCaptioner(BaseCaptioner):
             wt = selected_words.squeeze(-1)
 
             if t == 0:
-                encoder_out = expand_tensor(encoder_out, beam_size)
+                # encoder_out, att_mask and the precomputed p_att_feats are shared by the beams of each image:
+                # the cross attention folds the beams into its query sequence.
                 gx = expand_tensor(gx, beam_size)
-                att_mask = expand_tensor(att_mask, beam_size)
                 state[0] = state[0].squeeze(0)
                 state[0] = expand_tensor(state[0], beam_size)
                 state[0] = state[0].unsqueeze(0)
 
-                p_att_feats_tmp = []
-                for p_feat in p_att_feats:
-                    p_key, p_value2 = p_feat
-                    p_key = expand_tensor(p_key, beam_size)
-                    p_value2 = expand_tensor(p_value2, beam_size)
-                    p_att_feats_tmp.append((p_key, p_value2))
-
-                #kwargs[self.param_config.att_feats] = encoder_out
-                #kwargs[self.param_config.global_feat] = gx
-                #kwargs[self.param_config.att_feats_mask] = att_mask
-                #kwargs[self.param_config.p_att_feats] = p_att_feats_tmp
-                p_att_feats = p_att_feats_tmp
-
         seq_logprob, sort_idxs = torch.sort(seq_logprob, 1, descending=True)
         outputs = torch.cat(outputs, -1)
         outputs = torch.gather(outputs, 1, sort_idxs.expand(batch_size, beam_size, self.seq_len))
@@ -442,7 +429,8 @@ class Decoder(nn.Module):
 
     def init_buffer(self, batch_size):
         self.seq_len = 0
-        self.x = torch.zeros((batch_size, 1, self.embed_dim)).cuda()
+        device = next(self.parameters()).device
+        self.x = torch.zeros((batch_size, 1, self.embed_dim), device=device)
         for layer in self.layers:
             layer.init_buffer(batch_size)
 
@@ -145,15 +145,17 @@ class BaseDetector(nn.Module, metaclass=ABCMeta):
             raise ValueError(
                 'num of augmentations ({}) != num of image meta ({})'.format(
                     len(imgs), len(img_metas)))
-        # TODO: remove the restriction of imgs_per_gpu == 1 when prepared
-        imgs_per_gpu = imgs[0].size(0)
-        assert imgs_per_gpu == 1
 
         key_first = kwargs.pop('key_first', False)
         if relation_mode:
+            # the relation test takes several images per gpu
             assert num_augs == 1
             return self.relation_simple_test(imgs[0], img_metas[0], key_first=key_first, **kwargs)
 
+        # TODO: remove the restriction of imgs_per_gpu == 1 when prepared
+        imgs_per_gpu = imgs[0].size(0)
+        assert imgs_per_gpu == 1
+
         if relcaption_mode:
             assert num_augs == 1
             return self.relcaption_simple_test(imgs[0], img_metas[0], **kwargs)
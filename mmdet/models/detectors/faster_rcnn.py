@@ -19,6 +19,7 @@ class FasterRCNN(TwoStageDetector):
                  relcaption_head=None,
                  saliency_detector=None,
                  downstream_caption_head=None,
+                 feature_cache=None,
                  pretrained=None):
         super(FasterRCNN, self).__init__(
             backbone=backbone,
@@ -32,6 +33,7 @@ class FasterRCNN(TwoStageDetector):
             relcaption_head=relcaption_head,
             saliency_detector=saliency_detector,
             downstream_caption_head=downstream_caption_head,
+            feature_cache=feature_cache,
             train_cfg=train_cfg,
             test_cfg=test_cfg,
             pretrained=pretrained)
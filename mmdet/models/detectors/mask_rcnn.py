@@ -18,6 +18,7 @@ class MaskRCNN(TwoStageDetector):
                  shared_head=None,
                  relation_head=None,
                  saliency_detector=None,
+                 feature_cache=None,
                  pretrained=None,
                  with_point=False):
         super(MaskRCNN, self).__init__(
@@ -31,6 +32,7 @@ class MaskRCNN(TwoStageDetector):
             mask_head=mask_head,
             relation_head=relation_head,
             saliency_detector=saliency_detector,
+            feature_cache=feature_cache,
             train_cfg=train_cfg,
             test_cfg=test_cfg,
             pretrained=pretrained,
@@ -1,7 +1,13 @@
+import math
+
+import numpy as np
 import torch
 import torch.nn as nn
 
-from mmdet.core import bbox2result, bbox2roi, build_assigner, build_sampler, get_point_from_mask
+from mmdet.core import (batched_bbox_overlaps, bbox2result, bbox2roi, build_assigner, build_sampler,
+                        get_point_from_mask)
+from mmdet.core.utils import FeatureCache, cache_key, check_cache_entry
+from mmdet.utils.profiling import profile_stage
 from .. import builder
 from ..registry import DETECTORS
 from .base import BaseDetector
@@ -32,6 +38,7 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                  relcaption_head=None,
                  saliency_detector=None,
                  downstream_caption_head=None,
+                 feature_cache=None,
                  train_cfg=None,
                  test_cfg=None,
                  pretrained=None,
@@ -91,12 +98,21 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
         self.rpn_results = dict()
         self.det_results = dict()
 
+        # For SGG / relational caption training with the frozen detector: load the FPN features
+        # and the detection results written by tools/cache_detector_results.py instead of recomputing.
+        if feature_cache is not None:
+            self.feature_cache = FeatureCache(**feature_cache)
+
         self.init_weights(pretrained=pretrained)
 
     @property
     def with_rpn(self):
         return hasattr(self, 'rpn_head') and self.rpn_head is not None
 
+    @property
+    def with_feature_cache(self):
+        return hasattr(self, 'feature_cache') and self.feature_cache is not None
+
     def init_weights(self, pretrained=None):
         super(TwoStageDetector, self).init_weights(pretrained)
         self.backbone.init_weights(pretrained=pretrained)
@@ -220,14 +236,23 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
             proposals : override rpn proposals with custom proposals. Use when
                 `with_rpn` is False.
             gt_rels :
-            gt_relmaps:
+            gt_relmaps (list[Tensor]): (num_pairs, 3) sparse (subject, object,
+                label) triplets of the related gt pairs, see relmap_triplets.
+                The relmaps returned by the relation heads are dense
+                (num_obj, num_obj) 0/1 maps of the sampled det pairs instead.
             rescale:
 
 
         Returns:
             dict[str, Tensor]: a dictionary of loss components
         """
-        x = self.extract_feat(img)
+        cached = None
+        if self.with_feature_cache and (self.with_relation or self.with_relcaption):
+            head = self.relation_head if self.with_relation else self.relcaption_head
+            cached = self.load_cached_results(img, img_meta, gt_bboxes, gt_labels, gt_masks,
+                                              use_gt_box=head.use_gt_box, use_gt_label=head.use_gt_label)
+        with profile_stage('backbone'):
+            x = cached[0] if cached is not None else self.extract_feat(img)
         ################################################################
         #        Specifically for downstream Captioning Caption        #
         #        Use the result from relation head or relcaption_head. #
@@ -237,13 +262,16 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
             if self.with_relation:
                 pass
             elif self.with_relcaption:
-                bboxes, labels, target_labels, \
-                dists, _, _ = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
-                                                        gt_masks,
-                                                        proposals,
-                                                        use_gt_box=self.relcaption_head.use_gt_box,
-                                                        use_gt_label=self.relcaption_head.use_gt_label,
-                                                        rescale=rescale)
+                if cached is not None:
+                    bboxes, labels, target_labels, dists, _, _, _ = cached[1]
+                else:
+                    bboxes, labels, target_labels, \
+                    dists, _, _ = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
+                                                            gt_masks,
+                                                            proposals,
+                                                            use_gt_box=self.relcaption_head.use_gt_box,
+                                                            use_gt_label=self.relcaption_head.use_gt_label,
+                                                            rescale=rescale)
 
                 det_result = Result(bboxes=bboxes, labels=labels, dists=dists,
                                     target_labels=target_labels, target_scenes=gt_scenes,
@@ -275,13 +303,15 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
             NOTE: (for VG) When the gt masks is None, but the head needs mask,
             we use the gt_box and gt_label (if needed) to generate the fake mask.
             """
-            bboxes, labels, target_labels, \
-            dists, masks, points = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
-                                                             gt_masks,
-                                                             proposals,
-                                                             use_gt_box=self.relation_head.use_gt_box,
-                                                             use_gt_label=self.relation_head.use_gt_label,
-                                                             rescale=rescale)
+            if cached is not None:
+                bboxes, labels, target_labels, dists, masks, points, target_ious = cached[1]
+            else:
+                with profile_stage('detector'):
+                    bboxes, labels, target_labels, \
+                    dists, masks, points, target_ious = self.detector_simple_test(
+                        x, img_meta, gt_bboxes, gt_labels, gt_masks, proposals,
+                        use_gt_box=self.relation_head.use_gt_box, use_gt_label=self.relation_head.use_gt_label,
+                        rescale=rescale, return_target_ious=True)
 
             saliency_maps = self.saliency_detector_test(img, img_meta) if self.with_saliency else None
 
@@ -292,25 +322,29 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                                img_shape=[meta['img_shape'] for meta in img_meta], scenes=gt_scenes)
 
             det_result = Result(bboxes=bboxes, labels=labels, dists=dists, masks=masks, points=points,
-                                target_labels=target_labels, target_scenes=gt_scenes,
+                                target_labels=target_labels, target_ious=target_ious,
+                                target_scenes=gt_scenes,
                                 saliency_maps = saliency_maps,
                                 img_shape=[meta['img_shape'] for meta in img_meta])
 
-            det_result = self.relation_head(x, img_meta, det_result, gt_result)
-            return self.relation_head.loss(det_result)
+            with profile_stage('relation_head'):
+                det_result = self.relation_head(x, img_meta, det_result, gt_result)
+            with profile_stage('relation_head.loss'):
+                return self.relation_head.loss(det_result)
 
         ################################################################
         #        Specifically for Caption/relational Caption           #
         #        The detector part must perform as if at test mode.    #
         ################################################################
         if self.with_relcaption:
-            bboxes, labels, target_labels, \
-            dists, _, _ = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
-                                                    gt_masks,
-                                                    proposals,
-                                                    use_gt_box=self.relcaption_head.use_gt_box,
-                                                    use_gt_label=self.relcaption_head.use_gt_label,
-                                                    rescale=rescale)
+            if cached is not None:
+                bboxes, labels, target_labels, dists, _, _, target_ious = cached[1]
+            else:
+                bboxes, labels, target_labels, \
+                dists, _, _, target_ious = self.detector_simple_test(
+                    x, img_meta, gt_bboxes, gt_labels, gt_masks, proposals,
+                    use_gt_box=self.relcaption_head.use_gt_box, use_gt_label=self.relcaption_head.use_gt_label,
+                    rescale=rescale, return_target_ious=True)
 
             gt_result = Result(bboxes=gt_bboxes, labels=gt_labels, rels=gt_rels, relmaps=gt_relmaps,
                                rel_pair_idxes=[rel[:, :2].clone() for rel in gt_rels] if gt_rels is not None else None,
@@ -327,7 +361,8 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                                img_shape=[meta['img_shape'] for meta in img_meta], scenes=gt_scenes)
 
             det_result = Result(bboxes=bboxes, labels=labels, dists=dists,
-                                target_labels=target_labels, target_scenes=gt_scenes,
+                                target_labels=target_labels, target_ious=target_ious,
+                                target_scenes=gt_scenes,
                                 img_shape=[meta['img_shape'] for meta in img_meta])
 
             det_result = self.relcaption_head(x, img_meta, det_result, gt_result)
@@ -502,7 +537,8 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                              use_gt_box=False,
                              use_gt_label=False,
                              rescale=False,
-                             is_testing=False):
+                             is_testing=False,
+                             return_target_ious=False):
         """Test without augmentation. Used in SGG.
 
         Return:
@@ -513,9 +549,20 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
             masks: (list[list[Tensor]]): Mask is associated with box. Thus, in predcls/sgcls mode, it will
                 firstly return the gt_masks. But some datasets do not contain gt_masks. We try to use the gt box
                 to obtain the masks.
+            target_ious: (list[Tensor]): only returned with return_target_ious, the gt-det IoUs computed
+                by assign_target_labels (sgdet training), otherwise None.
 
         """
         assert self.with_bbox, 'Bbox head must be implemented.'
+        if return_target_ious:
+            result = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels, gt_masks, proposals,
+                                               use_gt_box=use_gt_box, use_gt_label=use_gt_label,
+                                               rescale=rescale, is_testing=True)
+            if use_gt_box or is_testing:
+                return result + (None, )
+            det_bboxes = result[0]
+            target_labels, target_ious = self.assign_target_labels(det_bboxes, gt_bboxes, gt_labels)
+            return result[:2] + (target_labels, ) + result[3:] + (target_ious, )
 
         if self.with_mask:
             if use_gt_box and use_gt_label:  # predcls
@@ -567,13 +614,7 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                                                                                                            rescale=rescale)
                 # get target labels for the det bboxes: make use of the bbox head assigner
                 if not is_testing:  # excluding the testing phase
-                    target_labels = []
-                    bbox_assigner = build_assigner(self.train_cfg.rcnn.assigner)
-                    for i in range(len(img_meta)):
-                        assign_result = bbox_assigner.assign(det_bboxes[i],
-                                                             gt_bboxes[i],
-                                                             gt_labels=gt_labels[i])
-                        target_labels.append(assign_result.labels)
+                    target_labels, _ = self.assign_target_labels(det_bboxes, gt_bboxes, gt_labels)
                 else:
                     target_labels = None
 
@@ -598,18 +639,95 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                                                                                                   rescale=rescale)
                 # get target labels for the det bboxes: make use of the bbox head assigner
                 if not is_testing:  # excluding the testing phase
-                    target_labels = []
-                    bbox_assigner = build_assigner(self.train_cfg.rcnn.assigner)
-                    for i in range(len(img_meta)):
-                        assign_result = bbox_assigner.assign(det_bboxes[i],
-                                                             gt_bboxes[i],
-                                                             gt_labels=gt_labels[i])
-                        target_labels.append(assign_result.labels)
+                    target_labels, _ = self.assign_target_labels(det_bboxes, gt_bboxes, gt_labels)
                 else:
                     target_labels = None
 
                 return det_bboxes, det_labels, target_labels, det_dists, None, None
 
+    def assign_target_labels(self, det_bboxes, gt_bboxes, gt_labels):
+        """Assign the gt labels to the detected boxes with the assigner of the bbox head.
+
+        The gt-det IoUs of all the images are computed by one batched kernel, on the device of the boxes,
+        and given to assign_wrt_overlaps. When an image has more gts than the gpu_assign_thr of a
+        MaxIoUAssigner, the assignment is done image by image with assign() instead, which moves it to
+        the CPU, and no IoUs are returned.
+
+        Return:
+            target_labels: (list[Tensor]): the assigned labels of the det boxes.
+            target_ious: (list[Tensor] | None): num_gts x num_dets IoUs of each image, for the relation
+                sampler.
+        """
+        bbox_assigner = build_assigner(self.train_cfg.rcnn.assigner)
+        gpu_assign_thr = getattr(bbox_assigner, 'gpu_assign_thr', -1)
+        if (not hasattr(bbox_assigner, 'assign_wrt_overlaps')) or (
+                gpu_assign_thr > 0 and any(gt_bboxes_i.size(0) > gpu_assign_thr for gt_bboxes_i in gt_bboxes)):
+            target_labels = [bbox_assigner.assign(det_bboxes_i, gt_bboxes_i, gt_labels=gt_labels_i).labels
+                             for det_bboxes_i, gt_bboxes_i, gt_labels_i in zip(det_bboxes, gt_bboxes, gt_labels)]
+            return target_labels, None
+        target_ious = batched_bbox_overlaps(gt_bboxes, det_bboxes)
+        target_labels = [bbox_assigner.assign_wrt_overlaps(ious, gt_labels=gt_labels_i).labels
+                         for ious, gt_labels_i in zip(target_ious, gt_labels)]
+        return target_labels, target_ious
+
+    def load_cached_results(self,
+                            img,
+                            img_meta,
+                            gt_bboxes,
+                            gt_labels,
+                            gt_masks,
+                            use_gt_box=False,
+                            use_gt_label=False):
+        """Load the FPN features and the detection results of the frozen detector from the
+        feature cache, in place of extract_feat and detector_simple_test (training mode).
+
+        The features of each image are zero-padded to the batch shape, so the result is exact
+        when the cache is written and read with the same padding (e.g., 1 image per gpu).
+
+        Return:
+            None if any image of the batch is not cached, otherwise (x, det) where det has the
+            same format as the return of detector_simple_test with return_target_ious.
+        """
+        keys = [cache_key(meta) for meta in img_meta]
+        if not all(key in self.feature_cache for key in keys):
+            return None
+        cache_meta = self.feature_cache.meta
+        if (cache_meta['use_gt_box'], cache_meta['use_gt_label']) != (use_gt_box, use_gt_label):
+            raise ValueError('The feature cache is written with use_gt_box={}, use_gt_label={}, '
+                             'which does not match the head.'.format(cache_meta['use_gt_box'],
+                                                                     cache_meta['use_gt_label']))
+        entries = [self.feature_cache.get(key) for key in keys]
+        for entry, meta, key in zip(entries, img_meta, keys):
+            check_cache_entry(entry, meta, key)
+        device = img.device
+
+        x = []
+        for lvl, stride in enumerate(cache_meta['strides']):
+            feat = img.new_zeros((len(entries), cache_meta['channels'][lvl],
+                                  int(math.ceil(img.size(2) / stride)), int(math.ceil(img.size(3) / stride))))
+            for i, entry in enumerate(entries):
+                feat_i = torch.from_numpy(np.array(entry['feat_{}'.format(lvl)]))
+                feat[i, :, :feat_i.size(1), :feat_i.size(2)] = feat_i.to(feat)
+            x.append(feat)
+        x = tuple(x)
+
+        def to_tensors(name):
+            if name not in entries[0]:
+                return None
+            return [torch.from_numpy(np.array(entry[name])).to(device) for entry in entries]
+
+        masks = gt_masks if gt_masks is not None else (
+            [entry['masks'] for entry in entries] if 'masks' in entries[0] else None)
+        points = [entry['points'] for entry in entries] if 'points' in entries[0] else None
+        if use_gt_box:
+            bboxes, target_labels, target_ious = gt_bboxes, gt_labels, None
+            labels = gt_labels if use_gt_label else to_tensors('labels')
+        else:
+            bboxes, labels = to_tensors('bboxes'), to_tensors('labels')
+            target_labels, target_ious = self.assign_target_labels(bboxes, gt_bboxes, gt_labels)
+        dists = None if use_gt_label else to_tensors('dists')
+        return x, (bboxes, labels, target_labels, dists, masks, points, target_ious)
+
     def detector_simple_test_gt_mask(self,
                                      x,
                                      img_meta,
@@ -695,8 +813,6 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
         # List[Tensor[(1000, 5)]]
         proposal_list = self.simple_test_rpn(x, img_meta, self.test_cfg.rpn)
 
-        breakpoint()
-
         """Support multi-image per batch"""
         det_bboxes, det_labels, score_dists = [], [], []
         # img_meta: List[metadata]
@@ -765,7 +881,8 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
         if gt_masks is not None:
             gt_masks = gt_masks[0]
 
-        x = self.extract_feat(img)
+        with profile_stage('backbone'):
+            x = self.extract_feat(img)
 
         if self.relation_head.with_visual_mask and (not self.with_mask):
             raise ValueError('The basic detector did not provide masks.')
@@ -776,12 +893,13 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
         """
 
         # Rescale should be forbidden here since the bboxes and masks will be used in relation module.
-        bboxes, labels, target_labels, \
-        dists, masks, points = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
-                                                         gt_masks,
-                                                         use_gt_box=self.relation_head.use_gt_box,
-                                                         use_gt_label=self.relation_head.use_gt_label,
-                                                         rescale=False, is_testing=True)
+        with profile_stage('detector'):
+            bboxes, labels, target_labels, \
+            dists, masks, points = self.detector_simple_test(x, img_meta, gt_bboxes, gt_labels,
+                                                             gt_masks,
+                                                             use_gt_box=self.relation_head.use_gt_box,
+                                                             use_gt_label=self.relation_head.use_gt_label,
+                                                             rescale=False, is_testing=True)
 
         saliency_maps = self.saliency_detector_test(img, img_meta) if self.with_saliency else None
 
@@ -789,13 +907,15 @@ class TwoStageDetector(BaseDetector, RPNTestMixin, BBoxTestMixin,
                             target_labels=target_labels, saliency_maps=saliency_maps,
                             img_shape=[meta['img_shape'] for meta in img_meta])
 
-        det_result = self.relation_head(x, img_meta, det_result, is_testing=True, ignore_classes=ignore_classes)
+        with profile_stage('relation_head'):
+            det_result = self.relation_head(x, img_meta, det_result, is_testing=True, ignore_classes=ignore_classes)
 
         """
         Transform the data type, and rescale the bboxes and masks if needed
         (for visual, do not rescale, for evaluation, rescale).
+        With several images, the list of the results of the images is returned.
         """
-        scale_factor = img_meta[0]['scale_factor']
+        scale_factor = [meta['scale_factor'] for meta in img_meta]
         return self.relation_head.get_result(det_result, scale_factor, rescale=rescale, key_first=key_first)
 
     def relcaption_simple_test(self,
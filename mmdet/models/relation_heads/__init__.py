@@ -20,7 +20,8 @@ from .gps_head import GPSHead
 from .vtranse_head import VTransEHead
 from .kern_head import KERNHead
 from .het_head import HETHead
+from .export_wrapper import ExportableRelationHead, flatten_det_result
 
 __all__ = ['RelationHead', 'MotifHead', 'IMPHead', 'CausalHead', 'VCTreeHead',
            'SoktHead', 'VRPHead', 'MotifVRPHead', 'TransformerHead', 'GPSHead',
-           'VTransEHead', 'KERNHead', 'HETHead']
+           'VTransEHead', 'KERNHead', 'HETHead', 'ExportableRelationHead', 'flatten_det_result']
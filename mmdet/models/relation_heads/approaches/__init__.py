@@ -21,7 +21,8 @@ from .dmp_pts import DirectionAwareMessagePassingPTS
 from .relation_util import Result, PostProcessor, get_box_info, get_box_pair_info, DemoPostProcessor
 from .relation_util import get_internal_labels, get_pattern_labels, top_down_induce
 from .rnn import GRUWriter
-from .relation_ranker import LinearRanker, LSTMRanker, TransformerRanker, get_weak_key_rel_labels
+from .relation_ranker import LinearRanker, LSTMRanker, TransformerRanker, get_weak_key_rel_labels, \
+    get_pair_geometry_scores
 
 __all__ = ['LSTMContext', 'IMPContext', 'VCTreeLSTMContext', 'HybridLSTMContext', 'TransformerContext',
            'VTransEContext', 'KERNContext',
@@ -29,4 +30,4 @@ __all__ = ['LSTMContext', 'IMPContext', 'VCTreeLSTMContext', 'HybridLSTMContext'
            'Result', 'PostProcessor', 'get_box_info', 'get_box_pair_info',
            'PointNetFeat', 'DirectionAwareMessagePassing', 'DirectionAwareMessagePassingPTS',
            'get_pattern_labels', 'get_internal_labels', 'top_down_induce', 'GRUWriter', 'DemoPostProcessor',
-           'LinearRanker', 'LSTMRanker', 'TransformerRanker']
\ No newline at end of file
+           'LinearRanker', 'LSTMRanker', 'TransformerRanker', 'get_pair_geometry_scores']
\ No newline at end of file
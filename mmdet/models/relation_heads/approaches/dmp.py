@@ -11,6 +11,7 @@ from torch import nn
 from torch.nn.utils.rnn import PackedSequence
 from torch.nn import functional as F
 from mmcv.cnn import kaiming_init
+from mmdet.utils.profiling import profile_stage
 from .motif_util import obj_edge_vectors, encode_box_info, to_onehot
 
 def matmul(tensor3d, mat):
@@ -79,6 +80,7 @@ class DirectionAwareMessagePassing(nn.Module):
         atten_tensor = atten_tensor * (1 - torch.eye(num_obj).unsqueeze(-1).to(atten_tensor))
         return atten_tensor / torch.sum(atten_tensor, dim=1, keepdim=True)
 
+    @profile_stage('relation_head.context')
     def forward(self, obj_feats, union_feats, det_result):
         if self.training or self.use_gt_box:  # predcls or sgcls or training, just put obj_labels here
             obj_labels = torch.cat(det_result.labels)
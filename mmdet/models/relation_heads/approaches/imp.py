@@ -10,6 +10,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 from mmcv.cnn import kaiming_init
+from mmdet.utils.profiling import profile_stage
 from .motif_util import to_onehot
 
 
@@ -53,6 +54,7 @@ class IMPContext(nn.Module):
         for module in [self.rel_fc, self.obj_fc, self.obj_unary, self.edge_unary]:
             kaiming_init(module, distribution='uniform', a=1)
 
+    @profile_stage('relation_head.context')
     def forward(self, x, union_features, det_result, logger=None):
         num_objs = [len(b) for b in det_result.bboxes]
         rel_pair_idxes = det_result.rel_pair_idxes
@@ -11,6 +11,7 @@ from torch import nn
 from torch.nn.utils.rnn import PackedSequence
 from torch.nn import functional as F
 from mmcv.cnn import kaiming_init
+from mmdet.utils.profiling import profile_stage
 from .motif_util import (obj_edge_vectors, center_x, sort_by_score, to_onehot,
                          get_dropout_mask, encode_box_info, block_orthogonal)
 import numpy as np
@@ -258,6 +259,7 @@ class KERNContext(nn.Module):
     def init_weights(self):
         pass
 
+    @profile_stage('relation_head.context')
     def forward(self, x, union_feats, det_result, all_average=False, ctx_average=False):
         # labels will be used in DecoderRNN during training (for nms)
         if self.training or self.use_gt_box:  # predcls or sgcls or training, just put obj_labels here
@@ -13,6 +13,7 @@ from torch import nn
 from torch.nn.utils.rnn import PackedSequence
 from torch.nn import functional as F
 from mmcv.cnn import kaiming_init
+from mmdet.utils.profiling import profile_stage
 from .motif_util import (obj_edge_vectors, center_x, sort_by_score, to_onehot,
                          get_dropout_mask, encode_box_info, block_orthogonal)
 
@@ -359,6 +360,7 @@ class LSTMContext(nn.Module):
             holder = holder * (1 - self.average_ratio) + self.average_ratio * input.mean(0).view(-1)
         return holder
 
+    @profile_stage('relation_head.context')
     def forward(self, x, det_result, all_average=False, ctx_average=False):
         # labels will be used in DecoderRNN during training (for nms)
         if self.training or self.use_gt_box:  # predcls or sgcls or training, just put obj_labels here
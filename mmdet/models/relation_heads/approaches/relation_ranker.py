@@ -14,6 +14,7 @@ from mmcv.cnn import xavier_init
 from .motif_util import center_x, sort_by_score
 from torch.nn.utils.rnn import PackedSequence
 from .relation_util import Result
+from mmdet.core import integral_image, box_mean
 from .transformer import Encoder, EncoderLayer, MultiHeadedAttention, PositionwiseFeedForward
 import copy
 
@@ -154,6 +155,27 @@ def get_size_maps(size, boxes_int, form='rect'):
     return areas_ratios
 
 
+def get_pair_geometry_scores(bboxes, rel_pair_idx):
+    """
+    Heuristic relatedness of the object pairs, without any learning: the fraction of
+    the union box that is covered by the two boxes, so that the near or overlapping
+    objects are ranked first. It is weighted by the object scores if there are.
+    :param bboxes: N x 4 or N x 5 (with scores)
+    :param rel_pair_idx: M x 2
+    :return: M scores in [0, 1]
+    """
+    def area(boxes):
+        return (boxes[:, 2] - boxes[:, 0] + 1).clamp(min=0) * (boxes[:, 3] - boxes[:, 1] + 1).clamp(min=0)
+
+    sub_boxes, obj_boxes = bboxes[rel_pair_idx[:, 0]], bboxes[rel_pair_idx[:, 1]]
+    union_boxes = torch.cat((torch.min(sub_boxes[:, :2], obj_boxes[:, :2]),
+                             torch.max(sub_boxes[:, 2:4], obj_boxes[:, 2:4])), 1)
+    scores = ((area(sub_boxes) + area(obj_boxes)) / area(union_boxes)).clamp(max=1.0)
+    if bboxes.size(1) == 5:
+        scores = scores * sub_boxes[:, 4] * obj_boxes[:, 4]
+    return scores
+
+
 def get_weak_key_rel_labels(det_result, gt_result, comb_factor=0.5, area_form='rect'):
     gt_bboxes = gt_result.bboxes
     det_bboxes = det_result.bboxes
@@ -167,9 +189,7 @@ def get_weak_key_rel_labels(det_result, gt_result, comb_factor=0.5, area_form='r
         h, w = saliency_map.shape[1:]
         det_bbox_int[:, 0::2] = torch.clamp(det_bbox_int[:, 0::2], min=0, max=w - 1)
         det_bbox_int[:, 1::2] = torch.clamp(det_bbox_int[:, 1::2], min=0, max=h - 1)
-        object_saliency = torch.cat(
-            [torch.mean(saliency_map[0, box[1]:box[3] + 1, box[0]:box[2] + 1])[None] for box in det_bbox_int], 0).float().to(
-            det_bbox_int.device)
+        object_saliency = box_mean(integral_image(saliency_map[0]), det_bbox_int).float().to(det_bbox_int.device)
         object_area = get_size_maps(saliency_map.shape[1:], det_bbox_int, area_form)
         object_importance = object_saliency * comb_factor + (1.0 - comb_factor) * object_area
         pair_importance = object_importance[rel_pair_idx[:, 0]] + object_importance[rel_pair_idx[:, 1]]
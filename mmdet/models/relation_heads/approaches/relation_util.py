@@ -11,6 +11,7 @@ import torch.nn as nn
 from torch.nn import functional as F
 from mmdet.core.evaluation.bbox_overlaps import bbox_overlaps
 from mmdet.core import multiclass_nms_for_cluster
+from mmdet.utils.profiling import profile_stage
 from collections import defaultdict
 import anytree
 import numpy as np
@@ -30,13 +31,14 @@ class Result(object):
                  points=None,             # gt points / OD: predicted points
                  rels=None,               # gt rel triplets / OD: sampled triplets (training) with target rel labels
                  key_rels=None,           # gt key rels
-                 relmaps=None,            # gt relmaps
+                 relmaps=None,            # gt relmaps: sparse (sub, obj, label) triplets / RM: dense binary map
                  refine_bboxes=None,      # RM: refined object bboxes (score is changed)
                  formatted_bboxes=None,   # OD: Transfrom the refine_bboxes for object detection evaluation
                  refine_scores=None,      # RM: refined object scores (before softmax)
                  refine_dists=None,       # RM: refined object dists (after softmax)
                  refine_labels=None,      # RM: refined object labels
                  target_labels=None,      # RM: assigned object labels for training the relation module.
+                 target_ious=None,        # RM: gt-det IoUs computed for the target label assignment (sgdet)
                  rel_scores=None,         # RM: predicted relation scores (before softmax)
                  rel_dists=None,          # RM: predicted relation prob (after softmax)
                  triplet_scores=None,     # RM: predicted triplet scores (the multiplication of sub-obj-rel scores)
@@ -84,15 +86,21 @@ class Result(object):
 class PostProcessor(nn.Module):
     """
     Obtain the final relation information for evaluation.
+
+    The images of the batch are processed together: the softmax, the triplet scores and
+    the sorting run once over the concatenated objects / relations of all the images.
     """
 
-    def __init__(self):
+    def __init__(self, max_num_rels=None):
         """
         Arguments:
-
+            max_num_rels: if given, only keep the top-k triplets of each image, so that
+                less is transferred to the host.
         """
         super(PostProcessor, self).__init__()
+        self.max_num_rels = max_num_rels
 
+    @profile_stage('relation_head.postprocess')
     def forward(self, det_result, key_first=False):
         """
         Arguments:
@@ -106,69 +114,72 @@ class PostProcessor(nn.Module):
         relation_logits, finetune_obj_logits = det_result.rel_scores, det_result.refine_scores
         rel_pair_idxes = det_result.rel_pair_idxes
         ranking_scores = det_result.ranking_scores
+        num_objs = [len(obj_logit) for obj_logit in finetune_obj_logits]
+        num_rels = [len(rel_pair_idx) for rel_pair_idx in rel_pair_idxes]
+        device = finetune_obj_logits[0].device
 
-        finetune_labels, finetune_dists, finetune_bboxes, \
-        rels, rel_dists, prop_rel_pair_idxes, prop_rel_labels, prop_rel_scores, triplet_scores = \
-            [], [], [], [], [], [], [], [], []
-        prop_ranking_scores = None if ranking_scores is None else []
-
-        for i, (rel_logit, obj_logit, rel_pair_idx, bbox) in enumerate(zip(
-                relation_logits, finetune_obj_logits, rel_pair_idxes, det_result.bboxes)):
-            obj_class_prob = F.softmax(obj_logit, -1)
-            obj_class_prob[:, 0] = 0  # set background score to 0
-            num_obj_bbox = obj_class_prob.shape[0]
-
-            obj_scores, obj_pred = obj_class_prob[:, 1:].max(dim=1)
-            obj_pred = obj_pred + 1
-
-            assert obj_scores.shape[0] == num_obj_bbox
-            obj_class = obj_pred
+        obj_class_prob = F.softmax(torch.cat(finetune_obj_logits), -1)
+        obj_class_prob[:, 0] = 0  # set background score to 0
+        obj_scores, obj_pred = obj_class_prob[:, 1:].max(dim=1)
+        obj_pred = obj_pred + 1
 
-            finetune_labels.append(obj_class)
-            finetune_dists.append(obj_class_prob)
+        finetune_bboxes = []
+        for bbox, obj_score in zip(det_result.bboxes, obj_scores.split(num_objs)):
             if bbox.shape[1] == 4:
-                bbox = torch.cat((bbox, obj_scores[:, None]), dim=-1)
+                bbox = torch.cat((bbox, obj_score[:, None]), dim=-1)
             else:
-                bbox[:, -1] = obj_scores
+                bbox[:, -1] = obj_score
             finetune_bboxes.append(bbox)
 
-            # sorting triples according to score production
-            obj_scores0 = obj_scores[rel_pair_idx[:, 0]]
-            obj_scores1 = obj_scores[rel_pair_idx[:, 1]]
-            rel_class_prob = F.softmax(rel_logit, -1)
-            rel_scores, rel_class = rel_class_prob[:, 1:].max(dim=1)
-            rel_class = rel_class + 1
-            # TODO Kaihua: how about using weighted some here?  e.g. rel*1 + obj *0.8 + obj*0.8
-            triple_scores = rel_scores * obj_scores0 * obj_scores1
-            if key_first and ranking_scores is not None:
-                triple_scores *= ranking_scores[i]
-            _, sorting_idx = torch.sort(triple_scores.view(-1), dim=0, descending=True)
-            triple_scores = triple_scores.view(-1)[sorting_idx].contiguous()
-            rel_pair_idx = rel_pair_idx[sorting_idx]
-            rel_class_prob = rel_class_prob[sorting_idx]
-            rel_labels = rel_class[sorting_idx]
-            rel_logit = rel_logit[sorting_idx]
-            if key_first and ranking_scores is not None:
-                prop_ranking_scores.append(ranking_scores[i][sorting_idx])
-
-            prop_rel_pair_idxes.append(rel_pair_idx)
-            prop_rel_labels.append(rel_labels)
-            prop_rel_scores.append(rel_logit)
-            rel = torch.cat((rel_pair_idx, rel_labels[:, None]), dim=-1)
-            rels.append(rel)
-            rel_dists.append(rel_class_prob)
-            triplet_scores.append(triple_scores)
+        # the pairs index the concatenated objects
+        obj_offsets = torch.tensor([0] + num_objs[:-1], device=device).cumsum(0)
+        img_ids = torch.arange(len(num_rels), device=device).repeat_interleave(
+            torch.tensor(num_rels, device=device))
+        rel_pair_idx = torch.cat(rel_pair_idxes)
+        global_pair_idx = rel_pair_idx + obj_offsets[img_ids][:, None]
+        rel_logit = torch.cat(relation_logits)
+        rel_class_prob = F.softmax(rel_logit, -1)
+        rel_scores, rel_class = rel_class_prob[:, 1:].max(dim=1)
+        rel_class = rel_class + 1
+        # TODO Kaihua: how about using weighted some here?  e.g. rel*1 + obj *0.8 + obj*0.8
+        triple_scores = rel_scores * obj_scores[global_pair_idx[:, 0]] * obj_scores[global_pair_idx[:, 1]]
+        use_ranking = key_first and ranking_scores is not None
+        if use_ranking:
+            ranking_score = torch.cat(ranking_scores)
+            triple_scores = triple_scores * ranking_score
+
+        # sorting triples according to score production, within each image: sort all the
+        # triplets, then group them by image keeping their order (the keys are unique)
+        _, order = torch.sort(triple_scores, dim=0, descending=True)
+        total = len(order)
+        _, by_image = torch.sort(img_ids[order] * total + torch.arange(total, device=device))
+        sorting_idx = order[by_image]
+        if self.max_num_rels is not None:
+            # rank of each sorted triplet in its image
+            rel_offsets = torch.tensor([0] + num_rels[:-1], device=device).cumsum(0)
+            sorted_img_ids = img_ids[sorting_idx]
+            rank = torch.arange(total, device=device) - rel_offsets[sorted_img_ids]
+            sorting_idx = sorting_idx[rank < self.max_num_rels]
+            num_rels = [min(n, self.max_num_rels) for n in num_rels]
+
+        triple_scores = triple_scores[sorting_idx]
+        rel_pair_idx = rel_pair_idx[sorting_idx]
+        rel_class_prob = rel_class_prob[sorting_idx]
+        rel_labels = rel_class[sorting_idx]
+        rel_logit = rel_logit[sorting_idx]
+        rels = torch.cat((rel_pair_idx, rel_labels[:, None]), dim=-1)
 
         det_result.refine_bboxes = finetune_bboxes
-        det_result.refine_dists = finetune_dists
-        det_result.refine_labels = finetune_labels
-        det_result.rels = rels
-        det_result.rel_dists = rel_dists
-        det_result.rel_pair_idxes = prop_rel_pair_idxes
-        det_result.triplet_scores = triplet_scores
-        det_result.rel_labels = prop_rel_labels
-        det_result.rel_scores = prop_rel_scores
-        det_result.ranking_scores = prop_ranking_scores
+        det_result.refine_dists = list(obj_class_prob.split(num_objs))
+        det_result.refine_labels = list(obj_pred.split(num_objs))
+        det_result.rels = list(rels.split(num_rels))
+        det_result.rel_dists = list(rel_class_prob.split(num_rels))
+        det_result.rel_pair_idxes = list(rel_pair_idx.split(num_rels))
+        det_result.triplet_scores = list(triple_scores.split(num_rels))
+        det_result.rel_labels = list(rel_labels.split(num_rels))
+        det_result.rel_scores = list(rel_logit.split(num_rels))
+        det_result.ranking_scores = list(ranking_score[sorting_idx].split(num_rels)) if use_ranking else (
+            None if ranking_scores is None else [])
         return det_result
 
 
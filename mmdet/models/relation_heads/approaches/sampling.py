@@ -11,7 +11,8 @@ import torch
 from torch.nn import functional as F
 import numpy as np
 import numpy.random as npr
-from mmdet.core import bbox_overlaps
+from mmdet.core import batched_bbox_overlaps, bbox_overlaps
+from mmdet.utils.profiling import profile_stage
 
 
 # from maskrcnn_benchmark.modeling.box_coder import BoxCoder
@@ -60,6 +61,7 @@ class RelationSampler(object):
                 rel_pair_idxes.append(torch.zeros((1, 2), dtype=torch.int64, device=device))
         return rel_pair_idxes
 
+    @profile_stage('relation_head.sampler')
     def gtbox_relsample(self, det_result, gt_result):
         assert self.use_gt_box
         num_pos_per_img = int(self.num_rel_per_image * self.pos_fraction)
@@ -141,6 +143,7 @@ class RelationSampler(object):
         else:
             return rel_labels, rel_idx_pairs, rel_sym_binarys
 
+    @profile_stage('relation_head.sampler')
     def detect_relsample(self, det_result, gt_result):
         # corresponding to rel_assignments function in neural-motifs
         """
@@ -167,14 +170,20 @@ class RelationSampler(object):
         key_rel_labels = []
         if gt_keyrels is None:
             gt_keyrels = [None] * len(gt_bboxes)
-        for img_id, (prp_box, prp_lab, tgt_box, tgt_lab, tgt_rel_matrix, tgt_rel, tgt_keyrel) in enumerate(
-                zip(bboxes, labels, gt_bboxes, gt_labels, gt_relmaps, gt_rels, gt_keyrels)):
-            # IoU matching
-            ious = bbox_overlaps(tgt_box, prp_box[:, :4])  # [tgt, prp]
+        # IoU matching: reuse the IoUs of the target label assignment if the detector provides them
+        all_ious = det_result.target_ious
+        if all_ious is None:
+            all_ious = batched_bbox_overlaps(gt_bboxes, bboxes)  # [tgt, prp]
+        # Proposal self IoU to filter non-overlap
+        if self.require_overlap and (not self.use_gt_box):
+            all_prp_self_ious = batched_bbox_overlaps(bboxes, bboxes)  # [prp, prp]
+        else:
+            all_prp_self_ious = [None] * len(bboxes)
+        for img_id, (prp_box, prp_lab, tgt_box, tgt_lab, tgt_rel_matrix, tgt_rel, tgt_keyrel, ious,
+                     prp_self_iou) in enumerate(zip(bboxes, labels, gt_bboxes, gt_labels, gt_relmaps, gt_rels,
+                                                    gt_keyrels, all_ious, all_prp_self_ious)):
             is_match = (tgt_lab[:, None] == prp_lab[None]) & (ious > self.pos_iou_thr)  # [tgt, prp]
-            # Proposal self IoU to filter non-overlap
-            prp_self_iou = bbox_overlaps(prp_box[:, :4], prp_box[:, :4])  # [prp, prp]
-            if self.require_overlap and (not self.use_gt_box):
+            if prp_self_iou is not None:
                 rel_possibility = (prp_self_iou > 0) & (prp_self_iou < 1)  # not self & intersect
             else:
                 num_prp = prp_box.shape[0]
@@ -200,7 +209,7 @@ class RelationSampler(object):
     def motif_rel_fg_bg_sampling(self, device, tgt_rel_matrix, tgt_rel, tgt_keyrel, ious, is_match, rel_possibility):
         """
         prepare to sample fg relation triplet and bg relation triplet
-        tgt_rel_matrix: # [number_target, number_target]
+        tgt_rel_matrix: # [number_pairs, 3] sparse (sub, obj, label) triplets
         ious:           # [number_target, num_proposal]
         is_match:       # [number_target, num_proposal]
         rel_possibility:# [num_proposal, num_proposal]
@@ -11,6 +11,7 @@ from torch import nn
 from torch.nn.utils.rnn import PackedSequence
 from torch.nn import functional as F
 from mmcv.cnn import kaiming_init
+from mmdet.utils.profiling import profile_stage
 import copy
 import math
 from .motif_util import obj_edge_vectors, encode_box_info, to_onehot
@@ -222,6 +223,7 @@ class TransformerContext(nn.Module):
         kaiming_init(self.lin_obj, distribution='uniform', a=1)
         kaiming_init(self.lin_edge, distribution='uniform', a=1)
 
+    @profile_stage('relation_head.context')
     def forward(self, x, det_result):
         # labels will be used in DecoderRNN during training (for nms)
         if self.training or self.use_gt_box:  # predcls or sgcls or training, just put obj_labels here
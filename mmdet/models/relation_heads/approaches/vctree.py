@@ -12,6 +12,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 from mmcv.cnn import xavier_init
+from mmdet.utils.profiling import profile_stage
 from .motif_util import (obj_edge_vectors, to_onehot, get_dropout_mask, encode_box_info)
 from .vctree_util import generate_forest, arbForest_to_biForest, get_overlap_info
 from .treelstm_util import TreeLSTM_IO, MultiLayer_BTreeLSTM, BiTreeLSTM_Backward, BiTreeLSTM_Foreward
@@ -253,6 +254,7 @@ class VCTreeLSTMContext(nn.Module):
         edge_ctxs = torch.cat(edge_ctxs, dim=0)
         return edge_ctxs
 
+    @profile_stage('relation_head.context')
     def forward(self, x, det_result, all_average=False, ctx_average=False):
         num_objs = [len(b) for b in det_result.bboxes]
         # labels will be used in DecoderRNN during training (for nms)
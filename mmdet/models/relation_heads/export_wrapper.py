@@ -0,0 +1,282 @@
+# ---------------------------------------------------------------
+# export_wrapper.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+import torch
+import torch.nn as nn
+from torch.nn import functional as F
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from mmdet.core import bbox2roi
+
+
+def flatten_det_result(det_result, img_meta):
+    """The flat inputs of :class:`ExportableRelationHead` from a test Result of the detector.
+
+    Returns:
+        tuple: rois (N, 5), labels (N, ), dists (N, num_classes) (None if det_result has
+            no dists), rel_pair_idx (R, 2) (indices in rois), img_shapes (B, 2) (h, w).
+    """
+    rois = bbox2roi(det_result.bboxes)
+    labels = torch.cat(det_result.labels)
+    dists = torch.cat(det_result.dists) if det_result.dists is not None else None
+    offset, rel_pair_idx = 0, []
+    for bboxes, pair_idx in zip(det_result.bboxes, det_result.rel_pair_idxes):
+        rel_pair_idx.append(pair_idx + offset)
+        offset += len(bboxes)
+    img_shapes = rois.new_tensor([meta['img_shape'][:2] for meta in img_meta])
+    return rois, labels, dists, torch.cat(rel_pair_idx), img_shapes
+
+
+class ExportableRelationHead(nn.Module):
+    """
+    The test forward of a relation head with a flat tensor interface, to be exported with
+    torch.jit.trace and torch.onnx.export.
+
+    RelationHead.forward consumes a Result of per-image lists, and loops over the images in
+    python. This wrapper runs the same computation with the modules (and the weights) of the head
+    on the tensors of all the images concatenated: the images are given by the first column of
+    the rois, so the traced graph is valid for any number of images, objects and pairs.
+
+    Supported: MotifHead, IMPHead, TransformerHead and VTransEHead with the box features, the
+    frequency bias included. Not exported: the relation ranker, ignore_classes and the causal
+    effect analysis.
+
+    For Motif, the LSTMs run on the objects of every image padded to `max_objs` and, in sgcls /
+    sgdet, the object decoder is unrolled over `max_objs` steps: the images must have at most
+    `max_objs` objects (e.g., test_cfg.rcnn.max_per_img).
+
+    Inputs (forward):
+        feats (tuple[Tensor]): the feature maps of the neck.
+        rois (Tensor): (N, 5), [img_ind, x1, y1, x2, y2] in the scale of the input images, grouped by
+            image in order, as bbox2roi.
+        labels (Tensor): (N, ) the labels of the objects (predcls, unused otherwise).
+        dists (Tensor): (N, num_classes) the class distributions of the detector (sgcls, sgdet,
+            unused in predcls).
+        rel_pair_idx (Tensor): (R, 2) the subject and object indices in rois, grouped by image.
+        img_shapes (Tensor): (B, 2) the (h, w) of the input images.
+
+    Returns:
+        tuple[Tensor]: refine_scores (N, num_classes) and rel_scores (R, num_predicates), the
+            outputs of the head concatenated over the images.
+    """
+
+    SUPPORTED = ('MotifHead', 'IMPHead', 'TransformerHead', 'VTransEHead')
+
+    def __init__(self, head, max_objs=None):
+        super(ExportableRelationHead, self).__init__()
+        self.head_type = head.__class__.__name__
+        if self.head_type not in self.SUPPORTED:
+            raise NotImplementedError('The export of {} is not supported, only: {}'.format(
+                self.head_type, ', '.join(self.SUPPORTED)))
+        if head.with_visual_mask or head.with_visual_point:
+            raise NotImplementedError('Only the heads with the box features can be exported.')
+        if self.head_type == 'MotifHead' and max_objs is None:
+            raise ValueError('max_objs is required to export MotifHead.')
+        if self.head_type == 'TransformerHead' and not head.use_vision:
+            raise NotImplementedError('TransformerHead needs use_vision.')
+        self.head = head
+        self.max_objs = max_objs
+
+    def forward(self, feats, rois, labels, dists, rel_pair_idx, img_shapes):
+        head = self.head
+        roi_feats = head.bbox_roi_extractor.export_forward(feats, rois)
+        union_feats = head.relation_roi_extractor.export_forward(feats, rois, img_shapes, rel_pair_idx)
+
+        if self.head_type == 'IMPHead':
+            obj_scores, rel_scores = self.imp_context(roi_feats, union_feats, labels, rel_pair_idx)
+            obj_preds = obj_scores.max(-1)[1]
+        else:
+            if self.head_type == 'MotifHead':
+                obj_scores, obj_preds, edge_ctx = self.motif_context(roi_feats, rois, labels, dists, img_shapes)
+            elif self.head_type == 'TransformerHead':
+                obj_scores, obj_preds, edge_ctx = self.transformer_context(roi_feats, rois, labels, dists,
+                                                                           img_shapes)
+            else:
+                obj_scores, obj_preds, edge_ctx = self.vtranse_context(roi_feats, rois, labels, dists, img_shapes)
+            rel_scores = self.predict(edge_ctx, union_feats, rel_pair_idx)
+
+        if head.use_bias:
+            pair_pred = torch.stack((obj_preds[rel_pair_idx[:, 0]], obj_preds[rel_pair_idx[:, 1]]), dim=1)
+            rel_scores = rel_scores + head.freq_bias.index_with_labels(pair_pred.long())
+        return obj_scores, rel_scores
+
+    def predict(self, edge_ctx, union_feats, rel_pair_idx):
+        """The post decoding of MotifHead, TransformerHead and VTransEHead, without the bias."""
+        head = self.head
+        dim = head.context_pooling_dim if self.head_type == 'VTransEHead' else head.hidden_dim
+        edge_rep = head.post_emb(edge_ctx).view(-1, 2, dim)
+        head_rep = edge_rep[:, 0][rel_pair_idx[:, 0]]
+        tail_rep = edge_rep[:, 1][rel_pair_idx[:, 1]]
+        if head.use_vision:
+            union_feats = head.up_dim(union_feats) if head.union_single_not_match else union_feats
+
+        if self.head_type == 'VTransEHead':
+            prod_rep = head_rep - tail_rep
+            if head.use_vision:
+                prod_rep = prod_rep * union_feats
+            return head.rel_compress(prod_rep)
+
+        prod_rep = torch.cat((head_rep, tail_rep), dim=-1)
+        if self.head_type == 'TransformerHead':
+            visual_rep = head.post_cat(prod_rep) * union_feats
+            return head.rel_compress(visual_rep) + head.ctx_compress(prod_rep)
+        prod_rep = head.post_cat(prod_rep)
+        if head.use_vision:
+            prod_rep = prod_rep * union_feats
+        return head.rel_compress(prod_rep)
+
+    @staticmethod
+    def box_info(rois, img_shapes):
+        """encode_box_info of the rois."""
+        bbox = rois[:, 1:]
+        img_shape = img_shapes[rois[:, 0].long()]
+        wid, hei = img_shape[:, 1], img_shape[:, 0]
+        wh = bbox[:, 2:4] - bbox[:, 0:2] + 1.0
+        xy = bbox[:, 0:2] + 0.5 * wh
+        w, h = wh[:, 0], wh[:, 1]
+        x, y = xy[:, 0], xy[:, 1]
+        x1, y1, x2, y2 = bbox[:, 0], bbox[:, 1], bbox[:, 2], bbox[:, 3]
+        return torch.stack([w / wid, h / hei, x / wid, y / hei, x1 / wid, y1 / hei, x2 / wid, y2 / hei,
+                            w * h / (wid * hei)], dim=-1)
+
+    @staticmethod
+    def onehot(labels, num_classes, fill=1000):
+        """to_onehot of the labels."""
+        onehot = labels.new_full((labels.size(0), num_classes), -fill, dtype=torch.float)
+        return onehot.scatter(1, labels.view(-1, 1).long(), fill)
+
+    def obj_embed(self, context, labels, dists):
+        if context.use_gt_label:
+            return context.obj_embed1(labels.long())
+        return dists @ context.obj_embed1.weight
+
+    def classify(self, context, obj_scores, labels):
+        """The object scores and labels of the context: predicted, or the given ones in predcls."""
+        if context.mode == 'predcls':
+            return self.onehot(labels, context.num_obj_classes), labels
+        return obj_scores, obj_scores[:, 1:].max(1)[1] + 1
+
+    def vtranse_context(self, x, rois, labels, dists, img_shapes):
+        context = self.head.context_layer
+        pos_embed = context.pos_embed(self.box_info(rois, img_shapes))
+        obj_pre_rep = torch.cat((x, self.obj_embed(context, labels, dists), pos_embed), -1)
+        obj_scores = context.pred_layer(obj_pre_rep) if context.mode != 'predcls' else None
+        obj_scores, obj_preds = self.classify(context, obj_scores, labels)
+        obj_rel_rep = torch.cat((x, pos_embed, context.obj_embed2(obj_preds.long())), -1)
+        return obj_scores, obj_preds, F.relu(context.fc_layer(obj_rel_rep))
+
+    @staticmethod
+    def encode(encoder, x, mask):
+        """Encoder of the transformer context, on all the objects with a block diagonal attention
+        mask (N, N) instead of the padded images."""
+        x = x[None]
+        for layer in encoder.layers:
+            x = layer(x, mask)
+        return encoder.norm(x)[0]
+
+    def transformer_context(self, x, rois, labels, dists, img_shapes):
+        context = self.head.context_layer
+        img_inds = rois[:, 0].long()
+        mask = (img_inds[:, None] == img_inds[None, :]).long()[None]
+        pos_embed = context.pos_embed(self.box_info(rois, img_shapes))
+        obj_pre_rep = context.lin_obj(torch.cat((x, self.obj_embed(context, labels, dists), pos_embed), -1))
+        obj_feats = self.encode(context.context_obj, obj_pre_rep, mask)
+        obj_scores = context.out_obj(obj_feats) if context.mode != 'predcls' else None
+        obj_scores, obj_preds = self.classify(context, obj_scores, labels)
+        edge_pre_rep = context.lin_edge(torch.cat((context.obj_embed2(obj_preds.long()), x, obj_feats), -1))
+        return obj_scores, obj_preds, self.encode(context.context_edge, edge_pre_rep, mask)
+
+    def imp_context(self, x, union_feats, labels, rel_pair_idx):
+        context = self.head.context_layer
+        obj_rep = context.obj_unary(x)
+        rel_rep = F.relu(context.edge_unary(union_feats))
+        sub_inds, obj_inds = rel_pair_idx[:, 0], rel_pair_idx[:, 1]
+
+        # sub-rel-obj mapping
+        obj_range = torch.arange(obj_rep.size(0), device=obj_rep.device)
+        sub2rel = (obj_range[:, None] == sub_inds[None, :]).to(obj_rep.dtype)
+        obj2rel = (obj_range[:, None] == obj_inds[None, :]).to(obj_rep.dtype)
+
+        # iterative message passing
+        vert_factor = context.node_gru(obj_rep, torch.zeros_like(obj_rep))
+        edge_factor = context.edge_gru(rel_rep, torch.zeros_like(rel_rep))
+        for i in range(context.num_iter):
+            sub_vert = vert_factor[sub_inds]
+            obj_vert = vert_factor[obj_inds]
+            weighted_sub = context.sub_vert_w_fc(torch.cat((sub_vert, edge_factor), 1)) * sub_vert
+            weighted_obj = context.obj_vert_w_fc(torch.cat((obj_vert, edge_factor), 1)) * obj_vert
+
+            pre_out = context.out_edge_w_fc(torch.cat((sub_vert, edge_factor), 1)) * edge_factor
+            pre_in = context.in_edge_w_fc(torch.cat((obj_vert, edge_factor), 1)) * edge_factor
+            edge_factor = context.edge_gru(weighted_sub + weighted_obj, edge_factor)
+            vert_factor = context.node_gru(sub2rel @ pre_out + obj2rel @ pre_in, vert_factor)
+
+        if context.mode == 'predcls':
+            obj_scores = self.onehot(labels, context.num_object_classes)
+        else:
+            obj_scores = context.obj_fc(vert_factor)
+        return obj_scores, context.rel_fc(edge_factor)
+
+    def motif_context(self, x, rois, labels, dists, img_shapes):
+        context = self.head.context_layer
+        img_inds = rois[:, 0].long()
+        num_imgs = img_shapes.size(0)
+
+        pos_embed = context.pos_embed(self.box_info(rois, img_shapes))
+        obj_pre_rep = torch.cat((x, self.obj_embed(context, labels, dists), pos_embed), -1)
+
+        # sort_rois: the objects of every image from the right to the left, padded to (max_objs, num_imgs)
+        c_x = 0.5 * (rois[:, 1] + rois[:, 3])
+        perm = torch.argsort(img_inds.float() * 2 - c_x / (c_x.max() + 1))
+        inv_perm = torch.argsort(perm)
+        img_range = torch.arange(num_imgs, device=rois.device)
+        lengths = (img_inds[None, :] == img_range[:, None]).sum(1)
+        starts = (img_inds[None, :] < img_range[:, None]).sum(1)
+        sorted_img_inds = img_inds[perm]
+        steps = torch.arange(rois.size(0), device=rois.device) - starts[sorted_img_inds]
+
+        def pad(feats):
+            padded = feats.new_zeros((self.max_objs, num_imgs, feats.size(1)))
+            padded[steps, sorted_img_inds] = feats[perm]
+            return padded
+
+        def unpad(padded):
+            return padded[steps, sorted_img_inds][inv_perm]
+
+        def rnn(lstm, padded):
+            packed = pack_padded_sequence(padded, lengths.cpu(), enforce_sorted=False)
+            return pad_packed_sequence(lstm(packed)[0], total_length=self.max_objs)[0]
+
+        # object context and object classification
+        obj_inp_rep = pad(obj_pre_rep)
+        encoder_rep = context.lin_obj_h(rnn(context.obj_ctx_rnn, obj_inp_rep))
+        if context.mode != 'predcls':
+            obj_scores, obj_preds = self.decode(context.decoder_rnn, torch.cat((obj_inp_rep, encoder_rep), -1))
+            obj_scores, obj_preds = unpad(obj_scores), unpad(obj_preds[..., None])[:, 0]
+        else:
+            obj_scores, obj_preds = self.classify(context, None, labels)
+        obj_ctx = unpad(encoder_rep)
+
+        # edge context
+        obj_rel_rep = torch.cat((context.obj_embed2(obj_preds.long()), x, obj_ctx), -1)
+        edge_ctx = unpad(context.lin_edge_h(rnn(context.edge_ctx_rnn, pad(obj_rel_rep))))
+        return obj_scores, obj_preds, edge_ctx
+
+    def decode(self, decoder, inputs):
+        """DecoderRNN (test) on the padded (max_objs, num_imgs, dim) inputs: the steps beyond the
+        length of an image do not change the outputs of its objects."""
+        batch_size = inputs.size(1)
+        previous_state = inputs.new_zeros((batch_size, decoder.hidden_size))
+        previous_memory = inputs.new_zeros((batch_size, decoder.hidden_size))
+        previous_obj_embed = decoder.obj_embed.weight[0, None].expand(batch_size, decoder.embed_dim)
+        out_dists, out_commitments = [], []
+        for i in range(self.max_objs):
+            timestep_input = torch.cat((inputs[i], previous_obj_embed), 1)
+            previous_state, previous_memory = decoder.lstm_equations(timestep_input, previous_state, previous_memory)
+            pred_dist = decoder.out_obj(previous_state)
+            best_ind = F.softmax(pred_dist, dim=1)[:, 1:].max(1)[1] + 1
+            out_dists.append(pred_dist)
+            out_commitments.append(best_ind)
+            previous_obj_embed = decoder.obj_embed(best_ind + 1)
+        return torch.stack(out_dists), torch.stack(out_commitments)
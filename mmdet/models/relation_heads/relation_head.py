@@ -22,6 +22,7 @@ from mmdet.core import get_classes, get_predicates, get_attributes, get_verbs, g
 import numpy as np
 import mmcv
 from mmdet.core import bbox2roi
+from mmdet.utils.profiling import profile_stage
 import itertools
 import copy
 
@@ -86,7 +87,8 @@ class RelationHead(nn.Module):
             relation_sampler.update(dict(use_gt_box=self.use_gt_box))
             self.relation_sampler = RelationSampler(**relation_sampler)
 
-        self.post_processor = PostProcessor()
+        # optionally, only the top-k triplets of each image are kept at test time
+        self.post_processor = PostProcessor(max_num_rels=self.head_config.get('max_num_rels', None))
 
         # relation ranker: a standard component
         if relation_ranker is not None:
@@ -182,6 +184,7 @@ class RelationHead(nn.Module):
             self.relation_roi_extractor.init_weights()
         self.context_layer.init_weights()
 
+    @profile_stage('relation_head.frontend')
     def frontend_features(self, img, img_meta, det_result, gt_result):
         bboxes, masks, points = det_result.bboxes, det_result.masks, copy.deepcopy(det_result.points)
 
@@ -223,9 +226,11 @@ class RelationHead(nn.Module):
             points = aug_points
 
         # extract the unary roi features and union roi features.
-        roi_feats = self.bbox_roi_extractor(img, img_meta, rois, masks=masks, points=points)
-        union_feats = self.relation_roi_extractor(img, img_meta, rois,
-                                                  rel_pair_idx=rel_pair_idxes, masks=masks, points=points)
+        with profile_stage('relation_head.bbox_roi_extractor'):
+            roi_feats = self.bbox_roi_extractor(img, img_meta, rois, masks=masks, points=points)
+        with profile_stage('relation_head.relation_roi_extractor'):
+            union_feats = self.relation_roi_extractor(img, img_meta, rois,
+                                                      rel_pair_idx=rel_pair_idxes, masks=masks, points=points)
 
         # breakpoint()
         # roi_feats, ([92, 1024],)
@@ -354,26 +359,69 @@ class RelationHead(nn.Module):
         """
         for test forward
         :param det_result:
-        :return:
+        :param scale_factor: the scale factor of the image, or the list of the scale factors of
+        the images of the batch.
+        :return: the Result of the image, or the list of the Results of the images of the batch.
         """
         result = self.post_processor(det_result, key_first=key_first)
+        # to save the space (and the transfer), drop the saliency maps, if it exists
+        result.saliency_maps = None
 
+        if not isinstance(scale_factor, (list, tuple)):
+            scale_factor = [scale_factor]
+        num_imgs = len(scale_factor)
+
+        # transfer each field of all the images at once, then split it per image
+        per_image = dict()
         for k, v in result.__dict__.items():
             if k != 'add_losses' and k != 'head_spec_losses' and v is not None and len(v) > 0:
-                _v = v[0]  # remove the outer list
-                if isinstance(_v, torch.Tensor):
-                    result.__setattr__(k, _v.cpu().numpy())
-                elif isinstance(_v, list):  # for mask
-                    result.__setattr__(k, [__v.cpu().numpy() for __v in _v])
-                else:
-                    result.__setattr__(k, _v)  # e.g., img_shape, is a tuple
+                per_image[k] = self._to_numpy_per_image(v, num_imgs)
 
         if rescale:
-            if result.bboxes is not None:
-                result.bboxes[:, :4] = result.bboxes[:, :4] / scale_factor
-            if result.refine_bboxes is not None:
-                result.refine_bboxes[:, :4] = result.refine_bboxes[:, :4] / scale_factor
-
+            for k in ['bboxes', 'refine_bboxes']:
+                if k in per_image:
+                    per_image[k] = self._rescale_bboxes(per_image[k], scale_factor)
+
+        results = []
+        for i in range(num_imgs):
+            img_result = copy.copy(result)
+            for k, v in per_image.items():
+                img_result.__setattr__(k, v[i])
+            results.append(self._format_result(img_result, scale_factor[i], rescale))
+        return results if num_imgs > 1 else results[0]
+
+    @staticmethod
+    def _to_numpy_per_image(value, num_imgs):
+        """A per-image field (list or batched tensor) as a list of numpy arrays. The
+        tensors of all the images are concatenated to be transferred at once."""
+        if isinstance(value, torch.Tensor):
+            return list(value.cpu().numpy()[:num_imgs])
+        value = list(value[:num_imgs])
+        if all(isinstance(v, torch.Tensor) and v.dim() > 0 for v in value) and \
+                len(set(v.shape[1:] for v in value)) == 1 and len(set(v.dtype for v in value)) == 1:
+            sizes = np.cumsum([len(v) for v in value])[:-1]
+            return np.split(torch.cat(value).cpu().numpy(), sizes)
+        converted = []
+        for v in value:
+            if isinstance(v, torch.Tensor):
+                v = v.cpu().numpy()
+            elif isinstance(v, list):  # for mask
+                v = [_v.cpu().numpy() if isinstance(_v, torch.Tensor) else _v for _v in v]
+            converted.append(v)  # e.g., img_shape, is a tuple
+        return converted
+
+    @staticmethod
+    def _rescale_bboxes(bboxes, scale_factor):
+        """Rescale the boxes of all the images with one division."""
+        sizes = [len(b) for b in bboxes]
+        factors = np.concatenate([np.broadcast_to(np.asarray(f, dtype=np.float32), (n, 4))
+                                  for f, n in zip(scale_factor, sizes)])
+        bboxes = np.concatenate(bboxes)
+        bboxes[:, :4] = bboxes[:, :4] / factors
+        return np.split(bboxes, np.cumsum(sizes)[:-1])
+
+    def _format_result(self, result, scale_factor, rescale):
+        if rescale:
             if result.masks is not None:
                 resize_masks = []
                 for bbox, mask in zip(result.refine_bboxes, result.masks):
@@ -397,8 +445,10 @@ class RelationHead(nn.Module):
                 np.zeros((0, 5), dtype=np.float32) for i in range(self.num_classes - 1)
             ]
         else:
-            result.formatted_bboxes = [
-                result.refine_bboxes[result.refine_labels == i + 1, :] for i in range(self.num_classes - 1)]
+            # group the boxes by class with one stable sort
+            order = np.argsort(result.refine_labels, kind='stable')
+            counts = np.bincount(result.refine_labels, minlength=self.num_classes)[1:self.num_classes]
+            result.formatted_bboxes = np.split(result.refine_bboxes[order], np.cumsum(counts)[:-1])
 
         if result.masks is None:
             result.formatted_masks = [
@@ -409,10 +459,6 @@ class RelationHead(nn.Module):
             for i in range(len(result.masks)):
                 result.formatted_masks[result.refine_labels[i] - 1].append(result.masks[i])
 
-        # to save the space, drop the saliency maps, if it exists
-        if result.saliency_maps is not None:
-            result.saliency_maps = None
-
         return result
 
     def process_ignore_objects(self, input, ignore_classes):
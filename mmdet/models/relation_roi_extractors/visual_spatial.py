@@ -304,16 +304,7 @@ class VisualSpatialExtractor(nn.Module):
         rel_pair_index = torch.cat(rel_pair_index, 0)
 
         # prepare the union rois
-        head_rois = rois[rel_pair_index[:, 0], :]
-        tail_rois = rois[rel_pair_index[:, 1], :]
-
-        head_rois_int = head_rois.cpu().numpy().astype(np.int32)
-        tail_rois_int = tail_rois.cpu().numpy().astype(np.int32)
-        union_rois = torch.stack([head_rois[:, 0],
-                                  torch.min(head_rois[:, 1], tail_rois[:, 1]),
-                                  torch.min(head_rois[:, 2], tail_rois[:, 2]),
-                                  torch.max(head_rois[:, 3], tail_rois[:, 3]),
-                                  torch.max(head_rois[:, 4], tail_rois[:, 4])], -1)
+        head_rois, tail_rois, union_rois = self.pair_union_rois(rois, rel_pair_index)
 
         self._union_rois = union_rois[:, 1:]
         self._pair_rois = torch.cat((head_rois[:, 1:], tail_rois[:, 1:]), dim=-1)
@@ -321,6 +312,8 @@ class VisualSpatialExtractor(nn.Module):
         # OPTIONAL: prepare the union masks
         union_masks = None
         if masks is not None and self.with_visual_mask:
+            head_rois_int = head_rois.cpu().numpy().astype(np.int32)
+            tail_rois_int = tail_rois.cpu().numpy().astype(np.int32)
             union_rois_int = union_rois.cpu().numpy().astype(np.int32)
             union_heights = union_rois_int[:, 4] - union_rois_int[:, 2] + 1
             union_widths = union_rois_int[:, 3] - union_rois_int[:, 1] + 1
@@ -355,38 +348,8 @@ class VisualSpatialExtractor(nn.Module):
             roi_feats_point, trans_matrix, _ = self.pointFeatExtractor(torch.stack(union_points, dim=0).transpose(2, 1))
 
         # rect_feats: use range to construct rectangle, sized (rect_size, rect_size)
-        num_rel = len(rel_pair_index)
-        dummy_x_range = torch.arange(self.spatial_size).to(rel_pair_index.device).view(1, 1, -1).expand(num_rel,
-                                                                                                        self.spatial_size,
-                                                                                                        self.spatial_size)
-        dummy_y_range = torch.arange(self.spatial_size).to(rel_pair_index.device).view(1, -1, 1).expand(num_rel,
-                                                                                                        self.spatial_size,
-                                                                                                        self.spatial_size)
-        size_list = [np.array(img_meta['img_shape'][:2]).reshape(1, -1) for img_meta in img_metas]
-        img_input_sizes = np.empty((0, 2), dtype=np.float32)
-        for img_id in range(len(rel_pair_idx)):
-            num_rel = len(rel_pair_idx[img_id])
-            img_input_sizes = np.vstack((img_input_sizes, np.tile(size_list[img_id], (num_rel, 1))))
-        img_input_sizes = torch.from_numpy(img_input_sizes).to(rois)
-
-        # resize bbox to the scale rect_size
-        head_proposals = head_rois.clone()
-        head_proposals[:, 1::2] *= self.spatial_size / img_input_sizes[:, 1:2]
-        head_proposals[:, 2::2] *= self.spatial_size / img_input_sizes[:, 0:1]
-        tail_proposals = tail_rois.clone()
-        tail_proposals[:, 1::2] *= self.spatial_size / img_input_sizes[:, 1:2]
-        tail_proposals[:, 2::2] *= self.spatial_size / img_input_sizes[:, 0:1]
-
-        head_rect = ((dummy_x_range >= head_proposals[:, 1].floor().view(-1, 1, 1).long()) & \
-                     (dummy_x_range <= head_proposals[:, 3].ceil().view(-1, 1, 1).long()) & \
-                     (dummy_y_range >= head_proposals[:, 2].floor().view(-1, 1, 1).long()) & \
-                     (dummy_y_range <= head_proposals[:, 4].ceil().view(-1, 1, 1).long())).float()
-        tail_rect = ((dummy_x_range >= tail_proposals[:, 1].floor().view(-1, 1, 1).long()) & \
-                     (dummy_x_range <= tail_proposals[:, 2].ceil().view(-1, 1, 1).long()) & \
-                     (dummy_y_range >= tail_proposals[:, 3].floor().view(-1, 1, 1).long()) & \
-                     (dummy_y_range <= tail_proposals[:, 4].ceil().view(-1, 1, 1).long())).float()
-
-        rect_input = torch.stack((head_rect, tail_rect), dim=1)  # (num_rel, 2, rect_size, rect_size)
+        img_shapes = rois.new_tensor([img_meta['img_shape'][:2] for img_meta in img_metas])
+        rect_input = self.spatial_rect_input(head_rois, tail_rois, img_shapes[head_rois[:, 0].long()])
 
         rect_feats = self.spatial_conv(rect_input)
 
@@ -439,6 +402,84 @@ class VisualSpatialExtractor(nn.Module):
             else:
                 return (roi_feats,)
 
+    @staticmethod
+    def pair_union_rois(rois, rel_pair_index):
+        """The rois of the subjects, of the objects and their union rois, of the pairs given by
+        their indices in `rois`."""
+        head_rois = rois[rel_pair_index[:, 0], :]
+        tail_rois = rois[rel_pair_index[:, 1], :]
+        union_rois = torch.stack([head_rois[:, 0],
+                                  torch.min(head_rois[:, 1], tail_rois[:, 1]),
+                                  torch.min(head_rois[:, 2], tail_rois[:, 2]),
+                                  torch.max(head_rois[:, 3], tail_rois[:, 3]),
+                                  torch.max(head_rois[:, 4], tail_rois[:, 4])], -1)
+        return head_rois, tail_rois, union_rois
+
+    def spatial_rect_input(self, head_rois, tail_rois, img_input_sizes):
+        """The binary maps (num_rel, 2, rect_size, rect_size) of the subject and object boxes, in the
+        image resized to (rect_size, rect_size). img_input_sizes: (num_rel, 2), the (h, w) of the images."""
+        num_rel = head_rois.size(0)
+        dummy_x_range = torch.arange(self.spatial_size).to(head_rois.device).view(1, 1, -1).expand(num_rel,
+                                                                                                   self.spatial_size,
+                                                                                                   self.spatial_size)
+        dummy_y_range = torch.arange(self.spatial_size).to(head_rois.device).view(1, -1, 1).expand(num_rel,
+                                                                                                   self.spatial_size,
+                                                                                                   self.spatial_size)
+
+        # resize bbox to the scale rect_size (the first column, the image index, is not used)
+        scale = self.spatial_size / img_input_sizes
+        scale = torch.stack((torch.ones_like(scale[:, 0]), scale[:, 1], scale[:, 0], scale[:, 1], scale[:, 0]), -1)
+        head_proposals = head_rois * scale
+        tail_proposals = tail_rois * scale
+
+        head_rect = ((dummy_x_range >= head_proposals[:, 1].floor().view(-1, 1, 1).long()) & \
+                     (dummy_x_range <= head_proposals[:, 3].ceil().view(-1, 1, 1).long()) & \
+                     (dummy_y_range >= head_proposals[:, 2].floor().view(-1, 1, 1).long()) & \
+                     (dummy_y_range <= head_proposals[:, 4].ceil().view(-1, 1, 1).long())).float()
+        tail_rect = ((dummy_x_range >= tail_proposals[:, 1].floor().view(-1, 1, 1).long()) & \
+                     (dummy_x_range <= tail_proposals[:, 2].ceil().view(-1, 1, 1).long()) & \
+                     (dummy_y_range >= tail_proposals[:, 3].floor().view(-1, 1, 1).long()) & \
+                     (dummy_y_range <= tail_proposals[:, 4].ceil().view(-1, 1, 1).long())).float()
+
+        return torch.stack((head_rect, tail_rect), dim=1)  # (num_rel, 2, rect_size, rect_size)
+
+    def export_roi_forward(self, roi_layers, feats, rois):
+        """roi_forward without masks and without the data-dependent branches, so that its traced
+        graph is valid for any rois: every level pools its rois (possibly none)."""
+        if len(feats) == 1:
+            return roi_layers[0](feats[0], rois)
+        target_lvls = self.map_roi_levels(rois, self.num_inputs)
+        roi_feats, inds = [], []
+        for i in range(self.num_inputs):
+            inds_i = torch.nonzero(target_lvls == i).view(-1)
+            roi_feats.append(roi_layers[i](feats[i], rois[inds_i]))
+            inds.append(inds_i)
+        # restore the order of the rois
+        return torch.cat(roi_feats)[torch.argsort(torch.cat(inds))]
+
+    def export_forward(self, feats, rois, img_shapes=None, rel_pair_index=None):
+        """The flat tensor interface used for the TorchScript / ONNX export (boxes only).
+
+        Args:
+            feats (tuple[Tensor]): the feature maps.
+            rois (Tensor): (num_obj, 5), [img_ind, x1, y1, x2, y2], grouped by image.
+            img_shapes (Tensor): (num_img, 2), the (h, w) of the input images (with_spatial).
+            rel_pair_index (Tensor): (num_rel, 2), the indices of the pairs in rois (with_spatial).
+
+        Returns:
+            Tensor: the features of the objects, or of the pairs (with_spatial).
+        """
+        if self.with_visual_mask or self.with_visual_point or self.separate_spatial:
+            raise NotImplementedError('Only the box features without separate spatial head can be exported.')
+        if not self.with_spatial:
+            roi_feats = self.export_roi_forward(self.bbox_roi_layers, feats, rois)
+            return self.visual_bbox_head(roi_feats.view(roi_feats.size(0), -1))
+        head_rois, tail_rois, union_rois = self.pair_union_rois(rois, rel_pair_index)
+        roi_feats = self.export_roi_forward(self.bbox_roi_layers, feats, union_rois)
+        rect_input = self.spatial_rect_input(head_rois, tail_rois, img_shapes[head_rois[:, 0].long()])
+        rect_feats = self.spatial_conv(rect_input)
+        return self.visual_bbox_head((roi_feats + rect_feats).view(roi_feats.size(0), -1))
+
     @force_fp32(apply_to=('feats',), out_fp16=True)
     def forward(self, feats, img_metas, rois, rel_pair_idx=None, masks=None, points=None, roi_scale_factor=None):
         if rois.shape[0] == 0:
@@ -207,6 +207,15 @@ class MultiHeadedAttention(nn.Module):
 
     def forward(self, query, key, value, mask=None):
         "Implements Figure 2"
+        if key.size(0) != query.size(0):
+            # the queries of the beams share the memory (key/value) of their sample: fold the beams
+            # into the query sequence instead of expanding the memory.
+            nbatches, mem_nbatches = query.size(0), key.size(0)
+            x = self.forward(query.view(mem_nbatches, -1, query.size(-1)), key, value, mask)
+            attn_shape = self.attn.shape
+            self.attn = self.attn.view(mem_nbatches, self.h, nbatches // mem_nbatches, -1, attn_shape[-1]) \
+                .transpose(1, 2).contiguous().view(nbatches, self.h, -1, attn_shape[-1])
+            return x.view(nbatches, -1, x.size(-1))
         if mask is not None:
             # Same mask applied to all h heads.
             mask = mask.unsqueeze(1)
@@ -11,7 +11,7 @@ import torch
 from torch.nn import functional as F
 import numpy as np
 import numpy.random as npr
-from mmdet.core import bbox_overlaps
+from mmdet.core import batched_bbox_overlaps, bbox_overlaps
 import random
 
 
@@ -143,12 +143,14 @@ class RelationalCapSampler(object):
         rel_cap_targets = []
         rel_ipts = []
         rel_sym_binarys = []
+        # IoU matching: reuse the IoUs of the target label assignment if the detector provides them
+        all_ious = det_result.target_ious
+        if all_ious is None:
+            all_ious = batched_bbox_overlaps(gt_bboxes, bboxes)  # [tgt, prp]
         for img_id, (prp_box, prp_lab, tgt_box, tgt_lab, tgt_rels,
-                     tgt_rel_cap_input, tgt_rel_cap_target, tgt_rel_ipt_score) in \
+                     tgt_rel_cap_input, tgt_rel_cap_target, tgt_rel_ipt_score, ious) in \
                 enumerate(zip(bboxes, labels, gt_bboxes, gt_labels, gt_rels,
-                              gt_rel_cap_inputs, gt_rel_cap_targets, gt_rel_ipts)):
-            # IoU matching
-            ious = bbox_overlaps(tgt_box, prp_box[:, :4])  # [tgt, prp]
+                              gt_rel_cap_inputs, gt_rel_cap_targets, gt_rel_ipts, all_ious)):
             is_match = (ious > self.pos_iou_thr)  # [tgt, prp]
             if self.label_match:
                 is_match = is_match & (tgt_lab[:, None] == prp_lab[None])
@@ -167,7 +169,9 @@ class RelationalCapSampler(object):
     def rel_sampling(self, device, tgt_rels, tgt_rel_cap_inputs, tgt_rel_cap_targets, tgt_rel_ipts,
                      num_per_img, ious, is_match):
         """
-        prepare to sample fg relation triplet and bg relation triplet
+        prepare to sample fg relation triplet and bg relation triplet.
+        All the gt relations are matched with the proposal pairs at once and the
+        sampling is done on device.
         tgt_rel_matrix: # [number_target, number_target]
         ious:           # [number_target, num_proposal]
         is_match:       # [number_target, num_proposal]
@@ -180,109 +184,40 @@ class RelationalCapSampler(object):
 
         # generate binary prp mask
         num_prp = is_match.shape[-1]
+        is_match = is_match > 0
         binary_prp_head = is_match[tgt_head_idxs]  # num_fg, num_prp (matched prp head)
-        binary_prp_tail = is_match[tgt_tail_idxs]  # num_fg, num_prp (matched prp head)
-        binary_rel = torch.zeros((num_prp, num_prp), device=device).long()
-
-        fg_rel_pair_idxs = []
-        fg_rel_cap_input = []
-        fg_rel_cap_target = []
-        fg_rel_ipt_score = []
-        for i in range(tgt_rels.shape[0]):
-            # generate binary prp mask
-            bi_match_head = torch.nonzero(binary_prp_head[i] > 0)
-            bi_match_tail = torch.nonzero(binary_prp_tail[i] > 0)
-
-            num_bi_head = bi_match_head.shape[0]
-            num_bi_tail = bi_match_tail.shape[0]
-            if num_bi_head > 0 and num_bi_tail > 0:
-                bi_match_head = bi_match_head.view(1, num_bi_head).expand(num_bi_tail, num_bi_head).contiguous()
-                bi_match_tail = bi_match_tail.view(num_bi_tail, 1).expand(num_bi_tail, num_bi_head).contiguous()
-                # binary rel only consider related or not, so its symmetric
-                binary_rel[bi_match_head.view(-1), bi_match_tail.view(-1)] = 1
-                binary_rel[bi_match_tail.view(-1), bi_match_head.view(-1)] = 1
-
-            tgt_head_idx = int(tgt_head_idxs[i])
-            tgt_tail_idx = int(tgt_tail_idxs[i])
-            tgt_rel_cap_input = tgt_rel_cap_inputs[i][None, :]
-            tgt_rel_cap_target = tgt_rel_cap_targets[i][None, :]
-            tgt_rel_ipt_score = tgt_rel_ipts[i][None]
-
-            #tgt_rel_lab = int(tgt_rel_labs[i])
-            # find matching pair in proposals (might be more than one)
-            prp_head_idxs = torch.nonzero(is_match[tgt_head_idx]).squeeze(1)
-            prp_tail_idxs = torch.nonzero(is_match[tgt_tail_idx]).squeeze(1)
-            num_match_head = prp_head_idxs.shape[0]
-            num_match_tail = prp_tail_idxs.shape[0]
-            if num_match_head <= 0 or num_match_tail <= 0:
-                continue
-            # all combination pairs
-            prp_head_idxs = prp_head_idxs.view(-1, 1).expand(num_match_head, num_match_tail).contiguous().view(-1)
-            prp_tail_idxs = prp_tail_idxs.view(1, -1).expand(num_match_head, num_match_tail).contiguous().view(-1)
-            valid_pair = prp_head_idxs != prp_tail_idxs
-            if valid_pair.sum().item() <= 0:
-                continue
-            # remove self-pair
-            # remove selected pair from rel_possibility
-            prp_head_idxs = prp_head_idxs[valid_pair]
-            prp_tail_idxs = prp_tail_idxs[valid_pair]
-
-            # construct corresponding proposal triplets corresponding to i_th gt relation
-            fg_rel_cap_input_i = torch.cat([tgt_rel_cap_input] * prp_tail_idxs.shape[0], 0)
-            fg_rel_cap_target_i = torch.cat([tgt_rel_cap_target] * prp_tail_idxs.shape[0], 0)
-            fg_rel_ipt_score_i = torch.cat([tgt_rel_ipt_score] * prp_tail_idxs.shape[0], 0)
-            fg_rel_pair_idxs_i = torch.cat((prp_head_idxs.view(-1, 1), prp_tail_idxs.view(-1, 1)), dim=-1).to(torch.int64)
-
-            # select if too many corresponding proposal pairs to one pair of gt relationship triplet
-            # NOTE that in original motif, the selection is based on a ious_score score
-            if fg_rel_pair_idxs_i.shape[0] > self.num_sample_per_gt_rel:
-                ious_score = (ious[tgt_head_idx, prp_head_idxs] * ious[tgt_tail_idx, prp_tail_idxs]).view(
-                    -1).detach().cpu().numpy()
-                ious_score = ious_score / ious_score.sum()
-                perm = npr.choice(ious_score.shape[0], p=ious_score, size=self.num_sample_per_gt_rel, replace=False)
-                fg_rel_pair_idxs_i = fg_rel_pair_idxs_i[perm]
-                fg_rel_cap_input_i = fg_rel_cap_input_i[perm]
-                fg_rel_cap_target_i = fg_rel_cap_target_i[perm]
-                fg_rel_ipt_score_i = fg_rel_ipt_score_i[perm]
-
-            if fg_rel_pair_idxs_i.shape[0] > 0:
-                fg_rel_pair_idxs.append(fg_rel_pair_idxs_i)
-                fg_rel_cap_input.append(fg_rel_cap_input_i)
-                fg_rel_cap_target.append(fg_rel_cap_target_i)
-                fg_rel_ipt_score.append(fg_rel_ipt_score_i)
-
-        num_fg = sum([p.shape[0] for p in fg_rel_pair_idxs])
+        binary_prp_tail = is_match[tgt_tail_idxs]  # num_fg, num_prp (matched prp tail)
+        # all combination pairs of every gt relation: num_fg, num_prp(head), num_prp(tail)
+        pair_match = binary_prp_head[:, :, None] & binary_prp_tail[:, None, :]
+
+        # binary rel only consider related or not, so its symmetric
+        binary_rel = pair_match.any(0)
+        binary_rel = (binary_rel | binary_rel.t()).long()
+
+        # remove self-pair
+        pair_match = pair_match & ~torch.eye(num_prp, device=device, dtype=torch.bool)[None]
+        rel_inds, prp_head_idxs, prp_tail_idxs = torch.nonzero(pair_match).unbind(1)
+
+        # select if too many corresponding proposal pairs to one pair of gt relationship triplet
+        # NOTE that in original motif, the selection is based on a ious_score score
+        if len(rel_inds) > 0:
+            num_match_per_rel = torch.bincount(rel_inds, minlength=len(tgt_rels))
+            if num_match_per_rel.max().item() > self.num_sample_per_gt_rel:
+                ious_score = ious[tgt_head_idxs[rel_inds], prp_head_idxs] * ious[tgt_tail_idxs[rel_inds], prp_tail_idxs]
+                keep = self._weighted_sample_per_group(rel_inds, num_match_per_rel, ious_score,
+                                                       self.num_sample_per_gt_rel)
+                rel_inds, prp_head_idxs, prp_tail_idxs = rel_inds[keep], prp_head_idxs[keep], prp_tail_idxs[keep]
+
+        num_fg = rel_inds.shape[0]
         seq_len = tgt_rel_cap_inputs.size(1)
 
-        # img_rel_idxs = torch.zeros((num_per_img, 2), device=device).long()
-        # img_tgt_rel_cap_inputs = torch.zeros((num_per_img, seq_len), device=device).long()
-        # img_tgt_rel_cap_targets = torch.zeros((num_per_img, seq_len), device=device).long()
-        # img_tgt_rel_ipts = torch.zeros(num_per_img, device=device).long()
-
         if num_fg > 0:
-            fg_rel_pair_idxs = torch.cat(fg_rel_pair_idxs, 0)
-            fg_rel_cap_input = torch.cat(fg_rel_cap_input, 0)
-            fg_rel_cap_target = torch.cat(fg_rel_cap_target, 0)
-            fg_rel_ipt_score = torch.cat(fg_rel_ipt_score, 0)
-
             perm = torch.randperm(num_fg, device=device)[:num_per_img]
-            img_rel_idxs = fg_rel_pair_idxs[perm]
-            img_tgt_rel_cap_inputs = fg_rel_cap_input[perm]
-            img_tgt_rel_cap_targets = fg_rel_cap_target[perm]
-            img_tgt_rel_ipts = fg_rel_ipt_score[perm]
-        # elif num_fg > 0:
-        #     img_rel_idxs[:num_fg] = fg_rel_pair_idxs
-        #     img_tgt_rel_cap_inputs[:num_fg] = fg_rel_cap_input
-        #     img_tgt_rel_cap_targets[:num_fg] = fg_rel_cap_target
-        #     img_tgt_rel_ipts[:num_fg] = fg_rel_ipt_score
-        #
-        #     #ixs = torch.randperm(num_fg, device=device)[:(num_per_img - num_fg)]
-        #     ixs = torch.from_numpy(np.array(random.sample(range(num_fg), num_per_img - num_fg))).to(device).long()
-        #     pos = torch.arange(len(ixs)).long() + num_fg
-        #     img_rel_idxs[pos] = tgt_pair_idxs[ixs]
-        #     img_tgt_rel_cap_inputs[pos] = fg_rel_cap_input[ixs]
-        #     img_tgt_rel_cap_targets[pos] = fg_rel_cap_target[ixs]
-        #     img_tgt_rel_ipts[pos] = fg_rel_ipt_score[ixs]
+            rel_inds = rel_inds[perm]
+            img_rel_idxs = torch.stack((prp_head_idxs[perm], prp_tail_idxs[perm]), dim=-1).to(torch.int64)
+            img_tgt_rel_cap_inputs = tgt_rel_cap_inputs[rel_inds]
+            img_tgt_rel_cap_targets = tgt_rel_cap_targets[rel_inds]
+            img_tgt_rel_ipts = tgt_rel_ipts[rel_inds]
         else:
             img_rel_idxs = torch.zeros((1, 2), device=device).long()
             img_tgt_rel_cap_inputs = torch.zeros((1, seq_len), device=device).long()
@@ -290,3 +225,29 @@ class RelationalCapSampler(object):
             img_tgt_rel_ipts = torch.zeros(1, device=device).long()
 
         return img_rel_idxs, img_tgt_rel_cap_inputs, img_tgt_rel_cap_targets, img_tgt_rel_ipts, binary_rel
+
+    @staticmethod
+    def _weighted_sample_per_group(group_inds, group_sizes, weights, num_sample):
+        """Sample at most num_sample elements of every group without replacement,
+        with the probability proportional to weights (Efraimidis-Spirakis).
+
+        Arguments:
+            group_inds (Tensor): [N], the group of every element, sorted ascending.
+            group_sizes (Tensor): [G], the number of elements of every group.
+            weights (Tensor): [N], non-negative sampling weights.
+            num_sample (int): the max number of sampled elements per group.
+
+        Returns:
+            Tensor: [N], bool mask of the kept elements.
+        """
+        num = group_inds.shape[0]
+        # an element with larger weight is more likely to get a smaller key.
+        keys = torch.empty_like(weights, dtype=torch.float).exponential_() / weights.float()
+        order = torch.argsort(keys)
+        # regroup stably: the elements of each group keep ascending keys
+        order = order[torch.argsort(group_inds[order] * num + torch.arange(num, device=keys.device))]
+        group_starts = torch.cumsum(group_sizes, 0) - group_sizes
+        rank_in_group = torch.arange(num, device=keys.device) - group_starts[group_inds[order]]
+        keep = torch.zeros_like(group_inds, dtype=torch.bool)
+        keep[order[rank_in_group < num_sample]] = True
+        return keep
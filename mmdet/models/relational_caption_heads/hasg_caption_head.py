@@ -35,6 +35,10 @@ from mmdet.models.relation_heads.approaches.motif_util import obj_edge_vectors
 
 @HEADS.register_module
 class HASGCaptionHead(nn.Module):
+    # the encoder memory read through attention in decode_beam: it is shared by the beams of
+    # each sample instead of being expanded beam_size times.
+    beam_shared_vars = ('att_feats', 'att_mask', 'p_att_feats', 'rel_feats', 'rel_att_mask', 'p_rel_att_feats')
+
     def __init__(self,
                  seq_len=17,
                  seq_per_img=5,
@@ -393,7 +397,8 @@ class HASGCaptionHead(nn.Module):
 
             if t == 0:
                 for k, v in input_vars.items():
-                    input_vars[k] = expand_tensor(v, beam_size)
+                    if k not in self.beam_shared_vars:
+                        input_vars[k] = expand_tensor(v, beam_size)
 
         seq_logprob, sort_idxs = torch.sort(seq_logprob, 1, descending=True)
         outputs = torch.cat(outputs, -1)
@@ -14,11 +14,14 @@ import torch.nn.functional as F
 from .. import builder
 from ..losses import accuracy
 from mmdet.models.relational_caption_heads.approaches import RelationalCapSampler
+from mmdet.models.relation_heads.approaches import (LinearRanker, LSTMRanker, TransformerRanker, Result,
+                                                    get_pair_geometry_scores, get_box_info, get_box_pair_info)
 from mmdet.core import get_classes, get_tokens
 import numpy as np
 import mmcv
 from mmdet.core import bbox2roi
 from functools import reduce
+import copy
 from mmdet.models.captioners.utils import expand_tensor, decode_sequence
 
 
@@ -27,6 +30,9 @@ class RelationalCaptionHead(nn.Module):
     """
     The basic class of all the relational caption head.
     """
+    # the encoder memory read through attention in decode_beam: it is shared by the beams of
+    # each sample instead of being expanded beam_size times.
+    beam_shared_vars = ('att_feats', 'att_mask', 'p_att_feats')
 
     def __init__(self,
                  with_relcaption,
@@ -37,6 +43,7 @@ class RelationalCaptionHead(nn.Module):
                  bbox_roi_extractor=None,
                  relation_roi_extractor=None,
                  relation_sampler=None,
+                 pair_ranker=None,
                  loss_relcaption=None,
                  loss_caption=None
                  ):
@@ -45,6 +52,9 @@ class RelationalCaptionHead(nn.Module):
         initialized here.
         head_config: process the input feature
         caption_config: captioner
+        pair_ranker: score the candidate pairs at testing and only decode the top max_pairs of them.
+            type='geometry' is a heuristic without parameters, otherwise one of the rankers
+            (LinearRanker, LSTMRanker, TransformerRanker) on the object embeddings and pair geometry.
         """
         super(RelationalCaptionHead, self).__init__()
 
@@ -97,6 +107,22 @@ class RelationalCaptionHead(nn.Module):
         # max testing rel pair
         self.max_eval_pairs = 900
 
+        # pair ranker: keep the top-max_eval_pairs candidates for caption decoding
+        self.pair_ranker_type = None
+        if pair_ranker is not None:
+            pair_ranker = copy.deepcopy(pair_ranker)
+            self.pair_ranker_type = pair_ranker.pop('type')
+            self.max_eval_pairs = pair_ranker.pop('max_pairs', self.max_eval_pairs)
+            if self.pair_ranker_type != 'geometry':
+                loss_ranking_pair = pair_ranker.pop('loss', dict(type='CrossEntropyLoss', use_sigmoid=True,
+                                                                 loss_weight=1.0))
+                self.loss_ranking_pair = builder.build_loss(loss_ranking_pair)
+                obj_embed_dim = pair_ranker.pop('obj_embed_dim', 256)
+                self.pair_obj_embed = nn.Linear(self.head_config.single_feat_dim, obj_embed_dim)
+                # subject embedding, object embedding and the 32-d pair box info
+                pair_ranker.update(dict(input_dim=2 * obj_embed_dim + 32, num_out=1))
+                self.pair_ranker = eval(self.pair_ranker_type)(**pair_ranker)
+
     @property
     def with_bbox_roi_extractor(self):
         return hasattr(self, 'bbox_roi_extractor') and self.bbox_roi_extractor is not None
@@ -105,6 +131,14 @@ class RelationalCaptionHead(nn.Module):
     def with_relation_roi_extractor(self):
         return hasattr(self, 'relation_roi_extractor') and self.relation_roi_extractor is not None
 
+    @property
+    def with_pair_ranker(self):
+        return self.pair_ranker_type is not None
+
+    @property
+    def with_learned_pair_ranker(self):
+        return hasattr(self, 'pair_ranker') and self.pair_ranker is not None
+
     @property
     def with_loss_relcaption(self):
         return hasattr(self, 'loss_relcaption') and self.loss_relcaption is not None
@@ -134,13 +168,13 @@ class RelationalCaptionHead(nn.Module):
         else:
             tgt_rel_cap_inputs, tgt_rel_cap_targets, tgt_rel_ipts, rel_matrix = None, None, None, None
             rel_pair_idxes = self.relation_sampler.prepare_test_pairs(det_result)
-            limited_rel_pair_idxes = []
-            for rel_pair_idx in rel_pair_idxes:
-                perm = torch.randperm(rel_pair_idx.shape[0], device=rel_pair_idx.device)[:self.max_eval_pairs]
-                limited_rel_pair_idxes.append(rel_pair_idx[perm, :])
-            rel_pair_idxes = limited_rel_pair_idxes
+            if not self.with_pair_ranker:
+                limited_rel_pair_idxes = []
+                for rel_pair_idx in rel_pair_idxes:
+                    perm = torch.randperm(rel_pair_idx.shape[0], device=rel_pair_idx.device)[:self.max_eval_pairs]
+                    limited_rel_pair_idxes.append(rel_pair_idx[perm, :])
+                rel_pair_idxes = limited_rel_pair_idxes
 
-        det_result.rel_pair_idxes = rel_pair_idxes
         det_result.relmaps = rel_matrix
         det_result.tgt_rel_cap_inputs = tgt_rel_cap_inputs
         det_result.tgt_rel_cap_targets = tgt_rel_cap_targets
@@ -150,9 +184,59 @@ class RelationalCaptionHead(nn.Module):
 
         # extract the unary roi features and union roi features.
         roi_feats = self.bbox_roi_extractor(img, rois)
+        if self.with_pair_ranker:
+            if rel_matrix is None:
+                # testing: the union features are only extracted for the kept pairs
+                rel_pair_idxes, det_result.ranking_scores = self.select_test_pairs(det_result, rel_pair_idxes,
+                                                                                   roi_feats)
+            elif self.with_learned_pair_ranker:
+                det_result.head_spec_losses = self.pair_ranking_loss(det_result, roi_feats, rel_matrix)
+        det_result.rel_pair_idxes = rel_pair_idxes
         union_feats = self.relation_roi_extractor(img, rois, rel_pair_idx=rel_pair_idxes)
         return roi_feats, union_feats, det_result
 
+    def pair_ranking_forward(self, det_result, rel_pair_idxes, roi_feats):
+        """Relatedness scores (before sigmoid for the learned ranker) of the candidate pairs."""
+        if not self.with_learned_pair_ranker:
+            return torch.cat([get_pair_geometry_scores(bboxes, rel_pair_idx)
+                              for bboxes, rel_pair_idx in zip(det_result.bboxes, rel_pair_idxes)])
+
+        num_objs = [len(b) for b in det_result.bboxes]
+        obj_embeds = self.pair_obj_embed(roi_feats.detach()).split(num_objs)
+        pair_feats, union_rois = [], []
+        for bboxes, rel_pair_idx, obj_embed, img_shape in zip(det_result.bboxes, rel_pair_idxes, obj_embeds,
+                                                              det_result.img_shape):
+            obj_box = get_box_info(bboxes[:, :4], need_norm=True, size=img_shape)
+            pair_info = get_box_pair_info(obj_box[rel_pair_idx[:, 0]], obj_box[rel_pair_idx[:, 1]])
+            pair_feats.append(torch.cat((obj_embed[rel_pair_idx[:, 0]], obj_embed[rel_pair_idx[:, 1]], pair_info), 1))
+            sub_boxes, obj_boxes = bboxes[rel_pair_idx[:, 0], :4], bboxes[rel_pair_idx[:, 1], :4]
+            union_rois.append(torch.cat((torch.min(sub_boxes[:, :2], obj_boxes[:, :2]),
+                                         torch.max(sub_boxes[:, 2:], obj_boxes[:, 2:])), 1))
+        ranking_scores = self.pair_ranker(torch.cat(pair_feats), Result(rel_pair_idxes=rel_pair_idxes),
+                                          torch.cat(union_rois))
+        return ranking_scores.view(-1)
+
+    def select_test_pairs(self, det_result, rel_pair_idxes, roi_feats):
+        """Keep the top max_eval_pairs candidate pairs of each image, sorted by the relatedness."""
+        ranking_scores = self.pair_ranking_forward(det_result, rel_pair_idxes, roi_feats)
+        if self.with_learned_pair_ranker:
+            ranking_scores = torch.sigmoid(ranking_scores)
+        ranking_scores = ranking_scores.split([len(r) for r in rel_pair_idxes])
+        kept_rel_pair_idxes, kept_ranking_scores = [], []
+        for rel_pair_idx, ranking_score in zip(rel_pair_idxes, ranking_scores):
+            ranking_score, order = ranking_score.sort(descending=True)
+            kept_rel_pair_idxes.append(rel_pair_idx[order[:self.max_eval_pairs]])
+            kept_ranking_scores.append(ranking_score[:self.max_eval_pairs])
+        return kept_rel_pair_idxes, kept_ranking_scores
+
+    def pair_ranking_loss(self, det_result, roi_feats, rel_matrix):
+        """Train the ranker on all the candidate pairs: the annotated pairs are the positives."""
+        rel_pair_idxes = self.relation_sampler.prepare_test_pairs(det_result)
+        ranking_scores = self.pair_ranking_forward(det_result, rel_pair_idxes, roi_feats)
+        ranking_targets = torch.cat([binary_rel[rel_pair_idx[:, 0], rel_pair_idx[:, 1]]
+                                     for rel_pair_idx, binary_rel in zip(rel_pair_idxes, rel_matrix)])
+        return dict(loss_ranking_pair=self.loss_ranking_pair(ranking_scores.view(-1, 1), ranking_targets))
+
     def preprocess_seq(self, input_seq, target_seq):
         # process the input_seq, target_seq for training
         input_seq = input_seq.view(-1, input_seq.size(-1))
@@ -246,7 +330,8 @@ class RelationalCaptionHead(nn.Module):
 
             if t == 0:
                 for k, v in input_vars.items():
-                    input_vars[k] = expand_tensor(v, beam_size)
+                    if k not in self.beam_shared_vars:
+                        input_vars[k] = expand_tensor(v, beam_size)
 
         seq_logprob, sort_idxs = torch.sort(seq_logprob, 1, descending=True)
         outputs = torch.cat(outputs, -1)
@@ -286,6 +371,8 @@ class RelationalCaptionHead(nn.Module):
             losses['loss_caption'] = self.loss_caption(cap_scores.view(-1, self.vocab_size),
                                                        cap_targets.view(-1),
                                                        ignore_index=-1)
+        if det_result.head_spec_losses is not None:
+            losses.update(det_result.head_spec_losses)
         if self.cross_attn:
             losses['loss_attn'] = 0
             rel_ipt_scores = det_result.rel_ipt_scores
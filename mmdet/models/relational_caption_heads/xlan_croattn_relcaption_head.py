@@ -29,7 +29,7 @@ from .relational_caption_head import RelationalCaptionHead
 from .att_base_relcaption_head import AttBaseRelationalCaptionHead
 from mmdet.models.captioners.utils import LowRankBilinearEncBlock, LowRankBilinearDecBlock, FeedForwardBlock
 from mmdet.models.relation_heads.approaches.motif_util import block_orthogonal
-from mmdet.models.captioners.utils import activation, expand_tensor
+from mmdet.models.captioners.utils import activation, expand_tensor, expand_to_batch
 
 
 @HEADS.register_module
@@ -60,6 +60,7 @@ class XlanCrossAttnRelationalCaptionHead(AttBaseRelationalCaptionHead):
                 gv_feat = torch.sum(att_feats * att_mask.unsqueeze(-1), 1) / torch.sum(att_mask.unsqueeze(-1), 1)
             else:
                 gv_feat = torch.mean(att_feats, 1)
+            gv_feat = expand_to_batch(gv_feat, wt.size(0))
         xt = self.word_embed(wt)
 
         h_att, c_att = self.att_lstm(torch.cat([xt, gv_feat + self.ctx_drop(state[0][1])], 1),
@@ -10,6 +10,7 @@ from .runner import PatchRunner
 from .checkpoint import load_state_dict, load_checkpoint
 from .noam_hook import NoamLrUpdateHook
 from .sampling_schedule_hook import SamplingScheduleHook
+from .profiler_hook import ProfilerHook
 
 __all__ = ['PatchRunner', 'load_state_dict', 'load_checkpoint',
-           'NoamLrUpdateHook', 'SamplingScheduleHook']
\ No newline at end of file
+           'NoamLrUpdateHook', 'SamplingScheduleHook', 'ProfilerHook']
\ No newline at end of file
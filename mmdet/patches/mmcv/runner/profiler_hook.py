@@ -0,0 +1,49 @@
+# ---------------------------------------------------------------
+# profiler_hook.py
+# Copyright (c) 2020 ICT
+# Licensed under The MIT License [see LICENSE for details]
+# ---------------------------------------------------------------
+
+from mmcv.runner import Hook
+
+from mmdet.utils.profiling import StageProfiler
+
+
+class ProfilerHook(Hook):
+    """Log the time and memory of the profiled stages of the training iterations.
+
+    The profile_stage probes of the model (backbone, detector, relation head
+    frontend / sampler / roi extractors / context / loss, ...) are recorded
+    during every `interval`-th training iteration and put into the log buffer,
+    so the text and json loggers report them averaged over their interval as
+    `<stage>_cpu`, `<stage>_gpu` (ms) and `<stage>_mem` (MB).
+
+    Enabled by the config with, e.g., profiler_config = dict(interval=1).
+    Resolving the CUDA events synchronizes once per profiled iteration, and
+    the memory probes reset the peak memory counter of the device, so the
+    `memory` of the logger only covers the end of the profiled iterations.
+    """
+
+    def __init__(self, interval=1, record_memory=True):
+        self.interval = interval
+        self.profiler = StageProfiler(record_memory=record_memory)
+
+    def before_train_iter(self, runner):
+        if self.every_n_iters(runner, self.interval):
+            self.profiler.start()
+
+    def after_train_iter(self, runner):
+        if not self.every_n_iters(runner, self.interval):
+            return
+        self.profiler.stop()
+        log_vars = dict()
+        for name, stat in self.profiler.step().items():
+            log_vars[name + '_cpu'] = stat['cpu_time']
+            if stat['gpu_time'] is not None:
+                log_vars[name + '_gpu'] = stat['gpu_time']
+            if stat['memory'] is not None:
+                log_vars[name + '_mem'] = stat['memory']
+        runner.log_buffer.update(log_vars)
+
+    def after_run(self, runner):
+        self.profiler.stop()
@@ -1,6 +1,8 @@
 import contextlib
 import sys
+import threading
 import time
+from collections import OrderedDict
 
 import torch
 
@@ -39,3 +41,203 @@ if sys.version_info >= (3, 7):
                                                      cpu_time)
             msg += 'gpu_time {:.2f} ms stream {}'.format(gpu_time, stream)
             print(msg, end_stream)
+
+
+_active_profiler = None
+
+
+class StageProfiler(object):
+    """Time and memory of the named stages of a forward pass.
+
+    The stages are the :func:`profile_stage` probes run while the profiler
+    is started. The CPU time is measured with ``time.perf_counter`` and the
+    GPU time with CUDA events, which are only resolved in :meth:`step` so
+    that the probes do not synchronize. The memory is the high-water mark of
+    the allocated CUDA memory during the stage; measuring it resets the peak
+    counter of the device. Without CUDA, only the CPU time is recorded.
+
+    Example:
+        >>> profiler = StageProfiler()
+        >>> with profiler:
+        >>>     model(return_loss=False, rescale=True, **data)
+        >>> profiler.step()
+        {'backbone': dict(calls=1, cpu_time=..., gpu_time=..., memory=...),
+         ...}
+    """
+
+    def __init__(self, use_cuda=None, record_memory=True):
+        if use_cuda is None:
+            use_cuda = torch.cuda.is_available()
+        self.use_cuda = use_cuda
+        self.record_memory = record_memory and use_cuda
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._records = []
+
+    def start(self):
+        global _active_profiler
+        _active_profiler = self
+
+    def stop(self):
+        global _active_profiler
+        if _active_profiler is self:
+            _active_profiler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _stack(self):
+        # stages nest per thread (e.g., the replicas of DataParallel)
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stack = self._stack()
+        start = end = None
+        if self.record_memory:
+            # the peak reached so far belongs to the enclosing stage
+            if stack:
+                stack[-1][0] = max(stack[-1][0],
+                                   torch.cuda.max_memory_allocated())
+            torch.cuda.reset_max_memory_allocated()
+        if self.use_cuda:
+            start = torch.cuda.Event(enable_timing=True)
+            start.record()
+        frame = [0]
+        stack.append(frame)
+        cpu_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cpu_time = (time.perf_counter() - cpu_start) * 1000
+            stack.pop()
+            if self.use_cuda:
+                end = torch.cuda.Event(enable_timing=True)
+                end.record()
+            memory = None
+            if self.record_memory:
+                memory = max(frame[0], torch.cuda.max_memory_allocated())
+                if stack:
+                    stack[-1][0] = max(stack[-1][0], memory)
+            with self._lock:
+                self._records.append((name, cpu_time, start, end, memory))
+
+    def step(self):
+        """Resolve the stages recorded since the last call.
+
+        Returns:
+            OrderedDict: stage name -> dict(calls, cpu_time, gpu_time, memory)
+                in the order the stages are finished. The times (ms) are
+                summed over the calls of the stage, the memory (MB) is the
+                max; gpu_time and memory are None without CUDA.
+        """
+        with self._lock:
+            records, self._records = self._records, []
+        if self.use_cuda and records:
+            torch.cuda.synchronize()
+        stats = OrderedDict()
+        for name, cpu_time, start, end, memory in records:
+            stat = stats.setdefault(
+                name, dict(calls=0, cpu_time=0., gpu_time=None, memory=None))
+            stat['calls'] += 1
+            stat['cpu_time'] += cpu_time
+            if start is not None:
+                stat['gpu_time'] = (stat['gpu_time'] or 0.) + \
+                    start.elapsed_time(end)
+            if memory is not None:
+                stat['memory'] = max(stat['memory'] or 0., memory / 1024.**2)
+        return stats
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """Probe of a stage for the running :class:`StageProfiler`.
+
+    It is a no-op when no profiler is started, and can also be used as a
+    decorator of the function that runs the stage.
+    """
+    profiler = _active_profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def synchronize(device):
+    """Wait for the kernels of a CUDA device, no-op on CPU."""
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def _proc_status_kb(key):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])
+    raise OSError('{} is not in /proc/self/status'.format(key))
+
+
+def reset_peak_memory(device):
+    """Reset the peak memory counter of a device before the measured runs.
+
+    Returns:
+        int | None: the memory in bytes before the runs, the base of
+            :func:`peak_memory`: the memory allocated by torch on CUDA, the
+            resident size of the process on CPU. None if the peak cannot be
+            reset.
+    """
+    if device.type == 'cuda':
+        torch.cuda.reset_max_memory_allocated(device)
+        return torch.cuda.memory_allocated(device)
+    # The peak resident size of the process (VmHWM, like ru_maxrss) never
+    # goes down, but it can be reset to the current resident size on
+    # Linux >= 4.0.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_kb('VmRSS') * 1024
+    except (IOError, OSError):
+        return None
+
+
+def peak_memory(device, base, prefix=''):
+    """Peak memory of the runs since :func:`reset_peak_memory`.
+
+    Args:
+        device (torch.device): the device of the runs.
+        base (int | None): the value returned by :func:`reset_peak_memory`.
+        prefix (str): prefix of the keys, e.g., 'train_'.
+
+    Returns:
+        dict: ``peak_memory_mb``, the peak allocated by torch on CUDA, or
+            ``peak_rss_delta_mb``, the peak increase of the resident size of
+            the process over `base` on CPU (None if it cannot be measured).
+    """
+    if device.type == 'cuda':
+        return {
+            prefix + 'peak_memory_mb':
+            torch.cuda.max_memory_allocated(device) / 1024.**2
+        }
+    if base is None:
+        return {prefix + 'peak_rss_delta_mb': None}
+    return {
+        prefix + 'peak_rss_delta_mb':
+        (_proc_status_kb('VmHWM') * 1024 - base) / 1024.**2
+    }
+
+
+def format_peak_memory(record, prefix=''):
+    """Format the peak memory given by :func:`peak_memory` in a record."""
+    if prefix + 'peak_memory_mb' in record:
+        return 'peak {:.0f} MB'.format(record[prefix + 'peak_memory_mb'])
+    if record.get(prefix + 'peak_rss_delta_mb') is not None:
+        return 'peak RSS +{:.0f} MB'.format(
+            record[prefix + 'peak_rss_delta_mb'])
+    return 'peak RSS n/a'
@@ -0,0 +1,138 @@
+import multiprocessing
+import threading
+
+import pytest
+import torch
+from mmcv import Config
+from mmcv.parallel import DataContainer
+
+from mmdet.demos.stream_runner import (SceneGraphInference,
+                                       StreamingSceneGraphRunner,
+                                       SyntheticRGBDSequence)
+
+
+def _check_every_third(frame):
+    # a stateless stand-in of KeyFrameFilter, picklable for the processes
+    return frame['idx'] % 3 == 0
+
+
+class _RecordingStages(object):
+    """Stub inference and fusion stages that record what they are given."""
+
+    def __init__(self, fail_at=None):
+        self.batches = []
+        self.fused = []
+        self.fail_at = fail_at
+
+    def infer(self, frames):
+        self.batches.append([frame['idx'] for frame in frames])
+        return [dict(idx=frame['idx']) for frame in frames]
+
+    def fuse(self, frame, result):
+        assert result['idx'] == frame['idx']
+        if frame['idx'] == self.fail_at:
+            raise ValueError('fusion failed')
+        self.fused.append(frame['idx'])
+
+
+def _runner_threads():
+    # the queues of multiprocessing keep their own feeder threads
+    return [
+        thread for thread in threading.enumerate()
+        if thread is not threading.main_thread()
+        and not thread.name.startswith('QueueFeederThread')
+    ]
+
+
+def _assert_shut_down(threads_before):
+    assert multiprocessing.active_children() == []
+    assert set(_runner_threads()) <= set(threads_before)
+
+
+@pytest.mark.parametrize('num_workers,batch_size', [(1, 1), (2, 1),
+                                                    (3, 4)])
+def test_streaming_runner(num_workers, batch_size):
+    sequence = SyntheticRGBDSequence(num_frames=20, height=24, width=32)
+    stages = _RecordingStages()
+    runner = StreamingSceneGraphRunner(
+        sequence,
+        _check_every_third,
+        stages.infer,
+        stages.fuse,
+        num_workers=num_workers,
+        queue_size=2,
+        batch_size=batch_size)
+    threads_before = _runner_threads()
+    summary = runner.run(range(len(sequence)))
+
+    keyframes = list(range(0, 20, 3))
+    # every keyframe is fused exactly once, in the order of the sequence
+    assert stages.fused == keyframes
+    assert sum(stages.batches, []) == keyframes
+    assert all(0 < len(batch) <= batch_size for batch in stages.batches)
+    assert summary['num_frames'] == 20
+    assert summary['num_keyframes'] == len(keyframes)
+    assert summary['decode']['count'] == 20
+    assert summary['keyframe']['count'] == 20
+    assert summary['fusion']['count'] == len(keyframes)
+    _assert_shut_down(threads_before)
+
+
+def test_streaming_runner_failure():
+    sequence = SyntheticRGBDSequence(num_frames=20, height=24, width=32)
+    stages = _RecordingStages(fail_at=9)
+    runner = StreamingSceneGraphRunner(
+        sequence,
+        _check_every_third,
+        stages.infer,
+        stages.fuse,
+        num_workers=2,
+        queue_size=2)
+    threads_before = _runner_threads()
+    with pytest.raises(RuntimeError, match='fusion failed'):
+        runner.run(range(len(sequence)))
+    assert stages.fused == [0, 3, 6]
+    _assert_shut_down(threads_before)
+
+
+class _RelationTestModel(torch.nn.Module):
+    """Stub of a detector in the relation test: one result per image."""
+
+    def __init__(self):
+        super(_RelationTestModel, self).__init__()
+        self.scale = torch.nn.Parameter(torch.ones(1))
+        self.cfg = Config(
+            dict(data=dict(test=dict(pipeline=[dict(type='LoadImage')]))))
+        self.batch_sizes = []
+
+    def forward(self, img, img_meta, return_loss=True, **kwargs):
+        assert not return_loss and kwargs['relation_mode']
+        assert len(img) == len(img_meta) == 1
+        self.batch_sizes.append(img[0].size(0))
+        results = [
+            dict(idx=meta['idx'], value=(x * self.scale).mean().item())
+            for x, meta in zip(img[0], img_meta[0])
+        ]
+        # like relation_simple_test, a single image gives a single result
+        return results if len(results) > 1 else results[0]
+
+
+def _model_inputs(idx):
+    return dict(
+        img=[torch.full((3, 8, 12), float(idx))],
+        img_meta=[DataContainer(dict(idx=idx), cpu_only=True)])
+
+
+def test_scene_graph_inference_batch():
+    model = _RelationTestModel()
+    infer = SceneGraphInference(model)
+    frames = [dict(idx=idx, data=_model_inputs(idx)) for idx in [3, 6, 9]]
+    results = infer(frames)
+    # a single forward for the batch, one result per frame in order
+    assert model.batch_sizes == [3]
+    assert [result['idx'] for result in results] == [3, 6, 9]
+    assert [result['value'] for result in results] == [3., 6., 9.]
+
+    results = infer(frames[1:2])
+    assert model.batch_sizes == [3, 1]
+    assert results == [dict(idx=6, value=6.)]
@@ -326,6 +326,104 @@ def test_faster_rcnn_ohem_forward():
     assert total_loss > 0
 
 
+def _demo_relation_detector(num_imgs, num_classes=11, num_predicates=7):
+    """A two stage detector whose detections (fixed per image) and relation
+    head (linear on the boxes) do not need weights or statistics, with the
+    test of the relation head and its post processing."""
+    import torch.nn as nn
+    from mmdet.models.detectors import TwoStageDetector
+    from mmdet.models.relation_heads import RelationHead
+    from mmdet.models.relation_heads.approaches import PostProcessor
+
+    class DemoRelationHead(RelationHead):
+
+        def __init__(self):
+            nn.Module.__init__(self)
+            self.num_classes = num_classes
+            self.use_gt_box, self.use_gt_label = False, False
+            self.with_visual_mask = False
+            self.post_processor = PostProcessor()
+            self.obj_fc = nn.Linear(4, num_classes)
+            self.rel_fc = nn.Linear(8, num_predicates)
+
+        def forward(self, x, img_meta, det_result, is_testing=False,
+                    ignore_classes=None):
+            boxes = [bboxes[:, :4] / 100 for bboxes in det_result.bboxes]
+            pairs = [
+                torch.nonzero(1 - torch.eye(len(b), dtype=torch.long))
+                for b in boxes
+            ]
+            det_result.rel_pair_idxes = pairs
+            det_result.refine_scores = [self.obj_fc(b) for b in boxes]
+            det_result.rel_scores = [
+                self.rel_fc(torch.cat((b[p[:, 0]], b[p[:, 1]]), 1))
+                for b, p in zip(boxes, pairs)
+            ]
+            return det_result
+
+    class DemoRelationDetector(TwoStageDetector):
+
+        def __init__(self):
+            nn.Module.__init__(self)
+            self.relation_head = DemoRelationHead()
+            rng = np.random.RandomState(0)
+            self.detections = []
+            for num_objs in rng.randint(1, 10, num_imgs):
+                xy = rng.rand(num_objs, 2) * 200
+                wh = rng.rand(num_objs, 2) * 100 + 1
+                scores = rng.rand(num_objs, 1)
+                bboxes = np.hstack((xy, xy + wh, scores)).astype(np.float32)
+                dists = rng.dirichlet(np.ones(num_classes), num_objs)
+                self.detections.append(
+                    (torch.from_numpy(bboxes),
+                     torch.from_numpy(rng.randint(1, num_classes, num_objs)),
+                     torch.from_numpy(dists.astype(np.float32))))
+
+        def extract_feat(self, img):
+            return (img, )
+
+        def detector_simple_test(self, x, img_meta, *args, **kwargs):
+            dets = [self.detections[meta['idx']] for meta in img_meta]
+            # the post processing writes the scores in the boxes
+            return ([bboxes.clone() for bboxes, _, _ in dets],
+                    [labels for _, labels, _ in dets], None,
+                    [dists for _, _, dists in dets], None, None)
+
+    return DemoRelationDetector().eval()
+
+
+def test_relation_test_imgs_per_gpu():
+    """The relation test of several images per gpu gives the results of the
+    images tested one at a time."""
+    num_imgs = 3
+    detector = _demo_relation_detector(num_imgs)
+    img_metas = [
+        dict(idx=i, img_shape=(256, 256, 3), ori_shape=(256, 256, 3),
+             scale_factor=[1., 1.5, 2.][i]) for i in range(num_imgs)
+    ]
+    imgs = torch.zeros(num_imgs, 3, 256, 256)
+    with torch.no_grad():
+        batch_results = detector.forward_test([imgs], [img_metas],
+                                              relation_mode=True,
+                                              rescale=True)
+        assert len(batch_results) == num_imgs
+        for i, batch_result in enumerate(batch_results):
+            result = detector.forward_test([imgs[i:i + 1]],
+                                           [img_metas[i:i + 1]],
+                                           relation_mode=True,
+                                           rescale=True)
+            for key in [
+                    'refine_bboxes', 'refine_labels', 'refine_dists', 'rels',
+                    'rel_dists', 'triplet_scores'
+            ]:
+                np.testing.assert_allclose(
+                    getattr(batch_result, key), getattr(result, key),
+                    rtol=1e-5, err_msg=key)
+            for bboxes, expected in zip(batch_result.formatted_bboxes,
+                                        result.formatted_bboxes):
+                np.testing.assert_allclose(bboxes, expected, rtol=1e-5)
+
+
 def _demo_mm_inputs(input_shape=(1, 3, 300, 300),
                     num_items=None, num_classes=10):  # yapf: disable
     """
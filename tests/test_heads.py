@@ -4,6 +4,11 @@ import torch
 from mmdet.core import build_assigner, build_sampler
 from mmdet.models.anchor_heads import AnchorHead
 from mmdet.models.bbox_heads import BBoxHead
+from mmdet.models.captioners.utils import (Attention, LowRank,
+                                          LowRankBilinearDecBlock,
+                                          expand_tensor)
+from mmdet.models.relational_caption_heads.approaches import \
+    MultiHeadedAttention
 
 
 def test_anchor_head_loss():
@@ -338,3 +343,101 @@ def _demodata_refine_boxes(n_roi, n_img, rng=0):
         torch.from_numpy(p).sort(descending=True)[0] for p in _pos_is_gts
     ]
     return rois, labels, bbox_preds, pos_is_gts, img_metas
+
+
+def test_caption_attention_shared_memory():
+    """
+    Tests the attention of the beams on the memory of their sample, shared
+    by the beam search, against the memory expanded to every beam
+    """
+    torch.manual_seed(0)
+    batch_size, beam_size, att_num, dim = 3, 4, 7, 16
+    h = torch.randn(batch_size * beam_size, dim)
+    att_feats = torch.randn(batch_size, att_num, dim)
+    att_mask = torch.ones(batch_size, att_num)
+    att_mask[0, 5:] = 0
+    att_mask[2, 2:] = 0
+
+    def expand(x):
+        return expand_tensor(x, beam_size)
+
+    for need_attn in [False, True]:
+        attention = Attention(
+            mmcv.Config(dict(rnn_size=dim)),
+            mmcv.Config(
+                dict(
+                    att_hidden_size=8,
+                    att_hidden_drop=0,
+                    att_act='TANH',
+                    need_attn=need_attn))).eval()
+        p_att_feats = torch.randn(batch_size, att_num, 8)
+        shared = attention(h, att_feats, att_mask, p_att_feats)
+        expanded = attention(h, expand(att_feats), expand(att_mask),
+                             expand(p_att_feats))
+        if not need_attn:
+            shared, expanded = [shared], [expanded]
+        for x, y in zip(shared, expanded):
+            assert x.shape == y.shape
+            assert torch.allclose(x, y, atol=1e-6)
+
+    # the low rank attention of the X-LAN and X-Transformer decoders
+    for att_type, att_mid_dim in [('scatt', [8, 4, 8]),
+                                  ('basicatt', [8, 4, 1])]:
+        block = LowRankBilinearDecBlock(
+            mmcv.Config(
+                dict(
+                    bilinear_dim=dim,
+                    atttype=att_type,
+                    head=2,
+                    decode_att_mid_dim=att_mid_dim,
+                    decode_att_mid_dropout=0,
+                    decode_dropout=0,
+                    act='RELU',
+                    decode_layers=2))).eval()
+        p_att_feats = torch.cat(block.precompute(att_feats, att_feats), -1)
+        shared = block(h, att_feats, att_mask, p_att_feats, precompute=True)
+        expanded = block(h, expand(att_feats), expand(att_mask),
+                         expand(p_att_feats), precompute=True)
+        assert torch.allclose(shared[0], expanded[0], atol=1e-5)
+
+    # the cross attention of the relational caption heads
+    attention = MultiHeadedAttention(4, dim, 0.).eval()
+    query = torch.randn(batch_size * beam_size, 2, dim)
+    mask = att_mask[:, None].byte()
+    shared = attention(query, att_feats, att_feats, mask)
+    shared_attn = attention.attn
+    expanded = attention(query, expand(att_feats), expand(att_feats),
+                         expand(mask))
+    assert torch.allclose(shared, expanded, atol=1e-6)
+    assert torch.allclose(shared_attn, attention.attn, atol=1e-6)
+
+
+def test_low_rank_buffer_decoding():
+    """
+    Tests the step by step self attention of the X-Transformer decoder,
+    whose keys and values are buffered on the device of the module, against
+    the attention of each step on the whole prefix
+    """
+    torch.manual_seed(0)
+    batch_size, seq_len, dim = 3, 5, 16
+    for att_type, att_mid_dim in [('scatt', [8, 4, 8]),
+                                  ('basicatt', [8, 4, 1])]:
+        attention = LowRank(
+            embed_dim=dim,
+            att_type=att_type,
+            att_heads=2,
+            att_mid_dim=att_mid_dim,
+            att_mid_drop=0,
+            act='RELU').eval()
+        x = torch.randn(batch_size, seq_len, dim)
+        attention.init_buffer(batch_size)
+        assert attention.buffer_keys.device == x.device
+        words = [x[:, t:t + 1].contiguous() for t in range(seq_len)]
+        steps = [
+            attention.forward2(word, word, None, word, word) for word in words
+        ]
+        attention.clear_buffer()
+        for t, (word, step) in enumerate(zip(words, steps)):
+            prefix = x[:, :t + 1].contiguous()
+            expected = attention.forward2(word, prefix, None, word, prefix)
+            assert torch.allclose(step, expected, atol=1e-5)
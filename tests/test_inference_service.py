@@ -0,0 +1,161 @@
+import threading
+
+import pytest
+import torch
+from mmcv import Config
+from mmcv.parallel import DataContainer
+
+from mmdet.apis import InferenceService
+
+
+class _RelationTestModel(torch.nn.Module):
+    """Stub of a detector in the test: one result per image, one image
+    per forward outside of the relation test.
+
+    The forwards wait for `gate` once `entered` is set, so that the tests
+    can queue requests behind a running batch.
+    """
+
+    def __init__(self, fail_idx=None):
+        super(_RelationTestModel, self).__init__()
+        self.scale = torch.nn.Parameter(torch.ones(1))
+        self.cfg = Config(
+            dict(data=dict(test=dict(pipeline=[dict(type='LoadImage')]))))
+        self.fail_idx = fail_idx
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.batches = []
+
+    def forward(self, img, img_meta, return_loss=True, **kwargs):
+        assert not return_loss
+        idxes = [meta['idx'] for meta in img_meta[0]]
+        assert kwargs['relation_mode'] or len(idxes) == 1
+        self.entered.set()
+        assert self.gate.wait(10)
+        self.batches.append(idxes)
+        if self.fail_idx in idxes:
+            raise ValueError('bad image {}'.format(self.fail_idx))
+        results = [dict(idx=idx) for idx in idxes]
+        return results if len(results) > 1 else results[0]
+
+
+def _model_inputs(idx):
+    return dict(
+        img=[torch.full((3, 8, 12), float(idx))],
+        img_meta=[DataContainer(dict(idx=idx), cpu_only=True)])
+
+
+def _build_service(model, **kwargs):
+    service = InferenceService(model, **kwargs)
+    # the stub inputs replace the test pipeline
+    service.prepare = _model_inputs
+    return service
+
+
+def _block(model):
+    """Hold the next forward until the returned event is set."""
+    model.gate.clear()
+    model.entered.clear()
+    return model.gate
+
+
+def test_inference_service_batching():
+    model = _RelationTestModel()
+    with _build_service(model, max_batch_size=4, max_latency=0.05) as service:
+        gate = _block(model)
+        first = service.submit(0)
+        assert model.entered.wait(10)
+        # queued behind the running batch
+        futures = [service.submit(idx) for idx in range(1, 6)]
+        gate.set()
+        assert first.result(10) == dict(idx=0)
+        assert [f.result(10) for f in futures] == [
+            dict(idx=idx) for idx in range(1, 6)
+        ]
+        stats = service.stats()
+    # 0 alone, then 1-4 in a full batch and 5 after the latency
+    assert model.batches == [[0], [1, 2, 3, 4], [5]]
+    assert stats['batch_size']['counts'][:4] == [2, 0, 0, 1]
+    assert stats['latency']['total'] == 6
+
+
+def test_inference_service_detection_mode():
+    model = _RelationTestModel()
+    with _build_service(
+            model, max_batch_size=4, max_latency=0.05,
+            relation_mode=False) as service:
+        gate = _block(model)
+        first = service.submit(0)
+        assert model.entered.wait(10)
+        futures = [service.submit(idx) for idx in range(1, 4)]
+        gate.set()
+        assert first.result(10) == dict(idx=0)
+        assert [f.result(10) for f in futures] == [
+            dict(idx=idx) for idx in range(1, 4)
+        ]
+        stats = service.stats()
+    # a batch of the queue, but one image per forward
+    assert stats['batch_size']['counts'][:3] == [1, 0, 1]
+    assert model.batches == [[idx] for idx in range(4)]
+
+
+def test_inference_service_close():
+    model = _RelationTestModel()
+    service = _build_service(model, max_batch_size=2, max_latency=0.05)
+    futures = [service.submit(idx) for idx in range(5)]
+    # the queued requests are served before the worker stops
+    service.close()
+    assert [f.result(0) for f in futures] == [
+        dict(idx=idx) for idx in range(5)
+    ]
+    with pytest.raises(RuntimeError, match='closed'):
+        service.submit(5)
+    service.close()
+
+    # closing a service that was never started
+    service = _build_service(_RelationTestModel())
+    service.close()
+    with pytest.raises(RuntimeError, match='closed'):
+        service.infer(0)
+
+
+def test_inference_service_cancel():
+    model = _RelationTestModel()
+    with _build_service(model, max_batch_size=4, max_latency=0.05) as service:
+        gate = _block(model)
+        running = service.submit(0)
+        assert model.entered.wait(10)
+        futures = [service.submit(idx) for idx in range(1, 4)]
+        assert not running.cancel()
+        assert futures[1].cancel()
+        gate.set()
+        assert running.result(10) == dict(idx=0)
+        assert futures[0].result(10) == dict(idx=1)
+        assert futures[1].cancelled()
+        assert futures[2].result(10) == dict(idx=3)
+        # the worker survives the cancelled request
+        assert service.infer(4, timeout=10) == dict(idx=4)
+    assert sum(model.batches, []) == [0, 1, 3, 4]
+
+
+def test_inference_service_failure():
+    model = _RelationTestModel(fail_idx=1)
+    with _build_service(model, max_batch_size=4, max_latency=0.05) as service:
+        gate = _block(model)
+        first = service.submit(0)
+        assert model.entered.wait(10)
+        futures = [service.submit(idx) for idx in range(1, 3)]
+        gate.set()
+        assert first.result(10) == dict(idx=0)
+        # only the requests of the failed batch fail
+        for future in futures:
+            with pytest.raises(ValueError, match='bad image 1'):
+                future.result(10)
+        assert service.infer(3, timeout=10) == dict(idx=3)
+
+        # a batch that cannot be served fails its requests, not the worker
+        service.batch_size = None
+        with pytest.raises(AttributeError):
+            service.infer(4, timeout=10)
+        assert service._worker.is_alive()
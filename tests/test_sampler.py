@@ -1,7 +1,12 @@
+import numpy as np
 import torch
 
 from mmdet.core import MaxIoUAssigner
 from mmdet.core.bbox.samplers import OHEMSampler, RandomSampler
+from mmdet.datasets.loader import (DistributedGroupSampler, GroupSampler,
+                                   get_group_flag)
+from mmdet.models.relational_caption_heads.approaches import \
+    RelationalCapSampler
 
 
 def test_random_sampler():
@@ -247,3 +252,152 @@ def test_random_sample_result():
 
     for i in range(3):
         SamplingResult.random(rng=i)
+
+
+def _relcap_matching_loop(tgt_rels, is_match):
+    # the per-relation matching replaced in RelationalCapSampler.rel_sampling
+    num_prp = is_match.size(1)
+    binary_rel = torch.zeros((num_prp, num_prp), dtype=torch.long)
+    triplets = []
+    for i, (head, tail) in enumerate(tgt_rels.tolist()):
+        for prp_head in torch.nonzero(is_match[head]).view(-1).tolist():
+            for prp_tail in torch.nonzero(is_match[tail]).view(-1).tolist():
+                binary_rel[prp_head, prp_tail] = 1
+                binary_rel[prp_tail, prp_head] = 1
+                if prp_head != prp_tail:
+                    triplets.append((i, prp_head, prp_tail))
+    return triplets, binary_rel
+
+
+def test_relcap_rel_sampling():
+    torch.manual_seed(0)
+    num_tgt, num_prp, num_rel = 8, 30, 12
+    ious = torch.rand(num_tgt, num_prp)
+    is_match = ious > 0.6
+    tgt_rels = torch.randint(0, num_tgt, (num_rel, 2))
+    # the caption of the i-th relation is i, to trace the sampled pairs
+    cap_inputs = torch.arange(num_rel)[:, None].repeat(1, 5)
+    cap_targets = cap_inputs + 100
+    ipts = torch.arange(num_rel)
+    expected, expected_binary = _relcap_matching_loop(tgt_rels, is_match)
+
+    sampler = RelationalCapSampler(
+        pos_iou_thr=0.6,
+        num_sample_per_gt_rel=10000,
+        num_rel_per_image=10000,
+        use_gt_box=False)
+    pairs, inputs, targets, rel_ipts, binary_rel = sampler.rel_sampling(
+        'cpu', tgt_rels, cap_inputs, cap_targets, ipts, 10000, ious, is_match)
+    assert torch.equal(binary_rel, expected_binary)
+    assert torch.equal(inputs[:, 0], rel_ipts)
+    assert torch.equal(targets[:, 0], rel_ipts + 100)
+    triplets = list(zip(rel_ipts.tolist(), *pairs.t().tolist()))
+    assert sorted(triplets) == sorted(expected)
+
+    # at most 2 pairs of each relation, the weights are positive
+    sampler.num_sample_per_gt_rel = 2
+    pairs, _, _, rel_ipts, _ = sampler.rel_sampling(
+        'cpu', tgt_rels, cap_inputs, cap_targets, ipts, 10000, ious, is_match)
+    triplets = list(zip(rel_ipts.tolist(), *pairs.t().tolist()))
+    assert len(set(triplets)) == len(triplets)
+    assert set(triplets) <= set(expected)
+    for i in range(num_rel):
+        num_expected = sum(triplet[0] == i for triplet in expected)
+        assert (rel_ipts == i).sum().item() == min(num_expected, 2)
+
+    # at most num_per_img pairs
+    pairs, _, _, _, _ = sampler.rel_sampling('cpu', tgt_rels, cap_inputs,
+                                             cap_targets, ipts, 5, ious,
+                                             is_match)
+    assert len(pairs) == min(5, len(triplets))
+
+    # no matched pair: a single dummy pair
+    is_match = torch.zeros_like(is_match)
+    pairs, inputs, _, _, binary_rel = sampler.rel_sampling(
+        'cpu', tgt_rels, cap_inputs, cap_targets, ipts, 10000, ious, is_match)
+    assert pairs.tolist() == [[0, 0]] and inputs.shape == (1, 5)
+    assert binary_rel.sum() == 0
+
+
+def test_relcap_weighted_sample_per_group():
+    torch.manual_seed(0)
+    group_inds = torch.LongTensor([0, 0, 0, 0, 1, 1, 2])
+    group_sizes = torch.bincount(group_inds)
+    weights = torch.Tensor([0, 1, 0, 2, 3, 0, 1])
+    for _ in range(20):
+        keep = RelationalCapSampler._weighted_sample_per_group(
+            group_inds, group_sizes, weights, 2)
+        # the elements of weight 0 are only kept to fill a group
+        assert keep.tolist() == [False, True, False, True, True, True, True]
+
+
+class _DemoGroupDataset(object):
+
+    def __init__(self, num_imgs, with_gt_boxes=True):
+        rng = np.random.RandomState(0)
+        self.flag = rng.randint(0, 2, num_imgs).astype(np.uint8)
+        self.num_objs = rng.randint(0, 70, num_imgs)
+        if with_gt_boxes:
+            self.gt_boxes = [np.zeros((n, 4)) for n in self.num_objs]
+
+    def __len__(self):
+        return len(self.flag)
+
+    def get_ann_info(self, idx):
+        return dict(bboxes=np.zeros((self.num_objs[idx], 4)))
+
+
+def test_get_group_flag():
+    bounds = (10, 20, 40)
+    for with_gt_boxes in [True, False]:
+        dataset = _DemoGroupDataset(300, with_gt_boxes)
+        flag = get_group_flag(dataset, count_bounds=bounds)
+        for i, num_objs in enumerate(dataset.num_objs):
+            bucket = sum(num_objs >= bound for bound in bounds)
+            assert flag[i] == dataset.flag[i] * 4 + bucket
+        flag = get_group_flag(
+            dataset, count_bounds=(100, 400), count_type='pairs')
+        num_pairs = dataset.num_objs * np.maximum(dataset.num_objs - 1, 0)
+        expected = dataset.flag * 3 + (num_pairs >= 100) + (num_pairs >= 400)
+        assert (flag == expected).all()
+
+
+def test_group_samplers():
+    dataset = _DemoGroupDataset(1003)
+    flag = get_group_flag(dataset)
+    samples_per_gpu, num_replicas = 4, 4
+
+    np.random.seed(0)
+    sampler = GroupSampler(dataset, samples_per_gpu, flag=flag)
+    indices = list(sampler)
+    assert len(indices) == len(sampler)
+    assert set(indices) == set(range(len(dataset)))
+    for i in range(0, len(indices), samples_per_gpu):
+        assert len(set(flag[indices[i:i + samples_per_gpu]])) == 1
+
+    def rank_indices(seed, epoch, flag=flag):
+        indices = []
+        for rank in range(num_replicas):
+            sampler = DistributedGroupSampler(
+                dataset,
+                samples_per_gpu,
+                num_replicas,
+                rank,
+                flag=flag,
+                seed=seed)
+            sampler.set_epoch(epoch)
+            indices.append(list(sampler))
+            assert len(indices[-1]) == len(sampler)
+        return indices
+
+    indices = rank_indices(7, 3)
+    assert set(sum(indices, [])) == set(range(len(dataset)))
+    for rank_idx in indices:
+        for i in range(0, len(rank_idx), samples_per_gpu):
+            assert len(set(flag[rank_idx[i:i + samples_per_gpu]])) == 1
+    # the shuffling is seeded by seed + epoch, the same on every process
+    assert rank_indices(7, 3) == indices
+    assert rank_indices(10, 0) == indices
+    assert rank_indices(8, 3) != indices
+    # without flag and seed, the aspect ratio groups shuffled by the epoch
+    assert rank_indices(None, 3, None) == rank_indices(3, 0, dataset.flag)
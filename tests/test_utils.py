@@ -1,9 +1,370 @@
+import os.path as osp
+import random
+import tempfile
+
+import h5py
+import mmcv
+import numpy as np
 import numpy.testing as npt
+import pytest
+import torch
+from mmcv.parallel import DataContainer, scatter_kwargs
+from PIL import Image
 
+from mmdet.core.utils import (FeatureCache, FeatureCacheWriter, box_max,
+                              box_mean, box_sum, cache_image_values,
+                              cache_key, check_cache_entry, densify_relmap,
+                              integral_image, region_fill_index,
+                              relmap_triplets)
+from mmdet.datasets import DataPrefetcher
+from mmdet.datasets.saliency import SaliencyMapWriter
 from mmdet.utils.flops_counter import params_to_string
+from mmdet.utils.profiling import (format_peak_memory, peak_memory,
+                                    reset_peak_memory)
 
 
 def test_params_to_string():
     npt.assert_equal(params_to_string(1e9), '1000.0 M')
     npt.assert_equal(params_to_string(2e5), '200.0 k')
     npt.assert_equal(params_to_string(3e-9), '3e-09')
+
+
+def _region_fill_loop(x1, y1, x2, y2, featmap_size):
+    # the per-region painting replaced by region_fill_index
+    target = torch.full(featmap_size, -1, dtype=torch.long)
+    for i in range(x1.numel()):
+        target[y1[i]:y2[i] + 1, x1[i]:x2[i] + 1] = i
+    return target
+
+
+def test_region_fill_index():
+    rng = np.random.RandomState(0)
+    h, w, n = 13, 17, 40
+    x1, x2 = [torch.from_numpy(rng.randint(0, w, (2, n))) for _ in range(2)]
+    y1, y2 = [torch.from_numpy(rng.randint(0, h, (2, n))) for _ in range(2)]
+    # two sets of regions, some of them empty (x1 > x2 or y1 > y2)
+    last = region_fill_index(x1, y1, x2, y2, (h, w), chunk_size=7)
+    assert last.shape == (2, h, w)
+    for i in range(2):
+        target = _region_fill_loop(x1[i], y1[i], x2[i], y2[i], (h, w))
+        npt.assert_equal(last[i].numpy(), target.numpy())
+
+
+def test_region_fill_index_no_region():
+    empty = torch.zeros(0, dtype=torch.long)
+    last = region_fill_index(empty, empty, empty, empty, (5, 6))
+    npt.assert_equal(last.numpy(), -np.ones((5, 6)))
+    empty = torch.zeros(3, 0, dtype=torch.long)
+    last = region_fill_index(empty, empty, empty, empty, (5, 6))
+    npt.assert_equal(last.numpy(), -np.ones((3, 5, 6)))
+
+
+def _dense_relmap_loop(rels, num_box):
+    # the dense map formerly built by get_ann_info of the VG datasets
+    relation_map = np.zeros((num_box, num_box), dtype=np.int64)
+    for sub, obj, label in rels[:, :3].tolist():
+        if relation_map[sub, obj] > 0:
+            if random.random() > 0.5:
+                relation_map[sub, obj] = label
+        else:
+            relation_map[sub, obj] = label
+    return relation_map
+
+
+def test_relmap_triplets():
+    rng = np.random.RandomState(0)
+    num_box = 6
+    # many duplicated pairs to exercise the random label choice
+    rels = np.hstack((rng.randint(0, num_box, (40, 2)),
+                      rng.randint(1, 51, (40, 1)))).astype(np.int32)
+    random.seed(0)
+    expected = _dense_relmap_loop(rels, num_box)
+    random.seed(0)
+    triplets = relmap_triplets(rels)
+    assert triplets.dtype == np.int64 and triplets.shape[1] == 3
+    # sorted by pair, one triplet per pair
+    pairs = [tuple(pair) for pair in triplets[:, :2].tolist()]
+    assert pairs == sorted(set(pairs))
+    dense = densify_relmap(torch.from_numpy(triplets), num_box)
+    npt.assert_equal(dense.numpy(), expected)
+    # back to the triplets
+    npt.assert_equal(np.argwhere(expected), triplets[:, :2])
+
+    binary = relmap_triplets(rels, binary=True)
+    npt.assert_equal(binary[:, :2], triplets[:, :2])
+    assert (binary[:, 2] == 1).all()
+
+
+def test_relmap_triplets_no_relation():
+    triplets = relmap_triplets(np.zeros((0, 3), dtype=np.int32))
+    assert triplets.shape == (0, 3)
+    dense = densify_relmap(torch.from_numpy(triplets), 4)
+    npt.assert_equal(dense.numpy(), np.zeros((4, 4)))
+
+
+def _box_loop(maps, boxes, reduce, empty=0.):
+    # the per-box slicing replaced by the summed-area table
+    h, w = maps.shape[-2:]
+    values = []
+    for box in boxes.reshape(-1, boxes.shape[-1]).tolist():
+        map_ = maps[box[0]] if len(box) == 5 else maps
+        x1, y1, x2, y2 = [int(v) for v in box[-4:]]
+        x1, x2 = [min(max(x, 0), w - 1) for x in (x1, x2)]
+        y1, y2 = [min(max(y, 0), h - 1) for y in (y1, y2)]
+        region = map_[y1:y2 + 1, x1:x2 + 1]
+        values.append(reduce(region) if region.size else empty)
+    return np.array(values).reshape(boxes.shape[:-1])
+
+
+def test_integral_image():
+    rng = np.random.RandomState(0)
+    maps = rng.randint(0, 256, (3, 9, 11)).astype(np.uint8)
+    table = integral_image(maps)
+    assert table.dtype == np.float64 and table.shape == (3, 10, 12)
+    npt.assert_equal(table[:, 0], 0)
+    npt.assert_equal(table[:, :, 0], 0)
+    npt.assert_equal(table[:, -1, -1], maps.sum((1, 2)))
+    npt.assert_equal(table[1, 4, 7], maps[1, :4, :7].sum())
+    table_th = integral_image(torch.from_numpy(maps[0]))
+    assert isinstance(table_th, torch.Tensor)
+    npt.assert_equal(table_th.numpy(), table[0])
+
+
+def test_box_sum():
+    rng = np.random.RandomState(0)
+    h, w = 9, 11
+    maps = rng.rand(h, w)
+    table = integral_image(maps)
+    boxes = np.array([
+        [2, 3, 6, 7],  # inside
+        [0, 0, w - 1, h - 1],  # the whole map
+        [0, 4, 3, h - 1],  # on the left and bottom borders
+        [w - 1, 0, w - 1, 0],  # one pixel in the corner
+        [-5, -2, 4, 3],  # clipped to the top left
+        [7, 5, w + 3, h + 8],  # clipped to the bottom right
+        [5, 2, 4, 6],  # empty, x1 > x2
+        [1, 6, 8, 5],  # empty, y1 > y2
+    ])
+    npt.assert_allclose(box_sum(table, boxes), _box_loop(maps, boxes, np.sum))
+    sums = box_sum(torch.from_numpy(table), torch.from_numpy(boxes))
+    assert isinstance(sums, torch.Tensor)
+    npt.assert_allclose(sums.numpy(), _box_loop(maps, boxes, np.sum))
+    # 0 for the empty boxes, nan for their mean as of an empty slice
+    npt.assert_equal(box_sum(table, boxes)[-2:], 0)
+    npt.assert_allclose(
+        box_mean(table, boxes), _box_loop(maps, boxes, np.mean, np.nan))
+    npt.assert_allclose(
+        box_max(maps, boxes, chunk_size=3),
+        _box_loop(maps, boxes, np.max, -np.inf))
+    # the boxes are truncated to integers
+    npt.assert_allclose(
+        box_sum(table, boxes[:1] + 0.7), box_sum(table, boxes[:1]))
+
+
+def test_box_sum_batch():
+    rng = np.random.RandomState(0)
+    maps = rng.rand(4, 7, 8).astype(np.float32)
+    table = integral_image(maps)
+    x1, x2 = rng.randint(-2, 10, (2, 2, 30))
+    y1, y2 = rng.randint(-2, 9, (2, 2, 30))
+    rois = np.stack((rng.randint(0, 4, (2, 30)), x1, y1, x2, y2), -1)
+    sums = box_sum(table, rois)
+    assert sums.shape == (2, 30)
+    npt.assert_allclose(sums, _box_loop(maps, rois, np.sum), rtol=1e-5)
+    npt.assert_allclose(
+        box_mean(table, rois), _box_loop(maps, rois, np.mean, np.nan),
+        rtol=1e-5)
+    maxima = box_max(torch.from_numpy(maps), torch.from_numpy(rois))
+    npt.assert_allclose(maxima.numpy(), _box_loop(maps, rois, np.max, -np.inf))
+    try:
+        box_sum(table, rois[..., 1:])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the map index is needed for a batch of maps')
+    assert box_sum(table, np.zeros((0, 5), dtype=np.int64)).shape == (0, )
+
+
+def test_feature_cache():
+    rng = np.random.RandomState(0)
+    entries = dict()
+    for i in range(5):
+        img_meta = dict(
+            filename='images/{}.jpg'.format(i),
+            img_shape=(600, 800 + i, 3),
+            scale_factor=1.5,
+            flip=i % 2 == 1)
+        values = dict(
+            feats=rng.rand(2, 3, 4).astype(np.float32),
+            bboxes=rng.rand(i, 5).astype(np.float32),
+            labels=rng.randint(0, 10, i),
+            segms=[['rle'] * i],
+            dists=None)
+        values.update(cache_image_values(img_meta))
+        entries[cache_key(img_meta)] = (img_meta, values)
+    assert sorted(entries) == ['0', '1_flip', '2', '3_flip', '4']
+
+    with tempfile.TemporaryDirectory() as root:
+        # a shard per entry
+        writer = FeatureCacheWriter(root, shard_size=1, meta=dict(version=1))
+        for key, (_, values) in entries.items():
+            writer.put(key, values)
+        writer.close()
+        cache = FeatureCache(root)
+        assert len(cache) == len(entries) and len(cache.shards) == 5
+        assert cache.meta == dict(version=1) and '1' not in cache
+        for key, (img_meta, values) in entries.items():
+            cached = cache.get(key)
+            assert 'dists' not in cached
+            assert cached['segms'] == values['segms']
+            for name in ['feats', 'bboxes', 'labels']:
+                assert cached[name].dtype == values[name].dtype
+                npt.assert_equal(cached[name], values[name])
+                assert not cached[name].flags.writeable
+            check_cache_entry(cached, img_meta, key)
+
+        # the entry is rejected for another preprocessing of the image
+        img_meta, _ = entries['2']
+        cached = cache.get('2')
+        for other in [dict(scale_factor=2.), dict(img_shape=(600, 801, 3))]:
+            other_meta = dict(img_meta, **other)
+            try:
+                check_cache_entry(cached, other_meta, '2')
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('the cache of {} is accepted'.format(
+                    other_meta))
+        del cached['scale_factor']
+        try:
+            check_cache_entry(cached, img_meta, '2')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('an entry without scale_factor is accepted')
+
+
+def _assert_same_data(data, expected):
+    assert type(data) == type(expected)
+    if isinstance(expected, torch.Tensor):
+        assert data.device == expected.device
+        assert torch.equal(data, expected)
+    elif isinstance(expected, (list, tuple)):
+        assert len(data) == len(expected)
+        for x, y in zip(data, expected):
+            _assert_same_data(x, y)
+    elif isinstance(expected, dict):
+        assert data.keys() == expected.keys()
+        for key in expected:
+            _assert_same_data(data[key], expected[key])
+    else:
+        assert data == expected
+
+
+def test_data_prefetcher():
+    if not torch.cuda.is_available():
+        pytest.skip('test requires GPU and torch+cuda')
+    device_ids = list(range(torch.cuda.device_count()))
+    # 2 images per gpu, with a nested list of tensors as gt_rels
+    batches = [
+        dict(
+            img=DataContainer([torch.rand(2, 3, 8, 8) for _ in device_ids],
+                              stack=True),
+            gt_rels=DataContainer(
+                [[torch.randint(0, 5, (i + 1, 3)) for i in range(2)]
+                 for _ in device_ids]),
+            img_meta=DataContainer([[dict(idx=i)] * 2 for _ in device_ids],
+                                   cpu_only=True)) for i in range(3)
+    ]
+
+    class DemoLoader(list):
+        sampler = 'sampler'
+
+    prefetcher = DataPrefetcher(DemoLoader(batches), device_ids)
+    assert len(prefetcher) == 3 and prefetcher.sampler == 'sampler'
+    num_batches = 0
+    for batch, staged in zip(batches, prefetcher):
+        # the chunks are already on the devices of the scatter
+        for device_id, img in zip(device_ids, staged['img'].data):
+            assert img.device == torch.device('cuda', device_id)
+        assert staged['img_meta'] is batch['img_meta']
+        assert batch['img'].data[0].device.type == 'cpu'
+        # the model wrapper scatters them as the batch of the loader
+        _, expected = scatter_kwargs((), batch, device_ids)
+        _, scattered = scatter_kwargs((), staged, device_ids)
+        _assert_same_data(scattered, expected)
+        num_batches += 1
+    assert num_batches == 3
+
+
+def test_peak_memory_cpu():
+    device = torch.device('cpu')
+    base = reset_peak_memory(device)
+    if base is None:
+        assert peak_memory(device, base) == dict(peak_rss_delta_mb=None)
+        pytest.skip('the peak resident size cannot be reset')
+    # 64 MB, touched so that it is resident
+    x = np.ones(8 * 1024**2)
+    del x
+    record = peak_memory(device, base, 'test_')
+    assert record['test_peak_rss_delta_mb'] >= 60
+    assert format_peak_memory(record, 'test_').startswith('peak RSS +')
+    # the peak of the next runs does not include the former ones
+    base = reset_peak_memory(device)
+    assert peak_memory(device, base)['peak_rss_delta_mb'] < 60
+    assert format_peak_memory(dict(peak_memory_mb=12.3)) == 'peak 12 MB'
+    assert format_peak_memory(dict(peak_rss_delta_mb=None)) == 'peak RSS n/a'
+
+
+def test_saliency_map_writer():
+    rng = np.random.RandomState(0)
+    sal_maps = [
+        rng.randint(0, 256, shape).astype(np.uint8)
+        for shape in [(8, 12), (6, 6), (20, 10)]
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out = osp.join(tmp_dir, 'saliency.h5')
+        png_dir = osp.join(tmp_dir, 'png')
+        writer = SaliencyMapWriter(
+            3, out=out, png_dir=png_dir, map_size=16, num_threads=2)
+        assert writer.done_indices() == set()
+        writer.put(0, 'a/0.jpg', sal_maps[0])
+        writer.put(2, 'b/2.jpg', sal_maps[2])
+        writer.close()
+        npt.assert_array_equal(
+            np.array(Image.open(osp.join(png_dir, 'a/0.png'))), sal_maps[0])
+        with h5py.File(out, 'r') as h5:
+            npt.assert_array_equal(h5['valid'][:], [1, 0, 1])
+            # the longest side is resized to 16, the rest is zero-padded
+            npt.assert_array_equal(h5['image_heights'][:], [11, 0, 16])
+            npt.assert_array_equal(h5['image_widths'][:], [16, 0, 8])
+            npt.assert_array_equal(h5['original_heights'][:], [8, 0, 20])
+            npt.assert_array_equal(h5['original_widths'][:], [12, 0, 10])
+            assert h5['images'][0, 11:].sum() == 0
+            assert h5['images'][2, :, 8:].sum() == 0
+            first_row = h5['images'][0]
+
+        # the resume keeps the written rows and fills the others
+        writer = SaliencyMapWriter(3, out=out, map_size=16, resume=True)
+        assert writer.done_indices() == {0, 2}
+        writer.put(1, 'c/1.jpg', sal_maps[1])
+        writer.close()
+        with h5py.File(out, 'r') as h5:
+            npt.assert_array_equal(h5['valid'][:], [1, 1, 1])
+            npt.assert_array_equal(h5['images'][1],
+                                   mmcv.imresize(sal_maps[1], (16, 16)))
+            npt.assert_array_equal(h5['images'][0], first_row)
+
+        # the rows must match the image set
+        with pytest.raises(ValueError):
+            SaliencyMapWriter(4, out=out, map_size=16, resume=True)
+        # without resume the file is rewritten
+        writer = SaliencyMapWriter(3, out=out, map_size=16)
+        assert writer.done_indices() == set()
+        writer.close()
+
+        # a failed write is reported
+        writer = SaliencyMapWriter(3, png_dir=out, num_threads=1)
+        writer.put(0, '0.jpg', sal_maps[0])
+        with pytest.raises(RuntimeError):
+            writer.close()
@@ -0,0 +1,257 @@
+# ---------------------------------------------------------------
+# benchmark_caption.py
+# Measure the decoding throughput of the captioners and the relational caption heads.
+# The models are built from the configs with random weights and fed with synthetic
+# features, so neither checkpoints nor datasets are required.
+# ---------------------------------------------------------------
+import argparse
+import copy
+import json
+import os.path as osp
+import tempfile
+import time
+from contextlib import contextmanager
+
+import mmcv
+import torch
+from mmcv import Config
+
+from mmdet.models import build_captioner, build_head
+from mmdet.models.relation_heads.approaches import Result
+import mmdet.models.relational_caption_heads.relational_caption_head as relcaption_module
+from mmdet.utils.profiling import format_peak_memory, peak_memory, reset_peak_memory, synchronize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark caption decoding')
+    parser.add_argument('configs', nargs='+', help='captioning / relcaption config files')
+    parser.add_argument(
+        '--captioner-types',
+        nargs='+',
+        default=None,
+        help='also benchmark these registered captioners with the model dict of '
+             'each captioning config, e.g. UpDownCaptioner XlanCaptioner XTransformerCaptioner')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--beam-sizes', type=int, nargs='+', default=[1, 3],
+                        help='beam size 1 means greedy decoding')
+    parser.add_argument('--num-att', type=int, default=36,
+                        help='number of region features per image for the captioners')
+    parser.add_argument('--num-objs', type=int, default=20,
+                        help='number of objects per image for the relcaption heads')
+    parser.add_argument('--num-pairs', type=int, default=64,
+                        help='number of relation pairs per image for the relcaption heads')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='output json report')
+    args = parser.parse_args()
+    return args
+
+
+def _count_tokens(seqs):
+    # the sequences are padded with 0 after the end of the sentence
+    return int((seqs > 0).sum().item())
+
+
+def timeit(run, device, warmup, repeat):
+    """Run the closure warmup + repeat times. The closure returns
+    (num_sequences, num_tokens) of one decoding pass."""
+    with torch.no_grad():
+        for _ in range(warmup):
+            run()
+        synchronize(device)
+        base = reset_peak_memory(device)
+        num_seqs, num_tokens = 0, 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            seqs, tokens = run()
+            num_seqs += seqs
+            num_tokens += tokens
+        synchronize(device)
+        elapsed = time.perf_counter() - start
+    return dict(time_per_iter=elapsed / repeat,
+                seqs_per_sec=num_seqs / elapsed,
+                tokens_per_sec=num_tokens / elapsed,
+                tokens_per_seq=num_tokens / max(num_seqs, 1),
+                **peak_memory(device, base))
+
+
+def build_benchmark_captioner(model_cfg, vocab_file, device):
+    model_cfg = copy.deepcopy(model_cfg)
+    model_cfg.vocab = vocab_file
+    model = build_captioner(model_cfg)
+    if hasattr(model, 'init_weights'):
+        model.init_weights()
+    return model.to(device).eval()
+
+
+def captioner_runner(model, model_cfg, batch_size, beam_size, num_att, device):
+    att_dim = model_cfg.attention_feat_config.att_feats_dim
+    gv_cfg = model_cfg.global_feat_config
+    # the empty global feature (B x 1) lets the captioner use the mean of the att feats.
+    if gv_cfg is not None and gv_cfg.get('gvfeat_embed_dim', -1) > 0:
+        gv_feat = torch.randn(batch_size, gv_cfg.gvfeat_dim, device=device)
+    else:
+        gv_feat = torch.zeros(batch_size, 1, device=device)
+    att_feats = torch.randn(batch_size, att_dim, num_att, device=device)  # N x dim x Nr
+    img_meta = [dict(num_att=num_att) for _ in range(batch_size)]
+
+    def run():
+        if beam_size > 1:
+            seqs, _ = model.decode_beam(img_meta, gv_feat, att_feats, beam_size)
+        else:
+            seqs, _ = model.decode(img_meta, gv_feat, att_feats, greedy_decode=True)
+        return seqs.size(0), _count_tokens(seqs)
+
+    return run
+
+
+@contextmanager
+def _placeholder_relcaption_dicts(vocab_size, num_classes):
+    """The relcaption heads read the VG class/token lists when they are built.
+    Use placeholder lists while building when the dataset dictionary is not available."""
+    get_classes, get_tokens = relcaption_module.get_classes, relcaption_module.get_tokens
+    try:
+        get_classes('visualgenomegn')
+        get_tokens('visualgenomegn')
+    except (IOError, OSError):
+        relcaption_module.get_classes = lambda dataset: ['obj_%d' % i for i in range(num_classes - 1)]
+        relcaption_module.get_tokens = lambda dataset: ['tok_%d' % i for i in range(vocab_size)]
+    try:
+        yield
+    finally:
+        relcaption_module.get_classes, relcaption_module.get_tokens = get_classes, get_tokens
+
+
+def build_benchmark_relcaption_head(head_cfg, device):
+    head_cfg = copy.deepcopy(head_cfg)
+    single_dim = head_cfg.bbox_roi_extractor.fc_out_channels
+    union_dim = head_cfg.relation_roi_extractor.fc_out_channels
+    spatial_cfg = head_cfg.relation_roi_extractor.get('spatial_cfg', None)
+    if spatial_cfg is not None:
+        union_dim += spatial_cfg.fc_out_dim
+    # the features are synthesized, so the extractors and the sampler are not needed.
+    for key in ('bbox_roi_extractor', 'relation_roi_extractor', 'relation_sampler'):
+        head_cfg.pop(key, None)
+
+    with _placeholder_relcaption_dicts(head_cfg.caption_config.vocab_size, head_cfg.head_config.num_classes):
+        head = build_head(head_cfg)
+    head.init_weights()
+    return head.to(device).eval(), single_dim, union_dim
+
+
+def relcaption_runner(head, single_dim, union_dim, batch_size, beam_size, num_objs, num_pairs, device):
+    num_pairs = min(num_pairs, num_objs * (num_objs - 1))
+    rel_pair_idxes = []
+    for _ in range(batch_size):
+        pairs = torch.randint(0, num_objs - 1, (num_pairs, 2), device=device)
+        pairs[:, 1] += (pairs[:, 1] >= pairs[:, 0]).long()  # no self pairs
+        rel_pair_idxes.append(pairs)
+    roi_feats = torch.randn(batch_size * num_objs, single_dim, device=device)
+    union_feats = torch.randn(batch_size * num_pairs, union_dim, device=device)
+
+    def frontend_features(img, det_result, gt_result):
+        det_result.rel_pair_idxes = rel_pair_idxes
+        return roi_feats, union_feats, det_result
+
+    img = [torch.empty(batch_size, 0, device=device)]
+    img_meta = [dict(img_shape=(800, 800, 3)) for _ in range(batch_size)]
+
+    def run():
+        det_result = Result(bboxes=[torch.zeros(num_objs, 5, device=device) for _ in range(batch_size)],
+                            img_shape=[meta['img_shape'] for meta in img_meta])
+        # the synthetic features replace the extractors during the call only
+        head.frontend_features = frontend_features
+        try:
+            det_result = head(img, img_meta, det_result, is_testing=True, downstreaming=True, beam_size=beam_size)
+        finally:
+            del head.frontend_features
+        num_seqs, num_tokens = 0, 0
+        for key in ('cap_seqs', 'rel_cap_seqs'):
+            seqs = getattr(det_result, key, None)
+            if seqs is not None:
+                num_seqs += seqs.size(0)
+                num_tokens += _count_tokens(seqs)
+        return num_seqs, num_tokens
+
+    return run
+
+
+def collect_models(args):
+    """Return (name, kind, cfg) for every model to benchmark."""
+    models = []
+    for config in args.configs:
+        cfg = Config.fromfile(config)
+        config_name = osp.splitext(osp.basename(config))[0]
+        if cfg.model.get('relcaption_head', None) is not None:
+            head_cfg = cfg.model.relcaption_head
+            models.append(('{}:{}'.format(config_name, head_cfg.type), 'relcaption', head_cfg))
+            continue
+        model_types = [cfg.model.type]
+        if args.captioner_types is not None:
+            model_types += [t for t in args.captioner_types if t != cfg.model.type]
+        for model_type in model_types:
+            model_cfg = copy.deepcopy(cfg.model)
+            model_cfg.type = model_type
+            models.append(('{}:{}'.format(config_name, model_type), 'captioner', model_cfg))
+    return models
+
+
+def benchmark_model(name, kind, cfg, args, vocab_file, device):
+    records = []
+    try:
+        if kind == 'captioner':
+            # the captioners only need the number of words, write a placeholder vocabulary.
+            with open(vocab_file, 'w') as f:
+                f.write('\n'.join('word_%d' % i for i in range(cfg.vocab_size)))
+            model = build_benchmark_captioner(cfg, vocab_file, device)
+        else:
+            head, single_dim, union_dim = build_benchmark_relcaption_head(cfg, device)
+    except Exception as e:
+        print('{}: failed to build ({!r})'.format(name, e))
+        return [dict(model=name, kind=kind, error='build: {!r}'.format(e))]
+
+    for batch_size in args.batch_sizes:
+        for beam_size in args.beam_sizes:
+            record = dict(model=name, kind=kind, batch_size=batch_size, beam_size=beam_size,
+                          decode='greedy' if beam_size == 1 else 'beam')
+            try:
+                if kind == 'captioner':
+                    run = captioner_runner(model, cfg, batch_size, beam_size, args.num_att, device)
+                else:
+                    run = relcaption_runner(head, single_dim, union_dim, batch_size, beam_size,
+                                            args.num_objs, args.num_pairs, device)
+                record.update(timeit(run, device, args.warmup, args.repeat))
+                print('{model} bs={batch_size} beam={beam_size}: {seqs_per_sec:.1f} seqs/s, '
+                      '{tokens_per_sec:.1f} tokens/s, '.format(**record) + format_peak_memory(record))
+            except Exception as e:
+                print('{} bs={} beam={}: failed ({!r})'.format(name, batch_size, beam_size, e))
+                record['error'] = repr(e)
+            records.append(record)
+    return records
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+
+    report = dict(device=str(device), torch=torch.__version__, num_att=args.num_att,
+                  num_objs=args.num_objs, num_pairs=args.num_pairs, warmup=args.warmup,
+                  repeat=args.repeat, results=[])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vocab_file = osp.join(tmp_dir, 'vocabulary.txt')
+        for name, kind, cfg in collect_models(args):
+            report['results'] += benchmark_model(name, kind, cfg, args, vocab_file, device)
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+
+    if args.out is not None:
+        mmcv.dump(report, args.out)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
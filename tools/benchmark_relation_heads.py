@@ -0,0 +1,316 @@
+# ---------------------------------------------------------------
+# benchmark_relation_heads.py
+# Measure the training (forward / backward) and testing latency of the relation heads in
+# isolation. The heads are built from their configs with random weights and synthetic
+# statistics, and fed with synthetic FPN feature maps and scene graphs, so neither
+# checkpoints nor datasets are required.
+# ---------------------------------------------------------------
+import argparse
+import copy
+import glob
+import json
+import os.path as osp
+import re
+import sys
+import tempfile
+import time
+
+import mmcv
+import numpy as np
+import torch
+from mmcv import Config
+
+import mmdet
+from mmdet.core import relmap_triplets
+from mmdet.models import build_head
+from mmdet.models.relation_heads.approaches import Result
+from mmdet.utils.profiling import format_peak_memory, peak_memory, reset_peak_memory, synchronize
+
+HEAD_TYPES = ['MotifHead', 'VCTreeHead', 'IMPHead', 'KERNHead', 'TransformerHead', 'GPSHead',
+              'HETHead', 'VTransEHead', 'CausalHead', 'SoktHead', 'VRPHead']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the relation heads')
+    parser.add_argument('configs', nargs='*',
+                        help='SGG config files, default: the first config of every head type '
+                             'found in --config-dir (PredCls configs first)')
+    parser.add_argument('--config-dir', default='configs')
+    parser.add_argument('--heads', nargs='+', default=HEAD_TYPES, help='head types to benchmark')
+    parser.add_argument('--num-objs', type=int, nargs='+', default=[10, 40, 80])
+    parser.add_argument('--num-imgs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--rels-per-obj', type=float, default=1.,
+                        help='number of gt relations per object')
+    parser.add_argument('--img-scale', type=int, nargs=2, default=[592, 800], help='(h, w) of the images')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='output json report')
+    args = parser.parse_args()
+    return args
+
+
+def find_configs(config_dir, head_types):
+    """Return {head type: config file}, the PredCls configs are preferred."""
+    files = sorted(glob.glob(osp.join(config_dir, '**', '*.py'), recursive=True),
+                   key=lambda f: ('PredCls' not in osp.basename(f), f))
+    configs = dict()
+    for config in files:
+        with open(config) as f:
+            text = f.read()
+        match = re.search(r"relation_head=dict\(\s*type='(\w+)'", text)
+        if match is not None and match.group(1) in head_types:
+            configs.setdefault(match.group(1), config)
+    return configs
+
+
+def _set_cpu_roi_layers(cfg):
+    """The RoIAlign op of mmdet has no CPU kernel, use the one of torchvision."""
+    if isinstance(cfg, dict):
+        if cfg.get('type', None) == 'RoIAlign':
+            cfg['use_torchvision'] = True
+        for value in cfg.values():
+            _set_cpu_roi_layers(value)
+    elif isinstance(cfg, (list, tuple)):
+        for value in cfg:
+            _set_cpu_roi_layers(value)
+
+
+def _patch_word_vectors():
+    """The heads initialize their class embeddings with GloVe. The weights are random
+    anyway, so do not read (or download) the word vectors."""
+    def random_vectors(names, wv_dir=None, wv_type='glove.6B', wv_dim=300):
+        return torch.randn(len(names), wv_dim)
+
+    for name, module in list(sys.modules.items()):
+        if name.startswith('mmdet.models') and hasattr(module, 'obj_edge_vectors'):
+            module.obj_edge_vectors = random_vectors
+
+
+def write_statistics(head_cfg, tmp_dir, rng):
+    """Synthetic frequency statistics with the class numbers of the head."""
+    num_classes, num_predicates = head_cfg.num_classes, head_cfg.num_predicates
+    fg_matrix = rng.randint(0, 100, (num_classes, num_classes, num_predicates)).astype(np.int64)
+    pred_dist = np.log(fg_matrix / fg_matrix.sum(2)[:, :, None] + 1e-3)
+    statistics = dict(fg_matrix=torch.from_numpy(fg_matrix),
+                      pred_dist=torch.from_numpy(pred_dist).float(),
+                      obj_classes=['__background__'] + ['obj_%d' % i for i in range(num_classes - 1)],
+                      rel_classes=['__background__'] + ['rel_%d' % i for i in range(num_predicates - 1)],
+                      att_classes=['__background__'])
+    head_cfg.dataset_config.cache = osp.join(tmp_dir, 'statistics.pth')
+    torch.save(statistics, head_cfg.dataset_config.cache)
+
+    object_freq = rng.randint(1, 100, num_classes - 1).astype(np.float64)
+    head_cfg.dataset_config.object_cache = osp.join(tmp_dir, 'object_statistics.pth')
+    torch.save(dict(logit=object_freq, prob=object_freq / object_freq.sum()),
+               head_cfg.dataset_config.object_cache)
+
+
+def uses_masks_or_points(head_cfg):
+    """Whether the RoI extractors of the head read the masks or points of the objects, which the synthetic
+    inputs do not have."""
+    for key in ('bbox_roi_extractor', 'relation_roi_extractor'):
+        extractor_cfg = head_cfg.get(key, None)
+        if extractor_cfg is not None and (extractor_cfg.get('with_visual_mask', False) or
+                                          extractor_cfg.get('with_visual_point', False)):
+            return True
+    return False
+
+
+def build_benchmark_head(head_cfg, tmp_dir, rng, device):
+    head_cfg = copy.deepcopy(head_cfg)
+    # PredCls: the boxes and labels are given, the heads only predict the relations.
+    head_cfg.head_config.use_gt_box = True
+    head_cfg.head_config.use_gt_label = True
+    if device.type == 'cpu':
+        _set_cpu_roi_layers(head_cfg)
+    write_statistics(head_cfg, tmp_dir, rng)
+    head = build_head(head_cfg)
+    head.init_weights()
+    return head.to(device)
+
+
+def synthetic_inputs(head, num_imgs, num_objs, rels_per_obj, img_scale, rng, device):
+    """FPN feature maps, image metas and (det_result, gt_result) factories."""
+    h, w = img_scale
+    extractor = head.bbox_roi_extractor
+    feats = tuple(torch.randn(num_imgs, extractor.in_channels, int(np.ceil(h / s)), int(np.ceil(w / s)),
+                              device=device) for s in extractor.featmap_strides)
+    img_meta = [dict(img_shape=(h, w, 3), ori_shape=(h, w, 3), pad_shape=(h, w, 3),
+                     scale_factor=1.0, flip=False) for _ in range(num_imgs)]
+
+    num_rels = min(max(int(num_objs * rels_per_obj), 1), num_objs * (num_objs - 1))
+    bboxes, labels, rels = [], [], []
+    for _ in range(num_imgs):
+        wh = rng.uniform(16, [w / 2., h / 2.], (num_objs, 2))
+        xy = rng.uniform(0, 1, (num_objs, 2)) * ([w, h] - wh)
+        bboxes.append(np.hstack([xy, xy + wh - 1]).astype(np.float32))
+        labels.append(rng.randint(1, head.num_classes, num_objs))
+        # distinct (subject, object) pairs without self pairs
+        pairs = rng.choice(num_objs * (num_objs - 1), num_rels, replace=False)
+        sub, obj = pairs // (num_objs - 1), pairs % (num_objs - 1)
+        obj += (obj >= sub)
+        rels.append(np.stack([sub, obj, rng.randint(1, head.num_predicates, num_rels)], 1))
+    relmaps = [torch.from_numpy(relmap_triplets(r)).to(device) for r in rels]
+    bboxes = [torch.from_numpy(b).to(device) for b in bboxes]
+    labels = [torch.from_numpy(l).long().to(device) for l in labels]
+    rels = [torch.from_numpy(r).long().to(device) for r in rels]
+    img_shape = [meta['img_shape'] for meta in img_meta]
+
+    def det_result():
+        return Result(bboxes=bboxes, labels=labels, target_labels=labels, img_shape=img_shape)
+
+    def gt_result():
+        return Result(bboxes=bboxes, labels=labels, rels=rels, relmaps=relmaps,
+                      rel_pair_idxes=[rel[:, :2].clone() for rel in rels],
+                      rel_labels=[rel[:, -1].clone() for rel in rels], img_shape=img_shape)
+
+    return feats, img_meta, det_result, gt_result
+
+
+def _sum_losses(losses):
+    loss = 0
+    for name, value in losses.items():
+        if 'loss' not in name:
+            continue
+        if isinstance(value, (list, tuple)):
+            loss = loss + sum(v.mean() for v in value)
+        else:
+            loss = loss + value.mean()
+    return loss
+
+
+def _num_pairs(det_result):
+    return sum(len(pairs) for pairs in det_result.rel_pair_idxes)
+
+
+def benchmark_train(head, feats, img_meta, det_result, gt_result, device, warmup, repeat):
+    head.train()
+
+    def run():
+        start = time.perf_counter()
+        result = head(feats, img_meta, det_result(), gt_result())
+        loss = _sum_losses(head.loss(result))
+        synchronize(device)
+        forward_end = time.perf_counter()
+        loss.backward()
+        synchronize(device)
+        head.zero_grad()
+        return forward_end - start, time.perf_counter() - forward_end, _num_pairs(result)
+
+    for _ in range(warmup):
+        run()
+    base = reset_peak_memory(device)
+    forward_time, backward_time, num_pairs = 0., 0., 0
+    for _ in range(repeat):
+        t_forward, t_backward, pairs = run()
+        forward_time += t_forward
+        backward_time += t_backward
+        num_pairs += pairs
+    return dict(train_forward_ms=forward_time / repeat * 1000,
+                train_backward_ms=backward_time / repeat * 1000,
+                train_pairs=num_pairs / repeat,
+                train_pairs_per_sec=num_pairs / (forward_time + backward_time),
+                **peak_memory(device, base, 'train_'))
+
+
+def benchmark_test(head, feats, img_meta, det_result, device, warmup, repeat):
+    head.eval()
+
+    def run():
+        result = head(feats, img_meta, det_result(), is_testing=True)
+        num_pairs = _num_pairs(result)
+        head.post_processor(result)
+        return num_pairs
+
+    with torch.no_grad():
+        for _ in range(warmup):
+            run()
+        synchronize(device)
+        base = reset_peak_memory(device)
+        num_pairs = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            num_pairs += run()
+        synchronize(device)
+        elapsed = time.perf_counter() - start
+    return dict(test_ms=elapsed / repeat * 1000,
+                test_pairs=num_pairs / repeat,
+                test_pairs_per_sec=num_pairs / elapsed,
+                **peak_memory(device, base, 'test_'))
+
+
+def benchmark_head(head_type, config, args, tmp_dir, device):
+    rng = np.random.RandomState(args.seed)
+    name = '{}:{}'.format(osp.splitext(osp.basename(config))[0], head_type)
+    try:
+        cfg = Config.fromfile(config)
+        if uses_masks_or_points(cfg.model.relation_head):
+            print('{}: skipped, the synthetic inputs have no masks or points'.format(name))
+            return [dict(head=head_type, config=config, skipped='the synthetic inputs have no masks or points')]
+        head = build_benchmark_head(cfg.model.relation_head, tmp_dir, rng, device)
+    except Exception as e:
+        print('{}: failed to build ({!r})'.format(name, e))
+        return [dict(head=head_type, config=config, error='build: {!r}'.format(e))]
+
+    records = []
+    for num_objs in args.num_objs:
+        for num_imgs in args.num_imgs:
+            record = dict(head=head_type, config=config, num_objs=num_objs, num_imgs=num_imgs)
+            try:
+                feats, img_meta, det_result, gt_result = synthetic_inputs(
+                    head, num_imgs, num_objs, args.rels_per_obj, args.img_scale, rng, device)
+                record.update(benchmark_train(head, feats, img_meta, det_result, gt_result, device,
+                                              args.warmup, args.repeat))
+                record.update(benchmark_test(head, feats, img_meta, det_result, device,
+                                             args.warmup, args.repeat))
+                print('{} objs={} imgs={}: train {train_forward_ms:.1f} + {train_backward_ms:.1f} ms, '
+                      'test {test_ms:.1f} ms, {test_pairs_per_sec:.0f} pairs/s, train {}, test {}'.format(
+                          name, num_objs, num_imgs, format_peak_memory(record, 'train_'),
+                          format_peak_memory(record, 'test_'), **record))
+            except Exception as e:
+                print('{} objs={} imgs={}: failed ({!r})'.format(name, num_objs, num_imgs, e))
+                record['error'] = repr(e)
+            records.append(record)
+    return records
+
+
+def main():
+    args = parse_args()
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    _patch_word_vectors()
+
+    if args.configs:
+        configs = dict()
+        for config in args.configs:
+            head_type = Config.fromfile(config).model.relation_head.type
+            configs.setdefault(head_type, config)
+        head_types = list(configs)
+    else:
+        configs = find_configs(args.config_dir, args.heads)
+        head_types = args.heads
+
+    report = dict(device=str(device), torch=torch.__version__, mmdet=mmdet.__version__,
+                  num_threads=torch.get_num_threads(), img_scale=args.img_scale,
+                  rels_per_obj=args.rels_per_obj, warmup=args.warmup, repeat=args.repeat,
+                  results=[])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for head_type in head_types:
+            if head_type not in configs:
+                print('{}: no config found'.format(head_type))
+                report['results'].append(dict(head=head_type, error='no config found'))
+                continue
+            report['results'] += benchmark_head(head_type, configs[head_type], args, tmp_dir, device)
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+
+    if args.out is not None:
+        mmcv.dump(report, args.out)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
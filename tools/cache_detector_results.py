@@ -0,0 +1,121 @@
+"""Run the frozen detector of a SGG / relational caption config once over a split and
+write the FPN features and the detection results to a sharded memory-mapped store.
+
+Training then reads the store by setting, in the config:
+    model = dict(..., feature_cache=dict(root='data/cache/xxx'))
+The cache holds the features of the fixed augmentation only (no flip by default, use
+--flip to also cache the flipped images), the images missing in the cache are computed
+by the detector as usual.
+"""
+import argparse
+import copy
+import math
+
+import mmcv
+import torch
+from mmcv.parallel import scatter
+from mmcv.runner import load_checkpoint
+
+from mmdet.core.utils import FeatureCacheWriter, cache_image_values, cache_key
+from mmdet.datasets import build_dataloader, build_dataset
+from mmdet.models import build_detector
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Cache the results of the frozen detector')
+    parser.add_argument('config', help='SGG / relcaption config file path')
+    parser.add_argument('out', help='root directory of the cache')
+    parser.add_argument('--checkpoint', help='detector checkpoint, default: load_from of the config')
+    parser.add_argument('--split', default='train', choices=['train', 'val', 'test'])
+    parser.add_argument('--flip', action='store_true', help='also cache the flipped images')
+    parser.add_argument('--dtype', default='float16', choices=['float16', 'float32'],
+                        help='storage type of the features')
+    parser.add_argument('--shard-size', type=int, default=4, help='shard size in GB')
+    parser.add_argument('--num-parts', type=int, default=1,
+                        help='split the dataset into parts that are cached by separate processes')
+    parser.add_argument('--part-id', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+    return args
+
+
+def set_flip(pipeline, flip_ratio):
+    pipeline = copy.deepcopy(pipeline)
+    for transform in pipeline:
+        if transform['type'] == 'RandomFlip':
+            transform['flip_ratio'] = flip_ratio
+    return pipeline
+
+
+def to_numpy(value):
+    if isinstance(value, torch.Tensor):
+        return value.cpu().numpy()
+    return value
+
+
+def main():
+    args = parse_args()
+    cfg = mmcv.Config.fromfile(args.config)
+    cfg.model.pretrained = None
+
+    model = build_detector(cfg.model, train_cfg=cfg.train_cfg, test_cfg=cfg.test_cfg)
+    checkpoint = args.checkpoint if args.checkpoint is not None else cfg.load_from
+    load_checkpoint(model, checkpoint, map_location='cpu', strict=False)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = model.to(device).eval()
+    head = model.relation_head if model.with_relation else model.relcaption_head
+
+    writer, strides = None, None
+    for flip_ratio in ([0, 1] if args.flip else [0]):
+        dataset_cfg = copy.deepcopy(cfg.data[args.split])
+        dataset_cfg.pipeline = set_flip(cfg.train_pipeline, flip_ratio)
+        dataset_cfg.test_mode = False
+        dataset = build_dataset(dataset_cfg)
+        if args.num_parts > 1:
+            dataset = torch.utils.data.Subset(dataset, list(range(args.part_id, len(dataset), args.num_parts)))
+        # one image per batch: the features are cached with the padding of the image itself.
+        data_loader = build_dataloader(dataset, imgs_per_gpu=1, workers_per_gpu=args.workers,
+                                       dist=False, shuffle=False)
+
+        prog_bar = mmcv.ProgressBar(len(dataset))
+        for data in data_loader:
+            data = scatter(data, [device.index if device.type == 'cuda' else -1])[0]
+            img, img_meta = data['img'], data['img_meta']
+            with torch.no_grad():
+                x = model.extract_feat(img)
+                bboxes, labels, _, dists, masks, points = model.detector_simple_test(
+                    x, img_meta, data['gt_bboxes'], data['gt_labels'], data.get('gt_masks', None),
+                    use_gt_box=head.use_gt_box, use_gt_label=head.use_gt_label, is_testing=True)
+
+            if writer is None:
+                strides = [2 ** int(round(math.log2(img.size(3) / feat.size(3)))) for feat in x]
+                meta = dict(strides=strides, channels=[feat.size(1) for feat in x],
+                            use_gt_box=head.use_gt_box, use_gt_label=head.use_gt_label,
+                            config=args.config, checkpoint=checkpoint)
+                writer = FeatureCacheWriter(args.out, prefix='part{:03d}'.format(args.part_id),
+                                            shard_size=args.shard_size * 1024 ** 3, meta=meta)
+
+            pad_h, pad_w = img_meta[0]['pad_shape'][:2]
+            values = cache_image_values(img_meta[0])
+            for lvl, (feat, stride) in enumerate(zip(x, strides)):
+                h, w = int(math.ceil(pad_h / stride)), int(math.ceil(pad_w / stride))
+                values['feat_{}'.format(lvl)] = feat[0, :, :h, :w].cpu().numpy().astype(args.dtype)
+            if not head.use_gt_box:
+                values['bboxes'] = to_numpy(bboxes[0])
+            if not head.use_gt_label:
+                values['labels'] = to_numpy(labels[0])
+                values['dists'] = to_numpy(dists[0])
+            if masks is not None and data.get('gt_masks', None) is None:
+                values['masks'] = masks[0]
+            if points:
+                values['points'] = points[0]
+            writer.put(cache_key(img_meta[0]), values)
+            prog_bar.update()
+
+    if writer is not None:
+        writer.close()
+    print('\nThe cache is written to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Export the relation head of a SGG model to TorchScript and ONNX.
+
+The head is wrapped by ExportableRelationHead: the inputs are the feature maps of the
+neck, the rois, labels and class distributions of the objects, the pairs and the image
+shapes, the outputs are the object and relation scores (see its docstring). The eager
+wrapper and the traced graphs are checked on CPU against the test forward of the head
+itself, model.relation_head(..., is_testing=True), with other numbers of images, objects
+and pairs than the ones used for the tracing.
+
+    python tools/export_relation_head.py CONFIG CHECKPOINT --out work_dirs/motif_head
+    # writes work_dirs/motif_head.pt (TorchScript) and work_dirs/motif_head.onnx
+"""
+import argparse
+
+import mmcv
+import numpy as np
+import torch
+from mmcv.runner import load_checkpoint
+
+from mmdet.models import build_detector
+from mmdet.models.relation_heads import ExportableRelationHead, flatten_det_result
+from mmdet.models.relation_heads.approaches import Result
+from mmdet.ops import RoIAlign, RoIPool
+
+INPUT_NAMES = ['rois', 'labels', 'dists', 'rel_pair_idx', 'img_shapes']
+OUTPUT_NAMES = ['refine_scores', 'rel_scores']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export the relation head of a SGG model')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('--out', required=True, help='output file name, without extension')
+    parser.add_argument('--shape', type=int, nargs=2, default=[592, 800], help='(h, w) of the input images')
+    parser.add_argument('--num-objs', type=int, nargs='+', default=[10, 6],
+                        help='number of objects of each image of the example inputs')
+    parser.add_argument('--max-objs', type=int, default=None,
+                        help='max objects per image (MotifHead), default: test_cfg.rcnn.max_per_img')
+    parser.add_argument('--opset', type=int, default=11, help='ONNX opset version')
+    parser.add_argument('--no-onnx', action='store_true', help='only export to TorchScript')
+    parser.add_argument('--atol', type=float, default=1e-4, help='tolerance of the verification')
+    return parser.parse_args()
+
+
+def make_inputs(model, shape, num_objs, seed=0):
+    """Random inputs of the wrapper: the features of random images, random boxes and labels,
+    and the test pairs of the head. Also returns the refine_scores and rel_scores of the test
+    forward of the head on the same inputs, concatenated over the images as in the wrapper."""
+    rng = np.random.RandomState(seed)
+    h, w = shape
+    num_classes = model.relation_head.num_classes
+    img = torch.from_numpy(rng.randn(len(num_objs), 3, h, w).astype(np.float32))
+    with torch.no_grad():
+        feats = model.extract_feat(img)
+    bboxes, labels, dists, rel_pair_idxes = [], [], [], []
+    for n in num_objs:
+        xy = rng.rand(n, 2) * [w * 0.7, h * 0.7]
+        wh = rng.rand(n, 2) * [w * 0.3, h * 0.3] + 8
+        bboxes.append(torch.from_numpy(np.hstack((xy, xy + wh)).astype(np.float32)))
+        labels.append(torch.from_numpy(rng.randint(1, num_classes, n)))
+        dist = torch.softmax(torch.from_numpy(rng.randn(n, num_classes).astype(np.float32)), -1)
+        dist[:, 0] = 0
+        dists.append(dist)
+    img_meta = [dict(img_shape=(h, w, 3)) for _ in num_objs]
+    # the head chooses the pairs (e.g., only the overlapping ones with test_overlap)
+    head_result = Result(bboxes=[b.clone() for b in bboxes], labels=labels, dists=dists,
+                         img_shape=[meta['img_shape'] for meta in img_meta])
+    with torch.no_grad():
+        head_result = model.relation_head(feats, img_meta, head_result, is_testing=True)
+    expected = (torch.cat(head_result.refine_scores), torch.cat(head_result.rel_scores))
+    det_result = Result(bboxes=bboxes, labels=labels, dists=dists, rel_pair_idxes=head_result.rel_pair_idxes)
+    return (tuple(feats), ) + flatten_det_result(det_result, img_meta), expected
+
+
+def check(name, outputs, expected, atol):
+    for output_name, output, target in zip(OUTPUT_NAMES, outputs, expected):
+        output = output.numpy() if isinstance(output, torch.Tensor) else output
+        target = target.numpy()
+        if output.shape != target.shape:
+            raise RuntimeError('{} {}: shape {} != {}'.format(name, output_name, output.shape, target.shape))
+        diff = float(np.abs(output - target).max()) if output.size else 0.
+        print('{} {}: max abs diff {:.2e}'.format(name, output_name, diff))
+        if diff > atol:
+            raise RuntimeError('{} {} differs from the test output of the head'.format(name, output_name))
+
+
+def main():
+    args = parse_args()
+    cfg = mmcv.Config.fromfile(args.config)
+    cfg.model.pretrained = None
+
+    model = build_detector(cfg.model, train_cfg=None, test_cfg=cfg.test_cfg)
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model.cpu().eval()
+    # Customized ops are not supported, use torchvision ops instead.
+    for m in model.modules():
+        if isinstance(m, (RoIAlign, RoIPool)):
+            m.use_torchvision = True
+
+    max_objs = args.max_objs
+    if max_objs is None:
+        max_objs = cfg.test_cfg.get('rcnn', {}).get('max_per_img', 80)
+    if max(args.num_objs) > max_objs:
+        raise ValueError('--num-objs must be at most {} (--max-objs)'.format(max_objs))
+    wrapper = ExportableRelationHead(model.relation_head, max_objs=max_objs).eval()
+
+    inputs, _ = make_inputs(model, args.shape, args.num_objs)
+    # other numbers of images, objects and pairs for the verification
+    check_inputs, expected = make_inputs(model, args.shape, args.num_objs[::-1] + [max(args.num_objs[0] // 2, 1)],
+                                         seed=1)
+    with torch.no_grad():
+        check('eager wrapper', wrapper(*check_inputs), expected, args.atol)
+
+        traced = torch.jit.trace(wrapper, inputs, check_trace=False)
+        traced.save(args.out + '.pt')
+        print('saving TorchScript model in {}.pt'.format(args.out))
+        check('TorchScript', traced(*check_inputs), expected, args.atol)
+
+    if args.no_onnx:
+        return
+    feat_names = ['feat{}'.format(i) for i in range(len(inputs[0]))]
+    dynamic_axes = {name: {0: 'num_imgs', 2: name + '_h', 3: name + '_w'} for name in feat_names}
+    dynamic_axes.update(rois={0: 'num_objs'}, labels={0: 'num_objs'}, dists={0: 'num_objs'},
+                        rel_pair_idx={0: 'num_rels'}, img_shapes={0: 'num_imgs'},
+                        refine_scores={0: 'num_objs'}, rel_scores={0: 'num_rels'})
+    with torch.no_grad():
+        torch.onnx.export(wrapper, inputs, args.out + '.onnx', opset_version=args.opset,
+                          input_names=feat_names + INPUT_NAMES, output_names=OUTPUT_NAMES,
+                          dynamic_axes=dynamic_axes)
+    print('saving ONNX model in {}.onnx'.format(args.out))
+
+    try:
+        import onnxruntime
+    except ImportError:
+        print('onnxruntime is not installed, the ONNX model is not verified')
+        return
+    session = onnxruntime.InferenceSession(args.out + '.onnx')
+    # the unused inputs (e.g., the dists in predcls) are removed from the graph
+    used = set(i.name for i in session.get_inputs())
+    feeds = dict(zip(feat_names + INPUT_NAMES, list(check_inputs[0]) + list(check_inputs[1:])))
+    feeds = {name: value.numpy() for name, value in feeds.items() if name in used}
+    check('ONNX', session.run(None, feeds), expected, args.atol)
+
+
+if __name__ == '__main__':
+    main()
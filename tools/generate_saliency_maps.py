@@ -0,0 +1,182 @@
+"""Generate the saliency maps of a large image set (e.g., all of Visual Genome) for the VG-KR loaders.
+
+Unlike infer_saliency.py (one image per forward, CRF and PNG writing on the main thread), the
+stages overlap: the images are decoded by the data loader workers, the model runs on batches,
+the optional CRF refinement runs in a process pool, and the maps are written by a pool of
+threads. The maps are stored in a chunked HDF5 file (see SaliencyMapWriter), one row per
+image in the order of the image list, which is the order of load_image_infos when --image-file
+is given.
+
+    python tools/generate_saliency_maps.py configs/saliency/SOC_R3Net.py R3NET.pth \\
+        --img-dir data/visualgenome/Images --image-file data/visualgenome/image_data.json \\
+        --out data/visualgenome/saliency_1024.h5 --batch-size 8 --crf --crf-workers 16
+"""
+import argparse
+import multiprocessing
+import threading
+
+import mmcv
+import numpy as np
+import torch
+from mmcv.runner import load_checkpoint
+from torch.utils.data import DataLoader, Dataset
+
+from mmdet.core import wrap_fp16_model
+from mmdet.datasets.pipelines import Compose
+from mmdet.datasets.saliency import SaliencyMapWriter
+from mmdet.datasets.visualgenome import BOX_SCALE, load_image_infos
+from mmdet.models import build_saliency_detector
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate the saliency maps of an image set')
+    parser.add_argument('config', help='saliency detector config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('--img-dir', required=True, help='root of the images')
+    parser.add_argument('--image-file', help='VG image_data.json, the images and their order')
+    parser.add_argument('--name-file', help='list of image filenames relative to --img-dir, one per line')
+    parser.add_argument('--out', help='output HDF5 file')
+    parser.add_argument('--png-dir', help='also save the maps as PNG files in this directory')
+    parser.add_argument('--resume', action='store_true', help='skip the images already in --out')
+    parser.add_argument('--map-size', type=int, default=BOX_SCALE, help='longest side of the maps in the HDF5')
+    parser.add_argument('--compression', default='lzf', help='HDF5 compression filter, "none" to disable')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4, help='data loader workers')
+    parser.add_argument('--crf', action='store_true', help='refine the maps with a dense CRF')
+    parser.add_argument('--crf-workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--writer-threads', type=int, default=4)
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+    if args.out is None and args.png_dir is None:
+        parser.error('at least one of --out and --png-dir is required')
+    return args
+
+
+class ImageListDataset(Dataset):
+    """The test pipeline of the saliency config on a list of images, indexed by their row."""
+
+    def __init__(self, img_dir, filenames, pipeline):
+        self.img_dir = img_dir
+        self.filenames = filenames
+        self.pipeline = Compose(pipeline)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, idx):
+        return idx, self.pipeline(dict(img_info=dict(filename=self.filenames[idx]), img_prefix=self.img_dir))
+
+
+def collate_padded(batch):
+    """Stack the images of a batch, zero-padded (i.e., the mean color) to the largest one."""
+    indices = [idx for idx, _ in batch]
+    imgs = [data['img'][0] for _, data in batch]
+    metas = [data['img_meta'][0].data for _, data in batch]
+    h = max(img.shape[1] for img in imgs)
+    w = max(img.shape[2] for img in imgs)
+    padded = imgs[0].new_zeros((len(imgs), imgs[0].shape[0], h, w))
+    for i, img in enumerate(imgs):
+        padded[i, :, :img.shape[1], :img.shape[2]] = img
+    return indices, padded, metas
+
+
+def size_sorted_batches(indices, sizes, batch_size):
+    """Batches of images of similar sizes, so that the padding (and its effect on the maps at the
+    borders) is minimal. The maps are written by index, the order of the batches does not matter."""
+    indices = sorted(indices, key=lambda i: (sizes[i][0], sizes[i][1]))
+    return [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+
+
+def main():
+    args = parse_args()
+    # the CRF processes are forked first: before the threads and the HDF5 file of the writer, the
+    # data loader workers, and before the model is moved to the GPU
+    crf_pool = None
+    if args.crf:
+        # pydensecrf is only needed with --crf
+        from saliency_crf import crf_worker
+        crf_pool = multiprocessing.Pool(args.crf_workers)
+    cfg = mmcv.Config.fromfile(args.config)
+    if cfg.get('cudnn_benchmark', False):
+        torch.backends.cudnn.benchmark = True
+
+    sizes = None
+    if args.image_file is not None:
+        _, img_infos = load_image_infos(args.img_dir, args.image_file)
+        filenames = [info['filename'] for info in img_infos]
+        sizes = [(info['height'], info['width']) for info in img_infos]
+    elif args.name_file is not None:
+        filenames = mmcv.list_from_file(args.name_file)
+    else:
+        filenames = sorted(mmcv.scandir(args.img_dir, suffix=('.jpg', '.jpeg', '.png')))
+
+    writer = SaliencyMapWriter(len(filenames), out=args.out, png_dir=args.png_dir, map_size=args.map_size,
+                               compression=args.compression, resume=args.resume, num_threads=args.writer_threads)
+    todo = sorted(set(range(len(filenames))) - writer.done_indices())
+    if sizes is not None:
+        batches = size_sorted_batches(todo, sizes, args.batch_size)
+    else:
+        batches = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    dataset = ImageListDataset(args.img_dir, filenames, cfg.data.test.pipeline)
+    data_loader = DataLoader(dataset, batch_sampler=batches, num_workers=args.workers, collate_fn=collate_padded,
+                             pin_memory=args.device.startswith('cuda'))
+
+    # bound the maps queued in the CRF pool
+    crf_slots = threading.BoundedSemaphore(args.crf_workers * 4)
+    crf_errors = []
+
+    cfg.model.pretrained = None
+    model = build_saliency_detector(cfg.model)
+    if cfg.get('fp16', None) is not None:
+        wrap_fp16_model(model)
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model = model.to(args.device).eval()
+
+    print('{} images, {} to infer'.format(len(filenames), len(todo)))
+    prog_bar = mmcv.ProgressBar(len(todo))
+    try:
+        for indices, imgs, metas in data_loader:
+            with torch.no_grad():
+                sal_maps = model([imgs.to(args.device, non_blocking=True)], [metas], return_loss=False)
+                # to uint8 as transforms.ToPILImage does, before the copy to the host
+                sal_maps = sal_maps[:, 0].mul(255).byte().cpu().numpy()
+            for idx, sal_map, meta in zip(indices, sal_maps, metas):
+                h, w = meta['img_shape'][:2]
+                sal_map = np.ascontiguousarray(sal_map[:h, :w])
+                ori_h, ori_w = meta['ori_shape'][:2]
+                if (h, w) != (ori_h, ori_w):
+                    sal_map = mmcv.imresize(sal_map, (ori_w, ori_h))
+                if crf_pool is None:
+                    writer.put(idx, filenames[idx], sal_map)
+                    continue
+                if crf_errors:
+                    raise RuntimeError('The CRF refinement failed: {}'.format(crf_errors[0]))
+                crf_slots.acquire()
+
+                def done(refined, idx=idx):
+                    crf_slots.release()
+                    try:
+                        writer.put(idx, filenames[idx], refined)
+                    except Exception as e:
+                        crf_errors.append(repr(e))
+
+                def failed(e):
+                    crf_slots.release()
+                    crf_errors.append(repr(e))
+
+                crf_pool.apply_async(crf_worker, (meta['filename'], sal_map), callback=done, error_callback=failed)
+            for _ in indices:
+                prog_bar.update()
+        if crf_pool is not None:
+            crf_pool.close()
+            crf_pool.join()
+            if crf_errors:
+                raise RuntimeError('The CRF refinement failed: {}'.format(crf_errors[0]))
+    finally:
+        if crf_pool is not None:
+            crf_pool.terminate()
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
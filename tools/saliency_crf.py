@@ -0,0 +1,55 @@
+"""Dense CRF refinement of the saliency maps.
+
+Kept apart from the inference tools, so that the CRF processes of
+generate_saliency_maps.py only need numpy, PIL and pydensecrf.
+"""
+import numpy as np
+import pydensecrf.densecrf as dcrf
+from PIL import Image
+
+
+# codes of this function are borrowed from https://github.com/Andrew-Qibin/dss_crf
+def crf_refine(img, annos):
+    def _sigmoid(x):
+        return 1 / (1 + np.exp(-x))
+
+    assert img.dtype == np.uint8
+    assert annos.dtype == np.uint8
+    assert img.shape[:2] == annos.shape
+
+    # img and annos should be np array with data type uint8
+
+    EPSILON = 1e-8
+
+    M = 2  # salient or not
+    tau = 1.05
+    # Setup the CRF model
+    d = dcrf.DenseCRF2D(img.shape[1], img.shape[0], M)
+
+    anno_norm = annos / 255.
+
+    n_energy = -np.log((1.0 - anno_norm + EPSILON)) / (tau * _sigmoid(1 - anno_norm))
+    p_energy = -np.log(anno_norm + EPSILON) / (tau * _sigmoid(anno_norm))
+
+    U = np.zeros((M, img.shape[0] * img.shape[1]), dtype='float32')
+    U[0, :] = n_energy.flatten()
+    U[1, :] = p_energy.flatten()
+
+    d.setUnaryEnergy(U)
+
+    d.addPairwiseGaussian(sxy=3, compat=3)
+    d.addPairwiseBilateral(sxy=60, srgb=5, rgbim=img, compat=5)
+
+    # Do the inference
+    infer = np.array(d.inference(1)).astype('float32')
+    res = infer[1, :]
+
+    res = res * 255
+    res = res.reshape(img.shape[:2])
+    return res.astype('uint8')
+
+
+def crf_worker(filename, sal_map):
+    """Refine the map of an image file, in a process of the CRF pool."""
+    img = np.array(Image.open(filename).convert('RGB'))
+    return crf_refine(img, sal_map)
@@ -0,0 +1,117 @@
+"""Build the incremental 3D scene graph of an RGB-D sequence with the streaming runner.
+
+The frames are decoded and filtered (keyframes) by worker processes, the keyframes are
+fed to the SGG model in batches, and the global 3D scene graph is fused and rendered by
+a separate consumer. The throughput of every stage is reported at the end.
+
+    # a ScanNet-style sequence: color/, depth/, intrinsic/, pose/
+    python tools/stream_3d_scene_graph.py CONFIG --checkpoint CKPT --data-root data/scene0000_00
+    # the pipeline alone, on CPU, with a synthetic sequence and without model
+    python tools/stream_3d_scene_graph.py --synthetic 200 --dry-run
+"""
+import argparse
+import json
+import os.path as osp
+
+import mmcv
+import torch
+
+from mmdet.apis import init_detector
+from mmdet.datasets import DemoDataset
+from mmdet.demos import KeyFrameChecker, SceneGraphHandler
+from mmdet.demos.stream_runner import (DemoFrameLoader, KeyFrameFilter, SceneGraphFusion, SceneGraphInference,
+                                       StreamingSceneGraphRunner, SyntheticRGBDSequence)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Streaming 3D scene graph generation')
+    parser.add_argument('config', nargs='?', help='SGG config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--data-root', help='root of the sequence')
+    parser.add_argument('--img-prefix', default='color')
+    parser.add_argument('--depth-prefix', default='depth')
+    parser.add_argument('--intrinsic-prefix', default='intrinsic')
+    parser.add_argument('--pose-prefix', default='pose')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use a synthetic sequence of this number of frames instead of --data-root')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='skip the model and the fusion, only measure the decoding and keyframe stages')
+    parser.add_argument('--workers', type=int, default=2, help='decoding processes')
+    parser.add_argument('--queue-size', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=4, help='max keyframes per inference batch')
+    parser.add_argument('--batch-timeout', type=float, default=0.05)
+    # keyframe checker
+    parser.add_argument('--disable-keyframe', action='store_true')
+    parser.add_argument('--alpha', type=float, default=0.9, help='smoothing of the average blurryness')
+    parser.add_argument('--gain', type=float, default=1.0)
+    parser.add_argument('--offset', type=float, default=0.0)
+    parser.add_argument('--thresh-key', type=float, default=0.2)
+    parser.add_argument('--thresh-anchor', type=float, default=0.68)
+    parser.add_argument('--max-group-len', type=int, default=10)
+    # scene graph handler
+    parser.add_argument('--detect-cnt-thres', type=int, default=2)
+    parser.add_argument('--disable-samenode', action='store_true')
+    parser.add_argument('--match-radius', type=float, default=None,
+                        help='only match the nodes within this distance (depth unit) on every axis')
+    parser.add_argument('--format', default='png')
+    parser.add_argument('--plot-graph', action='store_true')
+    parser.add_argument('--out-dir', default='work_dirs/stream_3d_sg')
+    parser.add_argument('--out', help='output json report of the stages')
+    args = parser.parse_args()
+    if not args.dry_run and args.config is None:
+        parser.error('a config is required unless --dry-run')
+    if not args.synthetic and args.data_root is None:
+        parser.error('--data-root is required unless --synthetic')
+    return args
+
+
+def main():
+    args = parse_args()
+    model = None if args.dry_run else init_detector(args.config, args.checkpoint, device=args.device)
+
+    if args.synthetic:
+        load_frame = SyntheticRGBDSequence(num_frames=args.synthetic)
+        intrinsic_depth = load_frame.intrinsic
+        frame_ids = range(len(load_frame))
+    else:
+        dataset = DemoDataset(model.cfg.data.test.pipeline if model is not None else [],
+                              data_root=args.data_root, img_prefix=args.img_prefix,
+                              depth_prefix=args.depth_prefix, intrinsic_prefix=args.intrinsic_prefix,
+                              pose_prefix=args.pose_prefix)
+        load_frame = DemoFrameLoader(dataset)
+        intrinsic_depth = dataset.intrinsic_depth
+        frame_ids = range(len(dataset))
+
+    check_frame = KeyFrameFilter(KeyFrameChecker(args, intrinsic_depth=intrinsic_depth))
+    if args.dry_run:
+        infer = lambda frames: [None] * len(frames)  # noqa: E731
+        fuse = lambda frame, result: None  # noqa: E731
+    else:
+        for name in ['sg', 'frame', 'det']:
+            setattr(args, 'save_path_' + name, osp.join(args.out_dir, name))
+            mmcv.mkdir_or_exist(getattr(args, 'save_path_' + name))
+        head = model.relation_head
+        infer = SceneGraphInference(model)
+        fuse = SceneGraphFusion(SceneGraphHandler(args, head.obj_classes, head.rel_classes))
+
+    runner = StreamingSceneGraphRunner(load_frame, check_frame, infer, fuse, num_workers=args.workers,
+                                       queue_size=args.queue_size, batch_size=args.batch_size,
+                                       batch_timeout=args.batch_timeout)
+    summary = runner.run(frame_ids)
+
+    print('{} frames, {} keyframes in {:.2f} s'.format(summary['num_frames'], summary['num_keyframes'],
+                                                       summary['wall_time']))
+    for name in ['decode', 'keyframe', 'inference', 'fusion']:
+        stage = summary[name]
+        print('{:10s} {:6d} items  busy {:8.2f} s  {:>8s} items/s/worker  {:>8s} items/s'.format(
+            name, stage['count'], stage['busy'],
+            '-' if stage['rate'] is None else '{:.2f}'.format(stage['rate']),
+            '-' if stage['throughput'] is None else '{:.2f}'.format(stage['throughput'])))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
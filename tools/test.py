@@ -136,9 +136,10 @@ def main():
        our_zs = dataset.all_triplets[np.where(intersect_2d(dataset.all_triplets, train_dataset.all_triplets).sum(-1) == 0)[0]]
        match_idxes = np.where(intersect_2d(our_zs, zs_triplets).sum(-1) > 0)[0]  # 5971, all match
        """
+    # the relation test supports several images per gpu; the visualization shows one image at a time
     data_loader = build_dataloader(
         dataset,
-        imgs_per_gpu=1,
+        imgs_per_gpu=1 if args.show else cfg.data.get('test_imgs_per_gpu', 1),
         workers_per_gpu=cfg.data.workers_per_gpu,
         dist=distributed,
         shuffle=False)